@@ -4,12 +4,15 @@ import json
 import base64
 import hashlib
 import logging
+import tempfile
 import traceback
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 import cbor2
-import pyzipper
 
+from lib import zip_util
+from lib import stream_util
 from lib import crypto_util
 from lib import mail_sender
 from lib import pdf_tool_util
@@ -19,11 +22,18 @@ from lib.costant_data import JobNameList
 from lib.err_code_util import ErrCodeList
 from functions.fn_base_handler import BaseFunctionHandler
 
+# encrypted results larger than this are kept in a temporary file
+ENCRYPTED_RESULT_SPOOL_SIZE = 1024 * 1024
+
+# max number of final mails sent at the same time
+MAIL_FANOUT_WORKER_COUNT = 4
+
 
 class AttachESigHandler(BaseFunctionHandler):
     def __init__(self, job_data):
         BaseFunctionHandler.__init__(
             self, job_data, params_checker.attach_esig_data_schema)
+        self.zip_entry_list = None
 
     def do_job_internal(self):
         ret_code = ErrCodeList.UNDEFINED_ERROR.value
@@ -138,31 +148,59 @@ class AttachESigHandler(BaseFunctionHandler):
         try:
             summary_data = json.loads(base64.b64decode(results[1]["data"]))
 
-            # generate spf file
-            spf_file_bytes = self.__gen_spf_file(
-                summary_data, attest_document_b64)
-
             # prepare zip file
             file_name_without_extension = os.path.splitext(
                 self.task_config["fileName"])[0]
-            zip_file_bytes = self.__gen_zip_file(file_name_without_extension, self.job_data["taskPassword"] if self.job_data[
-                                                 "taskPayload"]["publicTaskInfo"]["domainSetting"]["enhancedPrivacy"] else None, results[0]["data"], spf_file_bytes)
+            zip_file_bytes = self.__gen_zip_file(self.__get_zip_entry_list(results, attest_document_b64), self.job_data["taskPassword"] if self.job_data[
+                                                 "taskPayload"]["publicTaskInfo"]["domainSetting"]["enhancedPrivacy"] else None)
 
             if len(summary_data["signerList"]) == 1:
                 file_name_without_extension = f"{file_name_without_extension} ({summary_data['signerList'][0]['emailAddr']})"
 
+            mail_sender_obj = mail_sender.MailSender(self.email_config)
+            zip_attachment_info = mail_sender_obj.prepare_attachment(
+                f"{file_name_without_extension}.zip", zip_file_bytes, "application/zip")
+            mail_task_list = []
+
             # send to notificant
             if len(self.task_config["notificantEmail"]) > 0:
-                mail_sender_obj = mail_sender.MailSender(self.email_config)
-                mail_sender_obj.send_notificant_final_mail(self.task_config["notificantLocale"], self.task_config["notificantEmail"], self.job_data[
-                                                           "taskID"], self.task_config["fileName"], summary_data["signerList"], f"{file_name_without_extension}.zip", zip_file_bytes)
+                mail_task_list.append(("notificant", mail_sender_obj.send_notificant_final_mail, [self.task_config["notificantLocale"], self.task_config["notificantEmail"], self.job_data[
+                                      "taskID"], self.task_config["fileName"], summary_data["signerList"], zip_attachment_info]))
 
             # send to signers
-            for signerIdx, signer in enumerate(summary_data["signerList"]):
-                signer_locale = self.task_config["signerInfoList"][signerIdx]["locale"]
-                mail_sender_obj = mail_sender.MailSender(self.email_config)
-                mail_sender_obj.send_signer_final_mail(
-                    signer_locale, signer["emailAddr"], self.job_data["taskID"], f"{file_name_without_extension}.zip", zip_file_bytes)
+            if mail_sender_obj.is_batch_supported():
+                # signers of the same locale get the same mail, send it in one request
+                signer_email_dict = {}
+                for signerIdx, signer in enumerate(summary_data["signerList"]):
+                    signer_locale = self.task_config["signerInfoList"][signerIdx]["locale"]
+                    signer_email_dict.setdefault(
+                        signer_locale, []).append((f"signer {signerIdx}", signer["emailAddr"]))
+
+                # a batch reports the result of each signer, see the loop below
+                for signer_locale, signer_email_list in signer_email_dict.items():
+                    mail_task_list.append(([recipient for recipient, _ in signer_email_list], mail_sender_obj.send_signer_final_mail_batch, [
+                                          signer_locale, [signer_email for _, signer_email in signer_email_list], self.job_data["taskID"], zip_attachment_info]))
+            else:
+                for signerIdx, signer in enumerate(summary_data["signerList"]):
+                    signer_locale = self.task_config["signerInfoList"][signerIdx]["locale"]
+                    mail_task_list.append((f"signer {signerIdx}", mail_sender_obj.send_signer_final_mail, [
+                                          signer_locale, signer["emailAddr"], self.job_data["taskID"], zip_attachment_info]))
+
+            # send mails concurrently, a failed mail does not affect the others
+            with ThreadPoolExecutor(max_workers=MAIL_FANOUT_WORKER_COUNT) as executor:
+                future_list = [(recipient, executor.submit(send_fn, *send_args))
+                               for recipient, send_fn, send_args in mail_task_list]
+
+            for task_recipient, future in future_list:
+                if isinstance(task_recipient, list):
+                    recipient_ret_code_list = zip(task_recipient, future.result())
+                else:
+                    recipient_ret_code_list = [(task_recipient, future.result())]
+
+                for recipient, mail_ret_code in recipient_ret_code_list:
+                    if mail_ret_code != ErrCodeList.SUCCES.value:
+                        logging.error(
+                            f"failed to send final mail to {recipient}: {mail_ret_code}")
 
             return True
         except BaseException as e:
@@ -170,30 +208,37 @@ class AttachESigHandler(BaseFunctionHandler):
 
         return False
 
+    # returns a file object positioned at the start of the base64 encrypted result
+    # (or None on failure), the caller owns the file and must close it
     def encrypt_result(self, results, attest_document_b64):
+        encrypted_result_file = None
+
         try:
             iv_bytes = crypto_util.gen_random_bytes(16)
-            summary_data = json.loads(base64.b64decode(results[1]["data"]))
+            encrypted_result_file = tempfile.SpooledTemporaryFile(
+                max_size=ENCRYPTED_RESULT_SPOOL_SIZE)
 
-            # generate spf file
-            spf_file_bytes = self.__gen_spf_file(
-                summary_data, attest_document_b64)
+            # stream zip file through encryption and base64 encoding into the result file
+            b64_writer = stream_util.Base64EncodeWriter(encrypted_result_file)
+            b64_writer.write(iv_bytes)
 
-            # prepare zip file
-            file_name_without_extension = os.path.splitext(
-                self.task_config["fileName"])[0]
-            zip_file_bytes = self.__gen_zip_file(
-                file_name_without_extension, None, results[0]["data"], spf_file_bytes)
+            aes_writer = crypto_util.AesCbcEncryptWriter(base64.b64decode(
+                self.binding_data["accessKey"]), iv_bytes, b64_writer)
+            zip_util.write_zip(aes_writer, self.__get_zip_entry_list(
+                results, attest_document_b64))
 
-            # encrypt zip file
-            encrypted_zip_bytes = crypto_util.aes_cbc_encrypt_data(
-                base64.b64decode(self.binding_data["accessKey"]), iv_bytes, zip_file_bytes)
+            aes_writer.finalize()
+            b64_writer.finalize()
+            encrypted_result_file.seek(0)
 
-            if encrypted_zip_bytes is not None:
-                return base64.b64encode(b"".join([iv_bytes, encrypted_zip_bytes])).decode("utf-8")
+            return encrypted_result_file
         except BaseException as e:
             logging.error(traceback.format_exc())
 
+            # a partly written result file is not handed over, release it here
+            if encrypted_result_file is not None:
+                encrypted_result_file.close()
+
         return None
 
     def __gen_spf_file(self, summary_b64, attest_doc_b64):
@@ -202,15 +247,31 @@ class AttachESigHandler(BaseFunctionHandler):
             "attestDoc": attest_doc_b64
         }, ensure_ascii=False, separators=(',', ':')).encode("utf-8")
 
-    def __gen_zip_file(self, file_name, password, pdf_b64, spf_file_bytes):
-        zip_buffer = io.BytesIO()
+    def __get_zip_entry_list(self, results, attest_document_b64):
+        # compress entries once for both the mailed and the encrypted zip file
+        if self.zip_entry_list is None:
+            summary_data = json.loads(base64.b64decode(results[1]["data"]))
 
-        with pyzipper.AESZipFile(zip_buffer, 'w', compression=pyzipper.ZIP_DEFLATED) as zip_file:
-            if password:
-                zip_file.setpassword(password.encode("utf-8"))
-                zip_file.setencryption(pyzipper.WZ_AES, nbits=256)
+            # generate spf file
+            spf_file_bytes = self.__gen_spf_file(
+                summary_data, attest_document_b64)
+
+            file_name_without_extension = os.path.splitext(
+                self.task_config["fileName"])[0]
+
+            self.zip_entry_list = [
+                zip_util.compress_entry(
+                    f"{file_name_without_extension}.pdf", base64.b64decode(results[0]["data"])),
+                zip_util.compress_entry(
+                    f"{file_name_without_extension}.spf", spf_file_bytes)
+            ]
+
+        return self.zip_entry_list
+
+    def __gen_zip_file(self, zip_entry_list, password):
+        zip_buffer = io.BytesIO()
 
-            zip_file.writestr(f"{file_name}.pdf", base64.b64decode(pdf_b64))
-            zip_file.writestr(f"{file_name}.spf", spf_file_bytes)
+        zip_util.write_zip(zip_buffer, zip_entry_list,
+                           password.encode("utf-8") if password else None)
 
         return zip_buffer.getvalue()
@@ -1,9 +1,8 @@
 import abc
-import json
-import hashlib
 import logging
 import traceback
 
+from lib import json_hash_util
 from lib import params_checker
 from lib import encryption_util
 from lib.err_code_util import ErrCodeList
@@ -29,8 +28,8 @@ class BaseFunctionHandler(metaclass=abc.ABCMeta):
             # check job data
             if params_checker.verify_param_with_schema(self.job_data, self.job_param_schema):
                 ret_code = ErrCodeList.SUCCES.value
-                self.payload_hash = hashlib.sha256(json.dumps(
-                    self.job_data["taskPayload"], ensure_ascii=False, separators=(',', ':')).encode("utf-8")).hexdigest()
+                self.payload_hash = json_hash_util.gen_canonical_hash(
+                    self.job_data["taskPayload"])
 
                 logging.debug("pass job parameter verification")
                 logging.debug(f"payload hash: {self.payload_hash}")
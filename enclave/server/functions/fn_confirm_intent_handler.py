@@ -6,21 +6,17 @@ import traceback
 
 import cbor2
 import twilio
-from twilio.rest import TwilioHttpClient, Client
 
 from lib import mail_sender
+from lib import mail_outbox_util
 from lib import params_checker
+from lib import twilio_pool_util
 from lib import attest_doc_util
 from lib.costant_data import JobNameList
 from lib.err_code_util import ErrCodeList
 from functions.fn_base_handler import BaseFunctionHandler
 
 
-class CustomTwilioHttpClient(TwilioHttpClient):
-    def __init__(self):
-        TwilioHttpClient.__init__(self, timeout=5)
-
-
 class ConfirmIntentHandler(BaseFunctionHandler):
     def __init__(self, job_data):
         BaseFunctionHandler.__init__(
@@ -91,8 +87,10 @@ class ConfirmIntentHandler(BaseFunctionHandler):
                         }]
                         mail_sender_obj = mail_sender.MailSender(
                             self.email_config)
-                        mail_sender_obj.send_notificant_signed_event_mail(
-                            self.task_config["notificantLocale"], self.task_config["notificantEmail"], self.job_data["taskID"], self.task_config["fileName"], signer_list)
+
+                        # the mail does not affect POI, send it in background
+                        mail_outbox_util.put_mail("signed event mail to notificant", mail_sender_obj.send_notificant_signed_event_mail, [
+                                                  self.task_config["notificantLocale"], self.task_config["notificantEmail"], self.job_data["taskID"], self.task_config["fileName"], signer_list], mail_sender_obj.is_last_error_retryable)
         except BaseException as e:
             logging.error(traceback.format_exc())
             ret_code = ErrCodeList.UNDEFINED_ERROR.value
@@ -101,9 +99,7 @@ class ConfirmIntentHandler(BaseFunctionHandler):
 
     def __check_signer_phone(self, twilio_config, verification_sid, phone_number, pin_code):
         try:
-            custom_client = CustomTwilioHttpClient()
-            client = Client(
-                twilio_config["apiSID"], twilio_config["apiSecret"], http_client=custom_client)
+            client = twilio_pool_util.get_client(twilio_config)
 
             verification_result = client.verify.services(twilio_config["serviceSID"]).verification_checks.create(
                 verification_sid=verification_sid, code=pin_code)
@@ -121,22 +117,28 @@ class ConfirmIntentHandler(BaseFunctionHandler):
 
     def __send_verificatoin_sms(self, twilio_config, phone_number):
         try:
-            custom_client = CustomTwilioHttpClient()
-            client = Client(
-                twilio_config["apiSID"], twilio_config["apiSecret"], http_client=custom_client)
+            client = twilio_pool_util.get_client(twilio_config)
 
-            service = client.verify.services(
-                twilio_config["serviceSID"]).fetch()
+            # check the service setting only if it is not checked recently
+            if not twilio_pool_util.is_service_checked(twilio_config):
+                service = client.verify.services(
+                    twilio_config["serviceSID"]).fetch()
 
-            if service.friendly_name == "Let's eSign" and service.code_length == 6:
-                verification_result = client.verify.services(
-                    twilio_config["serviceSID"]).verifications.create(to=phone_number, channel="sms")
+                if service.friendly_name != "Let's eSign" or service.code_length != 6:
+                    return ErrCodeList.INVALID_TWILIO_SETTING.value, None
 
-                return ErrCodeList.SUCCES.value, verification_result.sid
-            else:
-                return ErrCodeList.INVALID_TWILIO_SETTING.value, None
+                twilio_pool_util.set_service_checked(twilio_config, True)
+
+            verification_result = client.verify.services(
+                twilio_config["serviceSID"]).verifications.create(to=phone_number, channel="sms")
+
+            return ErrCodeList.SUCCES.value, verification_result.sid
         except twilio.base.exceptions.TwilioRestException as e:
             logging.error(traceback.format_exc())
+
+            # the service may be deleted or changed, check it again next time
+            twilio_pool_util.set_service_checked(twilio_config, False)
+
             if e.code == 20003 or e.code == 20404:
                 return ErrCodeList.INVALID_TWILIO_CREDENTAIL.value, None
         except BaseException as e:
@@ -8,9 +8,11 @@ import phonenumbers
 
 from lib import crypto_util
 from lib import mail_sender
+from lib import mail_outbox_util
 from lib import pdf_tool_util
 from lib import mail_link_util
 from lib import params_checker
+from lib import template_cache_util
 from lib.err_code_util import ErrCodeList
 from functions.fn_base_handler import BaseFunctionHandler
 
@@ -18,29 +20,68 @@ EOF_MARKER = "%%EOF"
 
 
 class SendReqHandler(BaseFunctionHandler):
-    def __init__(self, job_data):
+    def __init__(self, job_data, is_batch=False):
         BaseFunctionHandler.__init__(
-            self, job_data, params_checker.send_req_job_schema)
+            self, job_data, params_checker.send_req_batch_job_schema if is_batch else params_checker.send_req_job_schema)
+        self.is_batch = is_batch
 
     def do_job_internal(self):
         ret_code = ErrCodeList.UNDEFINED_ERROR.value
-        results = []
+        signer_result_list = []
 
         try:
-            logging.debug(f"signer index: {self.job_data['signerIdx']}")
+            if self.is_batch:
+                sub_task_list = self.job_data["subTaskList"]
+            else:
+                sub_task_list = [{"subTaskID": self.job_data["subTaskID"],
+                                  "signerIdx": self.job_data["signerIdx"]}]
+
+            # each signer can only be requested once in a batch, the index is checked
+            # for int here as json schema "integer" also accepts 1.0
+            signer_idx_list = [sub_task["signerIdx"] for sub_task in sub_task_list]
+            if any(type(signer_idx) is not int for signer_idx in signer_idx_list):
+                logging.error("invalid signer index")
+                ret_code = ErrCodeList.INVALID_SIGNER_INDEX.value
+            elif len(set(signer_idx_list)) != len(signer_idx_list):
+                logging.error("duplicate signer index")
+                ret_code = ErrCodeList.INVALID_SIGNER_INDEX.value
+            else:
+                # check task once for all signers
+                ret_code = self.__check_task()
+
+            # generate preview, POR and confirm mail for each signer
+            for sub_task in sub_task_list:
+                signer_ret_code, signer_results = self.__process_signer(
+                    ret_code, sub_task["subTaskID"], sub_task["signerIdx"])
+
+                signer_result_list.append({
+                    "signerIdx": sub_task["signerIdx"],
+                    "code": signer_ret_code,
+                    "results": signer_results
+                })
+        except BaseException as e:
+            logging.error(traceback.format_exc())
+            ret_code = ErrCodeList.UNDEFINED_ERROR.value
+
+        # each signer result of batch job is attested individually by caller
+        if self.is_batch:
+            return ret_code, [], signer_result_list if ret_code == ErrCodeList.SUCCES.value else []
+
+        if ret_code == ErrCodeList.SUCCES.value:
+            ret_code = signer_result_list[0]["code"]
+
+        return ret_code, signer_result_list[0]["results"] if ret_code == ErrCodeList.SUCCES.value else [], None
 
+    def __check_task(self):
+        ret_code = ErrCodeList.UNDEFINED_ERROR.value
+
+        try:
             # check signerList and signerInfoList
             if len(self.job_data["taskPayload"]["publicTaskInfo"]["templateInfo"]["signerList"]) == len(self.task_config["signerInfoList"]):
                 ret_code = ErrCodeList.SUCCES.value
             else:
                 ret_code = ErrCodeList.MISMATCH_SIGNER_LIST_LENGTH.value
 
-            # check signer index
-            if ret_code == ErrCodeList.SUCCES.value:
-                if self.job_data["signerIdx"] >= len(self.task_config["signerInfoList"]):
-                    logging.error("invalid signer index")
-                    ret_code = ErrCodeList.INVALID_SIGNER_INDEX.value
-
             # check signer phone number
             if ret_code == ErrCodeList.SUCCES.value:
                 for signer_info in self.task_config["signerInfoList"]:
@@ -55,15 +96,44 @@ class SendReqHandler(BaseFunctionHandler):
                             ret_code = ErrCodeList.INVALID_PHONE_NUMBER_FORMAT.value
                             break
 
+            # reuse the verdicts of the same template checked by previous jobs
+            template_verdict = template_cache_util.get_template_verdict(
+                self.binding_data["templateDataHash"], self.binding_data["templateInfoHash"])
+
+            if template_verdict is not None:
+                logging.debug("reuse cached template verdicts")
+
             # test signed PDF
-            if ret_code == ErrCodeList.SUCCES.value:
+            if ret_code == ErrCodeList.SUCCES.value and template_verdict is None:
                 if self.__test_signed_pdf(self.template_data):
                     ret_code = ErrCodeList.SIGNED_PDF_DETECTED.value
 
             # test protected PDF
-            if ret_code == ErrCodeList.SUCCES.value:
+            if ret_code == ErrCodeList.SUCCES.value and template_verdict is None:
                 if not self.__test_pdf_modifiable(self.job_data["taskPayload"]["publicTaskInfo"]["templateInfo"]["signerList"], self.template_data):
                     ret_code = ErrCodeList.PDF_NOT_MODIFIABLE_DETECTED.value
+                else:
+                    # only passed verdicts are cached, failures may be transient
+                    template_cache_util.put_template_verdict(self.binding_data["templateDataHash"], self.binding_data["templateInfoHash"], {
+                        "signedPDF": False, "modifiable": True})
+        except BaseException as e:
+            logging.error(traceback.format_exc())
+            ret_code = ErrCodeList.UNDEFINED_ERROR.value
+
+        return ret_code
+
+    def __process_signer(self, task_ret_code, sub_task_id, signer_idx):
+        ret_code = task_ret_code
+        results = []
+
+        try:
+            logging.debug(f"signer index: {signer_idx}")
+
+            # check signer index
+            if ret_code == ErrCodeList.SUCCES.value:
+                if signer_idx >= len(self.task_config["signerInfoList"]):
+                    logging.error("invalid signer index")
+                    ret_code = ErrCodeList.INVALID_SIGNER_INDEX.value
 
             # generate preview PDF
             if ret_code == ErrCodeList.SUCCES.value:
@@ -71,15 +141,15 @@ class SendReqHandler(BaseFunctionHandler):
 
                 if self.job_data["taskPayload"]["publicTaskInfo"]["inOrder"]:
                     # preview other signatures and signing hint
-                    for signer_idx in range(self.job_data["signerIdx"] + 1):
-                        current_signer_info = self.task_config["signerInfoList"][signer_idx]
+                    for current_signer_idx in range(signer_idx + 1):
+                        current_signer_info = self.task_config["signerInfoList"][current_signer_idx]
 
                         signer_field = {
                             "emailAddr": current_signer_info["emailAddr"],
                             "name": current_signer_info["name"],
                             "locale": current_signer_info["locale"],
-                            "fieldList": self.job_data["taskPayload"]["publicTaskInfo"]["templateInfo"]["signerList"][signer_idx]["fieldList"],
-                            "signHint": True if signer_idx == self.job_data["signerIdx"] else False
+                            "fieldList": self.job_data["taskPayload"]["publicTaskInfo"]["templateInfo"]["signerList"][current_signer_idx]["fieldList"],
+                            "signHint": True if current_signer_idx == signer_idx else False
                         }
 
                         if current_signer_info.get("phoneNumber"):
@@ -88,13 +158,13 @@ class SendReqHandler(BaseFunctionHandler):
                         pdf_tool_fields.append(signer_field)
                 else:
                     # preview signing hint
-                    current_signer_info = self.task_config["signerInfoList"][self.job_data["signerIdx"]]
+                    current_signer_info = self.task_config["signerInfoList"][signer_idx]
 
                     signer_field = {
                         "emailAddr": current_signer_info["emailAddr"],
                         "name": current_signer_info["name"],
                         "locale": current_signer_info["locale"],
-                        "fieldList": self.job_data["taskPayload"]["publicTaskInfo"]["templateInfo"]["signerList"][self.job_data["signerIdx"]]["fieldList"],
+                        "fieldList": self.job_data["taskPayload"]["publicTaskInfo"]["templateInfo"]["signerList"][signer_idx]["fieldList"],
                         "signHint": True
                     }
 
@@ -115,11 +185,11 @@ class SendReqHandler(BaseFunctionHandler):
                 intent_secret = base64.b64encode(
                     crypto_util.gen_random_bytes(256)).decode("utf-8")
 
-                target_signer_info = self.task_config["signerInfoList"][self.job_data["signerIdx"]]
+                target_signer_info = self.task_config["signerInfoList"][signer_idx]
 
                 por_data = {
                     "payloadHash": self.payload_hash,
-                    "signerIdx": self.job_data["signerIdx"],
+                    "signerIdx": signer_idx,
                     "secretHash": hashlib.sha256(intent_secret.encode("utf-8")).hexdigest(),
                     "phoneRequired": True if target_signer_info.get("phoneNumber") else False
                 }
@@ -130,8 +200,8 @@ class SendReqHandler(BaseFunctionHandler):
 
             # send confirm mail
             if ret_code == ErrCodeList.SUCCES.value:
-                signer_confirm_link = mail_link_util.gen_confirm_link(self.job_data["taskPayload"]["publicTaskInfo"]["domainSetting"]["signerAppURL"], self.job_data["extraData"]["apiVersion"], self.job_data["taskID"], self.job_data[
-                                                                      "subTaskID"], self.job_data["signerIdx"], intent_secret, self.job_data["extraData"]["auxData"], target_signer_info["locale"], True if target_signer_info.get("phoneNumber") else False)
+                signer_confirm_link = mail_link_util.gen_confirm_link(self.job_data["taskPayload"]["publicTaskInfo"]["domainSetting"]["signerAppURL"], self.job_data["extraData"]["apiVersion"], self.job_data["taskID"],
+                                                                      sub_task_id, signer_idx, intent_secret, self.job_data["extraData"]["auxData"], target_signer_info["locale"], True if target_signer_info.get("phoneNumber") else False)
 
                 mail_sender_obj = mail_sender.MailSender(self.email_config)
                 ret_code = mail_sender_obj.send_signer_confirmation_mail(target_signer_info["locale"], self.job_data["taskPayload"]["publicTaskInfo"]["domainSetting"]["rootDomain"], target_signer_info["emailAddr"], self.job_data[
@@ -142,7 +212,7 @@ class SendReqHandler(BaseFunctionHandler):
 
             # send notification to notificant
             if ret_code == ErrCodeList.SUCCES.value:
-                if self.job_data["signerIdx"] == 0 and len(self.task_config["notificantEmail"]) > 0:
+                if signer_idx == 0 and len(self.task_config["notificantEmail"]) > 0:
                     single_signer_email = None if len(
                         self.task_config["signerInfoList"]) > 1 else self.task_config["signerInfoList"][0]["emailAddr"]
                     mail_sender_obj = mail_sender.MailSender(self.email_config)
@@ -153,13 +223,15 @@ class SendReqHandler(BaseFunctionHandler):
                         ret_code = ErrCodeList.SEND_NOTIFY_EMAIL_FAIL.value
             else:
                 try:
-                    if self.job_data["signerIdx"] == 0 and len(self.task_config["notificantEmail"]) > 0:
+                    if signer_idx == 0 and len(self.task_config["notificantEmail"]) > 0:
                         single_signer_email = None if len(
                             self.task_config["signerInfoList"]) > 1 else self.task_config["signerInfoList"][0]["emailAddr"]
                         mail_sender_obj = mail_sender.MailSender(
                             self.email_config)
-                        mail_sender_obj.send_notificant_error_mail(
-                            self.task_config["notificantLocale"], self.task_config["notificantEmail"], self.job_data["taskID"], self.task_config["fileName"], single_signer_email)
+
+                        # the mail does not affect the result, send it in background
+                        mail_outbox_util.put_mail("error mail to notificant", mail_sender_obj.send_notificant_error_mail, [
+                                                  self.task_config["notificantLocale"], self.task_config["notificantEmail"], self.job_data["taskID"], self.task_config["fileName"], single_signer_email], mail_sender_obj.is_last_error_retryable)
                 except BaseException as e:
                     logging.error(traceback.format_exc())
 
@@ -171,7 +243,7 @@ class SendReqHandler(BaseFunctionHandler):
             logging.error(traceback.format_exc())
             ret_code = ErrCodeList.UNDEFINED_ERROR.value
 
-        return ret_code, results if ret_code == ErrCodeList.SUCCES.value else [], None
+        return ret_code, results if ret_code == ErrCodeList.SUCCES.value else []
 
     def __test_signed_pdf(self, decrypted_pdf):
         try:
@@ -0,0 +1,51 @@
+import hmac
+import datetime
+import hashlib
+
+ALGORITHM = "AWS4-HMAC-SHA256"
+
+
+def __sign(key, msg):
+    return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+
+
+def __get_signature_key(key, date_stamp, region_name, service_name):
+    kDate = __sign(("AWS4" + key).encode("utf-8"), date_stamp)
+    kRegion = __sign(kDate, region_name)
+    kService = __sign(kRegion, service_name)
+    kSigning = __sign(kService, "aws4_request")
+
+    return kSigning
+
+
+# sign a request without query string by AWS Signature Version 4, all the given
+# headers are signed, and the returned headers include X-Amz-Date and Authorization,
+# payload_hash is the sha256 hex digest of a payload which is not given in bytes
+def sign_request(aws_key_id, aws_key_secret, region, service, method, api_host, api_path, headers, payload_bytes, payload_hash=None):
+    current_time = datetime.datetime.utcnow()
+
+    amz_date = current_time.strftime("%Y%m%dT%H%M%SZ")
+    date_stamp = current_time.strftime("%Y%m%d")
+    credential_scope = f"{date_stamp}/{region}/{service}/aws4_request"
+
+    canonical_header_dict = {"host": api_host, "x-amz-date": amz_date}
+    for header_name, header_value in headers.items():
+        canonical_header_dict[header_name.lower()] = header_value.strip()
+
+    header_name_list = sorted(canonical_header_dict.keys())
+    signed_headers = ";".join(header_name_list)
+    canonical_headers = "".join(
+        [f"{header_name}:{canonical_header_dict[header_name]}\n" for header_name in header_name_list])
+
+    canonical_request = f"{method}\n{api_path}\n\n{canonical_headers}\n{signed_headers}\n{payload_hash if payload_hash else hashlib.sha256(payload_bytes).hexdigest()}"
+    string_to_sign = f"{ALGORITHM}\n{amz_date}\n{credential_scope}\n{hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()}"
+    signing_key = __get_signature_key(
+        aws_key_secret, date_stamp, region, service)
+    signature = hmac.new(signing_key, string_to_sign.encode(
+        "utf-8"), hashlib.sha256).hexdigest()
+
+    signed_header_dict = dict(headers)
+    signed_header_dict["X-Amz-Date"] = amz_date
+    signed_header_dict["Authorization"] = f"{ALGORITHM} Credential={aws_key_id}/{credential_scope}, SignedHeaders={signed_headers}, Signature={signature}"
+
+    return signed_header_dict
@@ -0,0 +1,48 @@
+import os
+
+# settings of tee server, one "<name> <value>" per line, the file is part of the
+# enclave image like the other configs, so a setting is covered by its measurement
+CONFIG_PATH = "/configs/tee_server.conf"
+
+__config_dict = None
+
+
+def __load_config_dict():
+    config_dict = {}
+
+    if not os.path.exists(CONFIG_PATH):
+        return config_dict
+
+    with open(CONFIG_PATH, "r") as config_file:
+        for line in config_file:
+            setting = line.split()
+
+            if len(setting) == 0 or setting[0].startswith("#"):
+                continue
+
+            if len(setting) != 2:
+                raise Exception(f"invalid setting in {CONFIG_PATH}: {line.strip()}")
+
+            config_dict[setting[0]] = setting[1]
+
+    return config_dict
+
+
+# the value of a setting, or the default value if it is not set
+def get_config(name, default_value):
+    global __config_dict
+
+    if __config_dict is None:
+        __config_dict = __load_config_dict()
+
+    return __config_dict.get(name, default_value)
+
+
+# the value of a setting, which must be one of the allowed values
+def get_config_choice(name, default_value, value_list):
+    value = get_config(name, default_value)
+
+    if value not in value_list:
+        raise Exception(f"unsupported value of {name}: {value}")
+
+    return value
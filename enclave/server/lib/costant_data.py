@@ -1,6 +1,7 @@
 
 class JobNameList:
     SEND_REQ = "sendReq"
+    SEND_REQ_BATCH = "sendReqBatch"
     CONFIRM_INTENT = "confirmIntent"
     ATTACH_ESIG = "attachEsig"
 
@@ -71,6 +71,23 @@ def aes_cbc_encrypt_data(aes_key_bytes, iv_bytes, origin_data_bytes):
     return None
 
 
+# encrypt data written in chunks into the output stream, call finalize() after the last write
+class AesCbcEncryptWriter():
+    def __init__(self, aes_key_bytes, iv_bytes, output_stream):
+        self.output_stream = output_stream
+        self.padder = primitives_padding.PKCS7(128).padder()
+        self.encryptor = Cipher(algorithms.AES(
+            aes_key_bytes), modes.CBC(iv_bytes)).encryptor()
+
+    def write(self, data_bytes):
+        self.output_stream.write(
+            self.encryptor.update(self.padder.update(data_bytes)))
+
+    def finalize(self):
+        self.output_stream.write(self.encryptor.update(
+            self.padder.finalize()) + self.encryptor.finalize())
+
+
 def aes_cbc_decrypt_data(aes_key_bytes, iv_bytes, encrypted_data_bytes):
     try:
         cipher = Cipher(algorithms.AES(aes_key_bytes), modes.CBC(iv_bytes))
@@ -6,6 +6,7 @@ import traceback
 
 from lib import kms_util
 from lib import crypto_util
+from lib import json_hash_util
 from lib import params_checker
 from lib.err_code_util import ErrCodeList
 
@@ -164,8 +165,8 @@ def decrypt_private_task_info(task_payload, kms_key_id, kms_key_secret):
 
         # check template info hash
         if ret_code == ErrCodeList.SUCCES.value:
-            template_info_hash = hashlib.sha256(json.dumps(
-                task_payload["publicTaskInfo"]["templateInfo"], ensure_ascii=False, separators=(',', ':')).encode("utf-8")).hexdigest()
+            template_info_hash = json_hash_util.gen_canonical_hash(
+                task_payload["publicTaskInfo"]["templateInfo"])
             if template_info_hash != tmp_binding_data["templateInfoHash"]:
                 ret_code = ErrCodeList.MISMATCH_TEMPLATE_INFO_HASH.value
 
@@ -176,8 +177,8 @@ def decrypt_private_task_info(task_payload, kms_key_id, kms_key_secret):
 
         # check task config hash
         if ret_code == ErrCodeList.SUCCES.value:
-            task_config_hash = hashlib.sha256(json.dumps(
-                tmp_task_config, ensure_ascii=False, separators=(',', ':')).encode("utf-8")).hexdigest()
+            task_config_hash = json_hash_util.gen_canonical_hash(
+                tmp_task_config)
             if task_config_hash != tmp_binding_data["taskConfigHash"]:
                 ret_code = ErrCodeList.MISMATCH_TASK_CONFIG_HASH.value
 
@@ -0,0 +1,69 @@
+import json
+import hashlib
+
+# ascii strings longer than this, e.g. base64 data, are hashed as they are when
+# nothing in them needs escaping, instead of being serialized by the json encoder
+LARGE_STRING_MIN_SIZE = 64 * 1024
+
+# the characters json.dumps escapes in ascii strings when ensure_ascii is off
+JSON_ESCAPE_BYTES = bytes(range(0x20)) + b'"\\'
+
+__encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def __has_large_string(obj):
+    if isinstance(obj, str):
+        return len(obj) >= LARGE_STRING_MIN_SIZE
+    elif isinstance(obj, dict):
+        return any(__has_large_string(value) for value in obj.values())
+    elif isinstance(obj, (list, tuple)):
+        return any(__has_large_string(value) for value in obj)
+
+    return False
+
+
+def __update_hash(hasher, obj):
+    if isinstance(obj, str):
+        obj_bytes = None
+        if len(obj) >= LARGE_STRING_MIN_SIZE and obj.isascii():
+            obj_bytes = obj.encode("ascii")
+            if len(obj_bytes.translate(None, JSON_ESCAPE_BYTES)) != len(obj_bytes):
+                obj_bytes = None
+
+        if obj_bytes is not None:
+            hasher.update(b'"')
+            hasher.update(obj_bytes)
+            hasher.update(b'"')
+        else:
+            hasher.update(__encoder.encode(obj).encode("utf-8"))
+    elif not __has_large_string(obj):
+        # small subtrees are serialized in one go by the json encoder
+        hasher.update(__encoder.encode(obj).encode("utf-8"))
+    elif isinstance(obj, dict) and all(isinstance(key, str) for key in obj):
+        separator = b"{"
+        for key, value in obj.items():
+            hasher.update(separator)
+            hasher.update(__encoder.encode(key).encode("utf-8"))
+            hasher.update(b":")
+            __update_hash(hasher, value)
+            separator = b","
+        hasher.update(b"}")
+    elif isinstance(obj, (list, tuple)):
+        separator = b"["
+        for value in obj:
+            hasher.update(separator)
+            __update_hash(hasher, value)
+            separator = b","
+        hasher.update(b"]")
+    else:
+        hasher.update(__encoder.encode(obj).encode("utf-8"))
+
+
+# sha256 hex digest of json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+# encoded in utf-8, the serialized json is streamed into the hash, so the whole
+# payload is never serialized into one more multi-MB string
+def gen_canonical_hash(obj):
+    hasher = hashlib.sha256()
+    __update_hash(hasher, obj)
+
+    return hasher.hexdigest()
@@ -1,14 +1,12 @@
 import json
-import hmac
 import base64
 import logging
-import datetime
-import hashlib
 import traceback
 
 from asn1crypto import cms
 
 from lib import crypto_util
+from lib import aws_sig_util
 from lib import libnsm_util
 from lib import requests_util
 
@@ -20,47 +18,16 @@ def __extract_kms_region(kms_key_arn):
     return kms_key_arn.split(":")[3]
 
 
-def __sign(key, msg):
-    return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
-
-
-def __get_signature_key(key, date_stamp, region_name, service_name):
-    kDate = __sign(("AWS4" + key).encode("utf-8"), date_stamp)
-    kRegion = __sign(kDate, region_name)
-    kService = __sign(kRegion, service_name)
-    kSigning = __sign(kService, "aws4_request")
-
-    return kSigning
-
-
 def __exe_kms_post_request(aws_key_id, aws_key_secret, kms_region,  amz_target, request_data):
     service = "kms"
     api_host = f"kms.{kms_region}.amazonaws.com"
     api_endpoint = f"https://kms.{kms_region}.amazonaws.com/"
-    algorithm = "AWS4-HMAC-SHA256"
     content_type = "application/x-amz-json-1.1"
-    current_time = datetime.datetime.utcnow()
-
-    amz_date = current_time.strftime("%Y%m%dT%H%M%SZ")
-    date_stamp = current_time.strftime("%Y%m%d")
-    credential_scope = f"{date_stamp}/{kms_region}/{service}/aws4_request"
-    signed_headers = "content-type;host;x-amz-date;x-amz-target"
-
-    canonical_headers = f"content-type:{content_type}\nhost:{api_host}\nx-amz-date:{amz_date}\nx-amz-target:{amz_target}\n"
-    canonical_request = f"POST\n/\n\n{canonical_headers}\n{signed_headers}\n{hashlib.sha256(request_data.encode('utf-8')).hexdigest()}"
-    string_to_sign = f"{algorithm}\n{amz_date}\n{credential_scope}\n{hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()}"
-    signing_key = __get_signature_key(
-        aws_key_secret, date_stamp, kms_region, service)
-    signature = hmac.new(signing_key, string_to_sign.encode(
-        "utf-8"), hashlib.sha256).hexdigest()
-
-    authorization_header = f"{algorithm} Credential={aws_key_id}/{credential_scope}, SignedHeaders={signed_headers}, Signature={signature}"
-    headers = {
+
+    headers = aws_sig_util.sign_request(aws_key_id, aws_key_secret, kms_region, service, "POST", api_host, "/", {
         "X-Amz-Target": amz_target,
-        "X-Amz-Date": amz_date,
-        "Content-Type": content_type,
-        "Authorization": authorization_header
-    }
+        "Content-Type": content_type
+    }, request_data.encode("utf-8"))
 
     response = requests_util.gen_requests_session().post(
         api_endpoint, headers=headers, data=request_data, timeout=10)
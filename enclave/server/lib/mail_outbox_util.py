@@ -0,0 +1,128 @@
+import time
+import logging
+import threading
+import traceback
+
+from lib.err_code_util import ErrCodeList
+
+# mails which do not affect the job result are sent by a background thread, a failed
+# mail may have been delivered and is only sent again if its retryable check says it
+# surely was not and the failure is temporary, up to MAIL_OUTBOX_MAX_RETRY_COUNT times
+# with a delay doubled on each retry (smtp_pool_util also retries the failures which
+# happen before the message data once on a new session)
+MAIL_OUTBOX_MAX_SIZE = 100
+MAIL_OUTBOX_MAX_RETRY_COUNT = 3
+MAIL_OUTBOX_RETRY_DELAY = 2
+
+__outbox_cond = threading.Condition()
+__outbox_queue = []
+__outbox_stats = {"queued": 0, "sent": 0,
+                  "retried": 0, "failed": 0, "dropped": 0}
+__sending_count = 0
+__worker_thread = None
+
+
+def __send_mail(mail_item):
+    try:
+        ret_code = mail_item["sendFn"](*mail_item["sendArgs"])
+    except BaseException as e:
+        logging.error(traceback.format_exc())
+        return ErrCodeList.SEND_EMAIL_FAIL.value, False
+
+    try:
+        is_retryable = ret_code != ErrCodeList.SUCCES.value and mail_item[
+            "isRetryableFn"] is not None and mail_item["isRetryableFn"]()
+    except BaseException as e:
+        logging.error(traceback.format_exc())
+        is_retryable = False
+
+    return ret_code, is_retryable
+
+
+def __pop_due_mail_item():
+    # the first mail whose send time has come, or None with the time to wait for one
+    current_time = time.monotonic()
+
+    for mail_idx, mail_item in enumerate(__outbox_queue):
+        if mail_item["sendTime"] <= current_time:
+            return __outbox_queue.pop(mail_idx), None
+
+    return None, min([mail_item["sendTime"] for mail_item in __outbox_queue]) - current_time
+
+
+def __run_worker():
+    global __sending_count
+
+    while True:
+        with __outbox_cond:
+            while True:
+                if len(__outbox_queue) == 0:
+                    __outbox_cond.wait()
+                    continue
+
+                mail_item, wait_time = __pop_due_mail_item()
+                if mail_item is not None:
+                    break
+
+                __outbox_cond.wait(wait_time)
+
+            __sending_count += 1
+
+        ret_code, is_retryable = __send_mail(mail_item)
+
+        with __outbox_cond:
+            __sending_count -= 1
+
+            if ret_code == ErrCodeList.SUCCES.value:
+                __outbox_stats["sent"] += 1
+            elif is_retryable and mail_item["retryCount"] < MAIL_OUTBOX_MAX_RETRY_COUNT:
+                retry_delay = MAIL_OUTBOX_RETRY_DELAY * \
+                    2 ** mail_item["retryCount"]
+                mail_item["retryCount"] += 1
+                mail_item["sendTime"] = time.monotonic() + retry_delay
+                __outbox_queue.append(mail_item)
+                __outbox_stats["retried"] += 1
+                logging.info(
+                    f"failed to send {mail_item['description']}: {ret_code}, retry {mail_item['retryCount']} in {retry_delay}s")
+            else:
+                __outbox_stats["failed"] += 1
+                logging.error(
+                    f"failed to send {mail_item['description']}: {ret_code}, outbox stats: {__outbox_stats}")
+
+            __outbox_cond.notify_all()
+
+
+# is_retryable_fn is called after a failed send, and tells whether the mail can be
+# sent again, e.g. MailSender.is_last_error_retryable
+def put_mail(description, send_fn, send_args, is_retryable_fn=None):
+    global __worker_thread
+
+    with __outbox_cond:
+        if len(__outbox_queue) >= MAIL_OUTBOX_MAX_SIZE:
+            __outbox_stats["dropped"] += 1
+            logging.error(
+                f"mail outbox is full, drop {description}, outbox stats: {__outbox_stats}")
+            return False
+
+        if __worker_thread is None:
+            __worker_thread = threading.Thread(
+                target=__run_worker, daemon=True)
+            __worker_thread.start()
+
+        __outbox_stats["queued"] += 1
+        __outbox_queue.append({"description": description, "sendFn": send_fn, "sendArgs": send_args,
+                               "isRetryableFn": is_retryable_fn, "retryCount": 0, "sendTime": time.monotonic()})
+        __outbox_cond.notify_all()
+
+        return True
+
+
+# wait until all mails are sent or failed, returns False on timeout
+def wait_outbox_empty(timeout=None):
+    with __outbox_cond:
+        return __outbox_cond.wait_for(lambda: len(__outbox_queue) == 0 and __sending_count == 0, timeout)
+
+
+def get_outbox_stats():
+    with __outbox_cond:
+        return dict(__outbox_stats, depth=len(__outbox_queue))
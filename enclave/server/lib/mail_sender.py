@@ -1,4 +1,3 @@
-import ssl
 import base64
 import logging
 import smtplib
@@ -7,11 +6,15 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
 
+import requests
 import python_http_client
-from sendgrid import SendGridAPIClient
+from urllib3.exceptions import ConnectTimeoutError
 from sendgrid.helpers.mail import Mail, TrackingSettings, ClickTracking, OpenTracking, SubscriptionTracking, Ganalytics, Attachment, FileContent, FileName, FileType, Disposition
 
+from lib import ses_api_util
 from lib import mail_template
+from lib import sendgrid_util
+from lib import smtp_pool_util
 from lib.err_code_util import ErrCodeList
 
 EMAIL_DISPLAY_NAME = "Let's eSign"
@@ -22,10 +25,9 @@ SES_SMTP_PORT = 587
 class MailSender():
     def __init__(self, email_config):
         self.email_config = email_config
+        self.last_error = None
 
-    def __send_mail_via_ses(self, to_email, subject, mail_body, attachment_info=None):
-        from_mail = f"=?UTF-8?B?{base64.b64encode(EMAIL_DISPLAY_NAME.encode('utf-8')).decode('utf-8')}?= <do-not-reply@{self.email_config['sesDomain']}>"
-
+    def __gen_ses_message_segment_list(self, from_mail, to_email, subject, mail_body, attachment_info):
         # set headers
         message = MIMEMultipart()
         message["Subject"] = subject
@@ -36,72 +38,119 @@ class MailSender():
         part = MIMEText(mail_body, "html", "utf-8")
         message.attach(part)
 
-        # set PDF attachment
-        if attachment_info:
-            part = MIMEApplication(attachment_info["fileBytes"])
-            part.add_header("Content-Disposition", "attachment",
-                            filename=attachment_info["fileName"])
-            part.add_header("Content-Type", attachment_info["contentType"])
-            message.attach(part)
+        message_text = message.as_string()
+
+        if not attachment_info:
+            return [message_text]
 
-        with smtplib.SMTP(SES_SMTP_HOST, port=SES_SMTP_PORT, timeout=10) as smtp_server:
-            smtp_server.ehlo()
-            smtp_server.starttls(context=ssl.create_default_context())
-            smtp_server.login(
-                self.email_config["sesSMTPUsername"], self.email_config["sesSMTPPassword"])
-            smtp_server.sendmail(from_mail, to_email, message.as_string())
-            smtp_server.quit()
+        # insert the attachment part encoded in advance before the closing boundary
+        boundary = message.get_boundary()
+        closing_boundary = f"\n--{boundary}--\n"
+
+        if not message_text.endswith(closing_boundary):
+            raise Exception("unexpected end of MIME message")
+
+        return [message_text[:-len(closing_boundary)], f"\n--{boundary}\n", attachment_info["mimeText"], closing_boundary]
+
+    def __send_mail_via_ses(self, to_email, subject, mail_body, attachment_info=None):
+        from_mail = f"=?UTF-8?B?{base64.b64encode(EMAIL_DISPLAY_NAME.encode('utf-8')).decode('utf-8')}?= <do-not-reply@{self.email_config['sesDomain']}>"
+        message_segment_list = self.__gen_ses_message_segment_list(
+            from_mail, to_email, subject, mail_body, attachment_info)
 
-    def __send_mail_via_sendgrid(self, to_email, subject, mail_body, attachment_info=None):
-        response = None
+        if self.email_config.get("sesTransport", "smtp") == "api":
+            ses_api_util.send_mail(self.email_config["sesAPIKeyID"], self.email_config["sesAPIKeySecret"],
+                                   from_mail, to_email, message_segment_list)
+        else:
+            smtp_pool_util.send_mail(SES_SMTP_HOST, SES_SMTP_PORT, self.email_config["sesSMTPUsername"],
+                                     self.email_config["sesSMTPPassword"], from_mail, to_email, message_segment_list)
 
+    def __send_mail_via_sendgrid(self, to_email_list, subject, mail_body, attachment_info=None):
         try:
             from_mail = f"do-not-reply@{self.email_config['sgDomain']}"
 
+            # each recipient gets its own personalization, so that they do not see each other
             message = Mail(from_email=(from_mail, EMAIL_DISPLAY_NAME),
-                           to_emails=to_email, subject=subject, html_content=mail_body)
+                           to_emails=to_email_list, subject=subject, html_content=mail_body, is_multiple=True)
             message.tracking_settings = TrackingSettings(ClickTracking(
                 False, False), OpenTracking(False), SubscriptionTracking(False), Ganalytics(False))
 
             if attachment_info:
                 attachment = Attachment()
                 attachment.file_content = FileContent(
-                    base64.b64encode(attachment_info["fileBytes"]).decode())
+                    attachment_info["b64Content"])
                 attachment.file_type = FileType(attachment_info["contentType"])
                 attachment.file_name = FileName(
                     f"=?UTF-8?B?{base64.b64encode(attachment_info['fileName'].encode('utf-8')).decode('utf-8')}?=")
                 attachment.disposition = Disposition("attachment")
                 message.attachment = attachment
 
-            sg_client = SendGridAPIClient(self.email_config["sgSecret"])
-            response = sg_client.send(message)
-
-            if response.status_code != 202 and response.status_code != 200:
-                raise RuntimeError(
-                    f"failed to send email via sendgrid: {response.status_code}")
-        except python_http_client.exceptions.UnauthorizedError as e:
+            sendgrid_util.send_mail(self.email_config["sgSecret"], message)
+        except (python_http_client.exceptions.HTTPError, requests.exceptions.RequestException) as e:
             raise e
         except BaseException as e:
             raise RuntimeError(str(e))
 
+    def prepare_attachment(self, file_name, file_bytes, content_type):
+        attachment_info = {
+            "fileName": file_name,
+            "contentType": content_type
+        }
+
+        # encode the attachment once, it can be sent to several recipients
+        if self.email_config["serviceProvider"] == "ses":
+            part = MIMEApplication(file_bytes)
+            part.add_header("Content-Disposition", "attachment",
+                            filename=file_name)
+            part.add_header("Content-Type", content_type)
+            attachment_info["mimeText"] = part.as_string()
+        elif self.email_config["serviceProvider"] == "sg":
+            attachment_info["b64Content"] = base64.b64encode(
+                file_bytes).decode()
+
+        return attachment_info
+
+    def is_batch_supported(self):
+        return self.email_config["serviceProvider"] == "sg"
+
+    def __is_retryable_error(self, e):
+        # a mail is surely not delivered if the connection fails before the request is
+        # sent, and rate limits (429) and server errors (5xx) are temporary
+        if isinstance(e, python_http_client.exceptions.HTTPError):
+            return e.status_code == 429 or 500 <= e.status_code < 600
+        elif isinstance(e, requests.exceptions.ConnectionError):
+            return len(e.args) > 0 and isinstance(getattr(e.args[0], "reason", None), ConnectTimeoutError)
+        elif isinstance(e, requests.exceptions.RequestException):
+            return False
+
+        return smtp_pool_util.is_retryable_error(e)
+
+    # whether the last failed mail can be sent again later
+    def is_last_error_retryable(self):
+        return self.last_error is not None and self.__is_retryable_error(self.last_error)
+
     def __send_mail(self, to_email, subject, mail_body, attachment_info=None):
+        self.last_error = None
+
         try:
             if self.email_config["serviceProvider"] == "ses":
                 self.__send_mail_via_ses(
                     to_email, subject, mail_body, attachment_info)
             elif self.email_config["serviceProvider"] == "sg":
                 self.__send_mail_via_sendgrid(
-                    to_email, subject, mail_body, attachment_info)
+                    [to_email], subject, mail_body, attachment_info)
             else:
                 raise RuntimeError(f"unsupported email service provider")
 
             return ErrCodeList.SUCCES.value
         except smtplib.SMTPAuthenticationError as e:
+            self.last_error = e
             return ErrCodeList.INVALID_EMAIL_CREDENTIAL.value
         except python_http_client.exceptions.UnauthorizedError as e:
+            self.last_error = e
             return ErrCodeList.INVALID_EMAIL_CREDENTIAL.value
         except BaseException as e:
             logging.error(traceback.format_exc())
+            self.last_error = e
             return ErrCodeList.SEND_EMAIL_FAIL.value
 
     def send_notificant_error_mail(self, locale, notificant_email, task_id, file_name, single_signer_email):
@@ -132,11 +181,8 @@ class MailSender():
             subject = mail_template.get_confirm_mail_subject(locale, task_id)
             mail_body = mail_template.get_confirm_mail_body(
                 locale, sig_sender, signer_name, custom_message, confirm_link, signer_phone)
-            attachment_info = {
-                "fileBytes": pdf_bytes,
-                "fileName": file_name,
-                "contentType": "application/pdf"
-            }
+            attachment_info = self.prepare_attachment(
+                file_name, pdf_bytes, "application/pdf")
 
             return self.__send_mail(sig_signer_addr, subject, mail_body, attachment_info)
         except BaseException as e:
@@ -155,35 +201,67 @@ class MailSender():
             logging.error(traceback.format_exc())
             return ErrCodeList.SEND_EMAIL_FAIL.value
 
-    def send_notificant_final_mail(self, locale, notificant_email, task_id, file_name, signer_list, zip_file_name, zip_file_bytes):
+    def send_notificant_final_mail(self, locale, notificant_email, task_id, file_name, signer_list, zip_attachment_info):
         try:
             subject = mail_template.get_notificant_final_mail_subject(
                 locale, task_id)
             mail_body = mail_template.get_notificant_final_mail_body(
                 locale, file_name, signer_list)
-            attachment_info = {
-                "fileBytes": zip_file_bytes,
-                "fileName": zip_file_name,
-                "contentType": "application/zip"
-            }
 
-            return self.__send_mail(notificant_email, subject, mail_body, attachment_info)
+            return self.__send_mail(notificant_email, subject, mail_body, zip_attachment_info)
         except BaseException as e:
             logging.error(traceback.format_exc())
             return ErrCodeList.SEND_EMAIL_FAIL.value
 
-    def send_signer_final_mail(self, locale, signer_email, task_id, zip_file_name, zip_file_bytes):
+    def send_signer_final_mail(self, locale, signer_email, task_id, zip_attachment_info):
         try:
             subject = mail_template.get_signer_final_mail_subject(
                 locale, task_id)
             mail_body = mail_template.get_signer_final_mail_body(locale)
-            attachment_info = {
-                "fileBytes": zip_file_bytes,
-                "fileName": zip_file_name,
-                "contentType": "application/zip"
-            }
 
-            return self.__send_mail(signer_email, subject, mail_body, attachment_info)
+            return self.__send_mail(signer_email, subject, mail_body, zip_attachment_info)
         except BaseException as e:
             logging.error(traceback.format_exc())
             return ErrCodeList.SEND_EMAIL_FAIL.value
+
+    # returns the result code of each signer in signer_email_list
+    def send_signer_final_mail_batch(self, locale, signer_email_list, task_id, zip_attachment_info):
+        ret_code_list = []
+
+        try:
+            if not self.is_batch_supported():
+                raise RuntimeError(
+                    "batch sending is not supported by email service provider")
+
+            subject = mail_template.get_signer_final_mail_subject(
+                locale, task_id)
+            mail_body = mail_template.get_signer_final_mail_body(locale)
+
+            for list_start in range(0, len(signer_email_list), sendgrid_util.SENDGRID_MAX_PERSONALIZATION_COUNT):
+                batch_email_list = signer_email_list[list_start:
+                                                     list_start + sendgrid_util.SENDGRID_MAX_PERSONALIZATION_COUNT]
+
+                try:
+                    self.__send_mail_via_sendgrid(
+                        batch_email_list, subject, mail_body, zip_attachment_info)
+                    ret_code_list.extend(
+                        [ErrCodeList.SUCCES.value] * len(batch_email_list))
+                except python_http_client.exceptions.BadRequestsError as e:
+                    # the request is rejected as a whole, e.g. for one invalid address, and
+                    # nothing is sent, so send it to each signer to find out who fails
+                    logging.error(
+                        "batch mail is rejected, send it to each signer")
+                    ret_code_list.extend([self.__send_mail(signer_email, subject, mail_body, zip_attachment_info)
+                                          for signer_email in batch_email_list])
+                except python_http_client.exceptions.UnauthorizedError as e:
+                    ret_code_list.extend(
+                        [ErrCodeList.INVALID_EMAIL_CREDENTIAL.value] * len(batch_email_list))
+                except BaseException as e:
+                    logging.error(traceback.format_exc())
+                    ret_code_list.extend(
+                        [ErrCodeList.SEND_EMAIL_FAIL.value] * len(batch_email_list))
+        except BaseException as e:
+            logging.error(traceback.format_exc())
+
+        # signers without a result have not been sent to
+        return ret_code_list + [ErrCodeList.SEND_EMAIL_FAIL.value] * (len(signer_email_list) - len(ret_code_list))
@@ -1,215 +1,235 @@
 import os
+import re
 import html
+import threading
 from datetime import datetime
 
 MAIL_TEMPLATE_FOLDER = "/server/resources/template"
+MAIL_BODY_FILE_SUFFIX = "_body.html"
+DEFAULT_LOCALE = "en-us"
 BEGIN_SMS_NOTICE = "<!-- BEGIN SMS NOTICE -->"
 END_SMS_NOTICE = "<!-- END SMS NOTICE -->"
 BEGIN_SINGLE_SIGNER = "<!-- BEGIN SINGLE SIGNER -->"
 END_SINGLE_SIGNER = "<!-- END SINGLE SIGNER -->"
-
-
-def __load_mail_subject(locale, email_type):
+MAIL_BLOCK_DICT = {
+    BEGIN_SMS_NOTICE: END_SMS_NOTICE,
+    BEGIN_SINGLE_SIGNER: END_SINGLE_SIGNER
+}
+MAIL_PLACEHOLDER_LIST = ["DUMMY_TASK_ID", "DUMMY_FILE_NAME", "DUMMY_SIGNER_EMAIL", "DUMMY_SIGNER_NAME", "DUMMY_SENDER",
+                         "DUMMY_CUSTOM_MESSAGE", "DUMMY_SIGNER_CONFIRM_LINK", "DUMMY_SIGNER_PHONE", "DUMMY_SIGNER_LIST"]
+MAIL_TOKEN_PATTERN = re.compile("({})".format("|".join(re.escape(token) for token in sorted(
+    MAIL_PLACEHOLDER_LIST + list(MAIL_BLOCK_DICT.keys()) + list(MAIL_BLOCK_DICT.values()), key=len, reverse=True))))
+
+# templates of all email types and locales, parsed once per process
+__template_lock = threading.Lock()
+__template_dict = None
+
+
+def __parse_template(template_str):
+    # a template is a list of text, placeholder and conditional block segments
+    segment_list = []
+    segment_list_stack = [segment_list]
+    end_marker_stack = []
+
+    for token_idx, token in enumerate(MAIL_TOKEN_PATTERN.split(template_str)):
+        if token_idx % 2 == 0:
+            if len(token) > 0:
+                segment_list_stack[-1].append(("text", token))
+        elif token in MAIL_BLOCK_DICT:
+            # the markers are kept in the mail if the block is not removed
+            block_segment_list = [("text", token)]
+            segment_list_stack[-1].append(
+                ("block", (token, block_segment_list)))
+            segment_list_stack.append(block_segment_list)
+            end_marker_stack.append(MAIL_BLOCK_DICT[token])
+        elif token in MAIL_BLOCK_DICT.values():
+            if len(end_marker_stack) == 0 or end_marker_stack.pop() != token:
+                raise Exception(f"unexpected mail template block: {token}")
+
+            segment_list_stack.pop().append(("text", token))
+        else:
+            segment_list_stack[-1].append(("placeholder", token))
+
+    if len(end_marker_stack) > 0:
+        raise Exception(f"unclosed mail template block: {end_marker_stack}")
+
+    return segment_list
+
+
+def __parse_subject(template_str):
     pre_tag = "<title>"
     post_tag = "</title>"
 
-    # prepare locale file name
-    locale_file_name = f"{MAIL_TEMPLATE_FOLDER}/{email_type}/{locale.lower()}_body.html"
+    start_pos = template_str.index(pre_tag) + len(pre_tag)
+    end_pos = template_str.index(post_tag, start_pos)
 
-    # use default locale if the locale file not exist
-    if not os.path.exists(locale_file_name):
-        locale_file_name = f"{MAIL_TEMPLATE_FOLDER}/{email_type}/en-us_body.html"
+    return __parse_template(template_str[start_pos:end_pos])
 
-    with open(locale_file_name, "rt") as file:
-        email_html = file.read()
-        start_pos = email_html.index(pre_tag) + len(pre_tag)
-        end_pos = email_html.index(post_tag, start_pos)
 
-        return email_html[start_pos:end_pos]
+def __load_templates():
+    template_dict = {}
 
+    for email_type in os.listdir(MAIL_TEMPLATE_FOLDER):
+        email_type_folder = f"{MAIL_TEMPLATE_FOLDER}/{email_type}"
 
-def __load_mail_body(locale, email_type):
-    # prepare locale file name
-    locale_file_name = f"{MAIL_TEMPLATE_FOLDER}/{email_type}/{locale.lower()}_body.html"
+        if not os.path.isdir(email_type_folder):
+            continue
 
-    # use default locale if the locale file not exist
-    if not os.path.exists(locale_file_name):
-        locale_file_name = f"{MAIL_TEMPLATE_FOLDER}/{email_type}/en-us_body.html"
+        template_dict[email_type] = {}
 
-    with open(locale_file_name, "rt") as file:
-        return file.read()
+        for file_name in os.listdir(email_type_folder):
+            if not file_name.endswith(MAIL_BODY_FILE_SUFFIX):
+                continue
 
+            with open(f"{email_type_folder}/{file_name}", "rt") as file:
+                template_str = file.read()
 
-def __remove_msg_block(mail_body, begin_msg, end_msg):
-    begin_index = mail_body.index(begin_msg)
-    end_index = mail_body.index(end_msg)
+            template_dict[email_type][file_name[:-len(MAIL_BODY_FILE_SUFFIX)]] = {
+                "subject": __parse_subject(template_str),
+                "body": __parse_template(template_str)
+            }
 
-    return mail_body[0:begin_index] + mail_body[end_index + len(end_msg):]
+    return template_dict
 
 
-def get_error_mail_subject(locale, task_id):
-    # load email subject
-    mail_subject = __load_mail_subject(locale, "email_to_notificant_0")
+def __get_template(locale, email_type):
+    global __template_dict
 
-    # fill task id
-    mail_subject = mail_subject.replace("DUMMY_TASK_ID", task_id[-12:])
+    with __template_lock:
+        if __template_dict is None:
+            __template_dict = __load_templates()
 
-    return mail_subject
+    locale_dict = __template_dict[email_type]
 
+    # use default locale if the locale does not exist
+    return locale_dict.get(locale.lower(), locale_dict[DEFAULT_LOCALE])
 
-def get_error_mail_body(locale, file_name, single_signer_email):
-    # load email body
-    mail_body = __load_mail_body(locale, "email_to_notificant_0")
 
-    # fill file name
-    mail_body = mail_body.replace("DUMMY_FILE_NAME", file_name)
+def __render_segment_list(segment_list, value_dict, removed_block_set, output_list):
+    for segment_type, segment_value in segment_list:
+        if segment_type == "text":
+            output_list.append(segment_value)
+        elif segment_type == "placeholder":
+            output_list.append(value_dict.get(segment_value, segment_value))
+        elif segment_value[0] not in removed_block_set:
+            __render_segment_list(
+                segment_value[1], value_dict, removed_block_set, output_list)
 
-    # fill single signer email
-    if single_signer_email:
-        mail_body = mail_body.replace(
-            "DUMMY_SIGNER_EMAIL", single_signer_email)
-    else:
-        mail_body = __remove_msg_block(
-            mail_body, BEGIN_SINGLE_SIGNER, END_SINGLE_SIGNER)
 
-    return mail_body
+def __render_template(segment_list, value_dict, removed_block_set=frozenset()):
+    output_list = []
+    __render_segment_list(segment_list, value_dict,
+                          removed_block_set, output_list)
 
+    return "".join(output_list)
 
-def get_notify_mail_subject(locale, task_id):
-    # load email subject
-    mail_subject = __load_mail_subject(locale, "email_to_notificant_1")
 
+def __render_mail_subject(locale, email_type, task_id):
     # fill task id
-    mail_subject = mail_subject.replace("DUMMY_TASK_ID", task_id[-12:])
+    return __render_template(__get_template(locale, email_type)["subject"], {"DUMMY_TASK_ID": task_id[-12:]})
 
-    return mail_subject
 
+def __gen_signer_list_str(signer_list):
+    signer_str_list = []
 
-def get_notify_mail_body(locale, file_name, single_signer_email):
-    # load email body
-    mail_body = __load_mail_body(locale, "email_to_notificant_1")
+    for signer in signer_list:
+        signing_time_str = datetime.utcfromtimestamp(
+            signer["signingTime"]).strftime("%Y/%m/%d %H:%M:%S UTC")
+        signer_str_list.append(f"{signer['name']} ({signing_time_str})<br>")
 
+    return "".join(signer_str_list)
+
+
+def get_error_mail_subject(locale, task_id):
+    return __render_mail_subject(locale, "email_to_notificant_0", task_id)
+
+
+def get_error_mail_body(locale, file_name, single_signer_email):
     # fill file name
-    mail_body = mail_body.replace("DUMMY_FILE_NAME", file_name)
+    value_dict = {"DUMMY_FILE_NAME": file_name}
+    removed_block_set = set()
 
     # fill single signer email
     if single_signer_email:
-        mail_body = mail_body.replace(
-            "DUMMY_SIGNER_EMAIL", single_signer_email)
+        value_dict["DUMMY_SIGNER_EMAIL"] = single_signer_email
     else:
-        mail_body = __remove_msg_block(
-            mail_body, BEGIN_SINGLE_SIGNER, END_SINGLE_SIGNER)
+        removed_block_set.add(BEGIN_SINGLE_SIGNER)
 
-    return mail_body
+    return __render_template(__get_template(locale, "email_to_notificant_0")["body"], value_dict, removed_block_set)
 
 
-def get_confirm_mail_subject(locale, task_id):
-    # load email subject
-    mail_subject = __load_mail_subject(locale, "email_to_signer_1")
+def get_notify_mail_subject(locale, task_id):
+    return __render_mail_subject(locale, "email_to_notificant_1", task_id)
 
-    # fill task id
-    mail_subject = mail_subject.replace("DUMMY_TASK_ID", task_id[-12:])
 
-    return mail_subject
+def get_notify_mail_body(locale, file_name, single_signer_email):
+    # fill file name
+    value_dict = {"DUMMY_FILE_NAME": file_name}
+    removed_block_set = set()
 
+    # fill single signer email
+    if single_signer_email:
+        value_dict["DUMMY_SIGNER_EMAIL"] = single_signer_email
+    else:
+        removed_block_set.add(BEGIN_SINGLE_SIGNER)
 
-def get_confirm_mail_body(locale, sender, signer_name, custom_message, confirm_link, signer_phone):
-    # load email body
-    mail_body = __load_mail_body(locale, "email_to_signer_1")
+    return __render_template(__get_template(locale, "email_to_notificant_1")["body"], value_dict, removed_block_set)
 
-    # fill signer name
-    mail_body = mail_body.replace("DUMMY_SIGNER_NAME", signer_name)
 
-    # fill sender
-    mail_body = mail_body.replace("DUMMY_SENDER", sender)
+def get_confirm_mail_subject(locale, task_id):
+    return __render_mail_subject(locale, "email_to_signer_1", task_id)
 
-    # fill custom message
-    mail_body = mail_body.replace("DUMMY_CUSTOM_MESSAGE", html.escape(
-        custom_message).replace("\n", "<br>"))
 
-    # fill confirm link
-    mail_body = mail_body.replace("DUMMY_SIGNER_CONFIRM_LINK", confirm_link)
+def get_confirm_mail_body(locale, sender, signer_name, custom_message, confirm_link, signer_phone):
+    # fill signer name, sender, custom message and confirm link
+    value_dict = {
+        "DUMMY_SIGNER_NAME": signer_name,
+        "DUMMY_SENDER": sender,
+        "DUMMY_CUSTOM_MESSAGE": html.escape(custom_message).replace("\n", "<br>"),
+        "DUMMY_SIGNER_CONFIRM_LINK": confirm_link
+    }
+    removed_block_set = set()
 
     # set sms notice
     if signer_phone:
-        mail_body = mail_body.replace("DUMMY_SIGNER_PHONE", signer_phone)
+        value_dict["DUMMY_SIGNER_PHONE"] = signer_phone
     else:
-        mail_body = __remove_msg_block(
-            mail_body, BEGIN_SMS_NOTICE, END_SMS_NOTICE)
+        removed_block_set.add(BEGIN_SMS_NOTICE)
 
-    return mail_body
+    return __render_template(__get_template(locale, "email_to_signer_1")["body"], value_dict, removed_block_set)
 
 
 def get_signed_event_mail_subject(locale, task_id):
-    # load email subject
-    mail_subject = __load_mail_subject(locale, "email_to_notificant_2")
-
-    # fill task id
-    mail_subject = mail_subject.replace("DUMMY_TASK_ID", task_id[-12:])
-
-    return mail_subject
+    return __render_mail_subject(locale, "email_to_notificant_2", task_id)
 
 
 def get_signed_event_mail_body(locale, file_name, signer_list):
-    # load email body
-    mail_body = __load_mail_body(locale, "email_to_notificant_2")
-
-    # fill file name
-    mail_body = mail_body.replace("DUMMY_FILE_NAME", file_name)
-
-    # fill signers
-    signer_list_str = ""
-    for signer in signer_list:
-        signing_time_str = datetime.utcfromtimestamp(
-            signer["signingTime"]).strftime("%Y/%m/%d %H:%M:%S UTC")
-        signer_list_str = signer_list_str + \
-            f"{signer['name']} ({signing_time_str})<br>"
-    mail_body = mail_body.replace("DUMMY_SIGNER_LIST", signer_list_str)
+    # fill file name and signers
+    value_dict = {
+        "DUMMY_FILE_NAME": file_name,
+        "DUMMY_SIGNER_LIST": __gen_signer_list_str(signer_list)
+    }
 
-    return mail_body
+    return __render_template(__get_template(locale, "email_to_notificant_2")["body"], value_dict)
 
 
 def get_notificant_final_mail_subject(locale, task_id):
-    # load email subject
-    mail_subject = __load_mail_subject(locale, "email_to_notificant_3")
-
-    # fill task id
-    mail_subject = mail_subject.replace("DUMMY_TASK_ID", task_id[-12:])
-
-    return mail_subject
+    return __render_mail_subject(locale, "email_to_notificant_3", task_id)
 
 
 def get_notificant_final_mail_body(locale, file_name, signer_list):
-    # load email body
-    mail_body = __load_mail_body(locale, "email_to_notificant_3")
+    # fill file name and signers
+    value_dict = {
+        "DUMMY_FILE_NAME": file_name,
+        "DUMMY_SIGNER_LIST": __gen_signer_list_str(signer_list)
+    }
 
-    # fill file name
-    mail_body = mail_body.replace("DUMMY_FILE_NAME", file_name)
-
-    # fill signers
-    signer_list_str = ""
-    for signer in signer_list:
-        signing_time_str = datetime.utcfromtimestamp(
-            signer["signingTime"]).strftime("%Y/%m/%d %H:%M:%S UTC")
-        signer_list_str = signer_list_str + \
-            f"{signer['name']} ({signing_time_str})<br>"
-    mail_body = mail_body.replace("DUMMY_SIGNER_LIST", signer_list_str)
-
-    return mail_body
+    return __render_template(__get_template(locale, "email_to_notificant_3")["body"], value_dict)
 
 
 def get_signer_final_mail_subject(locale, task_id):
-    # load email subject
-    mail_subject = __load_mail_subject(locale, "email_to_signer_2")
-
-    # fill task id
-    mail_subject = mail_subject.replace("DUMMY_TASK_ID", task_id[-12:])
-
-    return mail_subject
+    return __render_mail_subject(locale, "email_to_signer_2", task_id)
 
 
 def get_signer_final_mail_body(locale):
-    # load email body
-    mail_body = __load_mail_body(locale, "email_to_signer_2")
-
-    return mail_body
+    return __render_template(__get_template(locale, "email_to_signer_2")["body"], {})
@@ -1,8 +1,12 @@
 import logging
 
-from jsonschema import validate, exceptions
+from jsonschema import exceptions
+from jsonschema.validators import validator_for
 from jsonschema._format import draft7_format_checker
 
+# validators are built once per schema, the schema itself is checked only then
+__validator_dict = {}
+
 # json schema for getJob parameters
 get_job_params_schema = {
     "type": "object",
@@ -141,9 +145,18 @@ task_decrypted_email_config_schema = {
                         "serviceProvider": {"type": "string", "enum": ["ses"]},
                         "sesSMTPUsername": {"type": "string", "minLength": 1, "maxLength": 256},
                         "sesSMTPPassword": {"type": "string", "minLength": 1, "maxLength": 256},
-                        "sesDomain": {"type": "string", "minLength": 1, "maxLength": 256}
+                        "sesDomain": {"type": "string", "minLength": 1, "maxLength": 256},
+                        "sesTransport": {"type": "string", "enum": ["smtp", "api"]},
+                        "sesAPIKeyID": {"type": "string", "minLength": 1, "maxLength": 256},
+                        "sesAPIKeySecret": {"type": "string", "minLength": 1, "maxLength": 256}
+                    },
+                    "required": ["serviceProvider", "sesDomain"],
+                    "if": {
+                        "properties": {"sesTransport": {"const": "api"}},
+                        "required": ["sesTransport"]
                     },
-                    "required": ["serviceProvider", "sesSMTPUsername", "sesSMTPPassword", "sesDomain"]
+                    "then": {"required": ["sesAPIKeyID", "sesAPIKeySecret"]},
+                    "else": {"required": ["sesSMTPUsername", "sesSMTPPassword"]}
                 },
                 {
                     "type": "object",
@@ -234,7 +247,7 @@ send_req_job_schema = {
         "taskID": {"type": "string", "minLength": 1, "maxLength": 256},
         "subTaskID": {"type": "string", "minLength": 1, "maxLength": 256},
         "taskPayload": task_payload_schema,
-        "signerIdx": {"type": "number", "minimum": 0, "maximum": 999},
+        "signerIdx": {"type": "integer", "minimum": 0, "maximum": 999},
         "taskPassword": {"type": "string", "minLength": 1, "maxLength": 256},
         "extraData": {
             "type": "object",
@@ -250,6 +263,40 @@ send_req_job_schema = {
     "required": ["taskPassword", "taskID", "subTaskID", "taskPayload", "signerIdx", "extraData"]
 }
 
+# json schema for batched sendReq data
+send_req_batch_job_schema = {
+    "type": "object",
+    "properties": {
+        "taskID": {"type": "string", "minLength": 1, "maxLength": 256},
+        "subTaskList": {
+            "type": "array",
+            "minItems": 1,
+            "maxItems": 1000,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "subTaskID": {"type": "string", "minLength": 1, "maxLength": 256},
+                    "signerIdx": {"type": "integer", "minimum": 0, "maximum": 999}
+                },
+                "required": ["subTaskID", "signerIdx"]
+            }
+        },
+        "taskPayload": task_payload_schema,
+        "taskPassword": {"type": "string", "minLength": 1, "maxLength": 256},
+        "extraData": {
+            "type": "object",
+            "properties": {
+                "kmsKeyID": {"type": "string", "minLength": 1, "maxLength": 256},
+                "kmsKeySecret": {"type": "string", "minLength": 1, "maxLength": 256},
+                "apiVersion": {"type": "string", "minLength": 1, "maxLength": 1024},
+                "auxData": {"type": "string", "maxLength": 1024}
+            },
+            "required": ["kmsKeyID", "kmsKeySecret", "apiVersion", "auxData"]
+        }
+    },
+    "required": ["taskPassword", "taskID", "subTaskList", "taskPayload", "extraData"]
+}
+
 # json schema for confirmIntent data
 confirm_intent_job_schema = {
     "type": "object",
@@ -310,11 +357,33 @@ attach_esig_data_schema = {
 }
 
 
+def __get_validator(schema):
+    validator_entry = __validator_dict.get(id(schema))
+
+    if validator_entry is None or validator_entry[0] is not schema:
+        validator_cls = validator_for(schema)
+        validator_cls.check_schema(schema)
+        validator_entry = (schema, validator_cls(
+            schema, format_checker=draft7_format_checker))
+        __validator_dict[id(schema)] = validator_entry
+
+    return validator_entry[1]
+
+
 def verify_param_with_schema(params, schema):
     try:
-        validate(instance=params, schema=schema,
-                 format_checker=draft7_format_checker)
+        # report the same error as jsonschema.validate
+        error = exceptions.best_match(__get_validator(schema).iter_errors(params))
+        if error is not None:
+            raise error
+
         return True
     except exceptions.ValidationError as e:
         logging.error(e.message)
         return False
+
+
+# build validators of the schemas verified per job in advance
+for job_schema in [get_job_params_schema, send_req_job_schema, send_req_batch_job_schema, confirm_intent_job_schema, attach_esig_data_schema,
+                   task_decrypted_task_config_schema, task_decrypted_email_config_schema, task_decrypted_twilio_config_schema, task_decrypted_binding_data_schema]:
+    __get_validator(job_schema)
@@ -0,0 +1,177 @@
+import io
+import re
+
+from pikepdf import Pdf, Name, Array, Dictionary
+from reportlab.pdfgen import canvas
+from reportlab.pdfbase import pdfmetrics
+
+BFCHAR_BLOCK_PATTERN = re.compile(rb"beginbfchar(.*?)endbfchar", re.S)
+BFCHAR_ITEM_PATTERN = re.compile(rb"<([0-9A-Fa-f]+)>\s*<([0-9A-Fa-f]+)>")
+
+# pre-embedded font subsets shared by all documents in this process
+__resource_pdf = None
+__font_resource_dict = {}
+__font_code_dict = {}
+
+
+def __parse_to_unicode(to_unicode_bytes):
+    code_dict = {}
+
+    for block in BFCHAR_BLOCK_PATTERN.findall(to_unicode_bytes):
+        for code_hex, unicode_hex in BFCHAR_ITEM_PATTERN.findall(block):
+            unicode_value = int(unicode_hex, 16)
+
+            if unicode_value != 0:
+                code_dict[chr(unicode_value)] = int(code_hex, 16)
+
+    return code_dict
+
+
+def init(font_charset_dict):
+    global __resource_pdf
+
+    # embed the known charset of each font once by reportlab, one font per page
+    packet = io.BytesIO()
+    can = canvas.Canvas(packet)
+    font_name_list = list(font_charset_dict.keys())
+
+    for font_name in font_name_list:
+        # chars without a glyph in the font are left to reportlab
+        glyph_dict = pdfmetrics.getFont(font_name).face.charToGlyph
+
+        can.setFont(font_name, 10)
+        can.drawString(0, 0, "".join(
+            [char for char in sorted(set(font_charset_dict[font_name])) if ord(char) in glyph_dict]))
+        can.showPage()
+
+    can.save()
+    packet.seek(0)
+
+    __resource_pdf = Pdf.open(packet)
+    __font_resource_dict.clear()
+    __font_code_dict.clear()
+
+    # map each char to the subset and code embedded by reportlab
+    for page_idx, font_name in enumerate(font_name_list):
+        __font_code_dict[font_name] = {}
+
+        for resource_name, font_obj in __resource_pdf.pages[page_idx].Resources.Font.items():
+            if "/ToUnicode" not in font_obj:
+                continue
+
+            __font_resource_dict[resource_name] = font_obj
+            for char, code in __parse_to_unicode(font_obj.ToUnicode.read_bytes()).items():
+                __font_code_dict[font_name][char] = (resource_name, code)
+
+
+def get_font_resource(resource_name):
+    return __font_resource_dict[resource_name]
+
+
+# the subset and code of a char, or None if the char is not pre-embedded or the
+# font has no glyph for it
+def get_font_code(font_name, char):
+    return __font_code_dict.get(font_name, {}).get(char)
+
+
+# a minimal subset of the reportlab canvas interface used by the page render
+# functions, which writes PDF content stream operators directly, a page with
+# text that can not be encoded is marked and has to be drawn by reportlab
+class DirectCanvas():
+    def __init__(self):
+        self.page_list = []
+        self.page_size = None
+        self.op_list = []
+        self.resource_name_set = set()
+        self.is_page_encodable = True
+        self.font_name = None
+        self.font_size = None
+        self.copied_font_dict = {}
+
+    def __fmt_num(self, value):
+        return f"{value:.4f}"
+
+    def setPageSize(self, page_size):
+        self.page_size = page_size
+
+    def setLineWidth(self, width):
+        self.op_list.append(f"{self.__fmt_num(width)} w")
+
+    def setStrokeColorRGB(self, red, green, blue):
+        self.op_list.append(
+            f"{self.__fmt_num(red)} {self.__fmt_num(green)} {self.__fmt_num(blue)} RG")
+
+    def setFillColorRGB(self, red, green, blue):
+        self.op_list.append(
+            f"{self.__fmt_num(red)} {self.__fmt_num(green)} {self.__fmt_num(blue)} rg")
+
+    def line(self, x1, y1, x2, y2):
+        self.op_list.append(
+            f"{self.__fmt_num(x1)} {self.__fmt_num(y1)} m {self.__fmt_num(x2)} {self.__fmt_num(y2)} l S")
+
+    def setFont(self, font_name, font_size):
+        self.font_name = font_name
+        self.font_size = font_size
+
+    def drawString(self, x_pos, y_pos, text):
+        font_code_list = [get_font_code(self.font_name, char) for char in text]
+        if None in font_code_list:
+            self.is_page_encodable = False
+            return
+
+        text_op_list = [
+            "BT", f"{self.__fmt_num(x_pos)} {self.__fmt_num(y_pos)} Td"]
+        current_resource_name = None
+        code_bytes = bytearray()
+
+        # split text into runs of the same font subset
+        for resource_name, code in font_code_list:
+
+            if resource_name != current_resource_name:
+                if len(code_bytes) > 0:
+                    text_op_list.append(f"<{code_bytes.hex()}> Tj")
+                    code_bytes = bytearray()
+
+                text_op_list.append(
+                    f"{resource_name} {self.__fmt_num(self.font_size)} Tf")
+                self.resource_name_set.add(resource_name)
+                current_resource_name = resource_name
+
+            code_bytes.append(code)
+
+        if len(code_bytes) > 0:
+            text_op_list.append(f"<{code_bytes.hex()}> Tj")
+
+        text_op_list.append("ET")
+        self.op_list.append(" ".join(text_op_list))
+
+    def showPage(self):
+        self.page_list.append(
+            (self.page_size, self.op_list, self.resource_name_set))
+        self.discardPage()
+
+    def discardPage(self):
+        self.op_list = []
+        self.resource_name_set = set()
+        self.is_page_encodable = True
+
+    def gen_overlay_form(self, pdf_obj, page_idx):
+        page_size, op_list, resource_name_set = self.page_list[page_idx]
+        font_dict = Dictionary()
+
+        # copy the pre-embedded fonts once per document
+        for resource_name in resource_name_set:
+            if resource_name not in self.copied_font_dict:
+                self.copied_font_dict[resource_name] = pdf_obj.copy_foreign(
+                    get_font_resource(resource_name))
+
+            font_dict[resource_name] = self.copied_font_dict[resource_name]
+
+        overlay_form = pdf_obj.make_stream(
+            "\n".join(op_list).encode("utf-8"))
+        overlay_form.Type = Name.XObject
+        overlay_form.Subtype = Name.Form
+        overlay_form.BBox = Array([0, 0, page_size[0], page_size[1]])
+        overlay_form.Resources = Dictionary(Font=font_dict)
+
+        return overlay_form
@@ -1,13 +1,17 @@
 import io
 import base64
 import logging
+import tempfile
 import traceback
 
-from pikepdf import Pdf, Page, Encryption
+from pikepdf import Pdf, Page, Name, Array, Dictionary, Encryption, ObjectStreamMode
 from reportlab.pdfgen import canvas
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 
+from lib import config_util
+from lib import pdf_direct_util
+from lib import pdf_update_util
 from lib.pdf_font_util import DANCING_SCRIPT_UNICODE_TABLE
 
 LINE_WIDTH = 6
@@ -21,6 +25,27 @@ HANAMIN_FONT_FACTOR = 1.2
 FIELD_TYPE_SIGNATURE = 0
 FIELD_TYPE_DATE = 1
 
+# save mode of signed pdfs, set by "signed_pdf_save" in the tee server config, the
+# incremental one appends the overlays to the original bytes instead of rewriting
+# the whole pdf, encrypted and repaired templates are always rewritten
+SIGNED_PDF_SAVE_FULL = "full"
+SIGNED_PDF_SAVE_INCREMENTAL = "incremental"
+
+# compact profile of full saves: pack objects into object streams, recompress
+# all streams and drop unused resources, at the cost of more cpu time
+COMPACT_OUTPUT = False
+
+# renderer of page overlays, set by "overlay_renderer" in the tee server config,
+# the direct one writes content streams without reportlab
+OVERLAY_RENDERER_REPORTLAB = "reportlab"
+OVERLAY_RENDERER_DIRECT = "direct"
+
+# keep large documents in temporary files instead of memory buffers, the root
+# filesystem of enclave is memory backed so the files work as tmpfs
+LARGE_DOCUMENT_MIN_SIZE = 8 * 1024 * 1024
+LARGE_DOCUMENT_TMP_DIR = "/tmp"
+B64_CHUNK_SIZE = 3 * 1024 * 1024
+
 SEAL_IMAGE_FILE_PATH = "/server/resources/img/seal.png"
 HANAMIN_FONT_FILE_PATH = "/server/resources/font/HanaMinA.ttf"
 INCONSOLATA_FONT_FILE_PATH = "/server/resources/font/Inconsolata-Regular.ttf"
@@ -36,6 +61,25 @@ def __check_unicode_exist(font_unicode_table, code):
     return False
 
 
+def __get_direct_font_charset_dict():
+    ascii_charset = "".join([chr(code) for code in range(0x20, 0x7F)])
+
+    return {
+        "HanaMinA": ascii_charset + "".join(__get_sign_hint_msg("zh-tw") + __get_sign_hint_msg("en-us")),
+        "Inconsolata-Regular": ascii_charset
+    }
+
+
+def __get_signed_pdf_save_mode():
+    return config_util.get_config_choice("signed_pdf_save", SIGNED_PDF_SAVE_FULL, [
+        SIGNED_PDF_SAVE_FULL, SIGNED_PDF_SAVE_INCREMENTAL])
+
+
+def __get_overlay_renderer():
+    return config_util.get_config_choice("overlay_renderer", OVERLAY_RENDERER_REPORTLAB, [
+        OVERLAY_RENDERER_REPORTLAB, OVERLAY_RENDERER_DIRECT])
+
+
 def __get_sign_hint_msg(locale):
     lowercase_locale = locale.lower()
 
@@ -98,14 +142,8 @@ def __draw_sign_hint(canvas_obj, page_height, x_pos, y_pos, height, locale):
                               2 + pdfmetrics.getAscent("HanaMinA", hint_font_size) * HANAMIN_FONT_FACTOR * (index + 1)), msg)
 
 
-def __draw_sig_field(is_preview, canvas_obj, page_height, x_pos, y_pos, height, name, magic_number, signer_idx):
-    # draw seal image
-    __draw_seal_image(canvas_obj, page_height, x_pos, y_pos, height)
-
-    x_offset = height
+def __get_signature_font(name):
     signature_font = "DancingScript-Regular"
-    signature_font_size = 1
-    info_font_size = height / 5
 
     # choose font for signature
     for char in name:
@@ -113,6 +151,12 @@ def __draw_sig_field(is_preview, canvas_obj, page_height, x_pos, y_pos, height,
             signature_font = "JasonHandwriting2-Regular"
             break
 
+    return signature_font
+
+
+def __get_signature_font_size(signature_font, height):
+    signature_font_size = 1
+
     # find best fit font size
     while True:
         render_height = pdfmetrics.getAscent(
@@ -124,6 +168,24 @@ def __draw_sig_field(is_preview, canvas_obj, page_height, x_pos, y_pos, height,
             signature_font_size -= 0.1
             break
 
+    return signature_font_size
+
+
+def __get_sig_magic_number_msg(magic_number, signer_idx):
+    signer_idx_str = f"00{signer_idx}"[-2:]
+
+    return f"{magic_number} ({signer_idx_str})"
+
+
+def __draw_sig_field(is_preview, canvas_obj, page_height, x_pos, y_pos, height, name, magic_number, signer_idx):
+    # draw seal image
+    __draw_seal_image(canvas_obj, page_height, x_pos, y_pos, height)
+
+    x_offset = height
+    signature_font = __get_signature_font(name)
+    signature_font_size = __get_signature_font_size(signature_font, height)
+    info_font_size = height / 5
+
     # draw signature name
     canvas_obj.setFillColorRGB(0.015, 0.109, 0.674)
     canvas_obj.setFont(signature_font, signature_font_size)
@@ -134,9 +196,76 @@ def __draw_sig_field(is_preview, canvas_obj, page_height, x_pos, y_pos, height,
     if not is_preview:
         canvas_obj.setFillColorRGB(0, 0, 0)
         canvas_obj.setFont("Inconsolata-Regular", info_font_size)
-        signer_idx_str = f"00{signer_idx}"[-2:]
         canvas_obj.drawString(x_pos + x_offset + SIG_MSG_X_OFFSET, page_height - (y_pos + height -
-                              pdfmetrics.getAscent("Inconsolata-Regular", info_font_size) / 5), f"{magic_number} ({signer_idx_str})")
+                              pdfmetrics.getAscent("Inconsolata-Regular", info_font_size) / 5), __get_sig_magic_number_msg(magic_number, signer_idx))
+
+
+def __get_text_bbox(font_name, font_size, x_pos, y_pos, text):
+    # each glyph lies in the font bounding box placed at its origin
+    font_bbox = pdfmetrics.getFont(font_name).face.bbox
+
+    return [x_pos + min(font_bbox[0], 0) * font_size / 1000, y_pos + font_bbox[1] * font_size / 1000,
+            x_pos + pdfmetrics.stringWidth(text, font_name, font_size) + max(font_bbox[2], 0) * font_size / 1000, y_pos + font_bbox[3] * font_size / 1000]
+
+
+def __draw_sig_block_page(canvas_obj, sig_block_key):
+    is_preview, name, magic_number, signer_idx, height = sig_block_key
+    signature_font = __get_signature_font(name)
+    signature_font_size = __get_signature_font_size(signature_font, height)
+    info_font_size = height / 5
+    text_x_pos = height + SIG_MSG_X_OFFSET
+
+    # bounding boxes of the seal image and the texts drawn by __draw_sig_field
+    bbox_list = [[0, 0, height, height], __get_text_bbox(signature_font, signature_font_size, text_x_pos,
+                                                         height - pdfmetrics.getAscent(signature_font, signature_font_size), name)]
+    if not is_preview:
+        bbox_list.append(__get_text_bbox("Inconsolata-Regular", info_font_size, text_x_pos, pdfmetrics.getAscent(
+            "Inconsolata-Regular", info_font_size) / 5, __get_sig_magic_number_msg(magic_number, signer_idx)))
+
+    block_bbox = [min([bbox[0] for bbox in bbox_list]), min([bbox[1] for bbox in bbox_list]),
+                  max([bbox[2] for bbox in bbox_list]), max([bbox[3] for bbox in bbox_list])]
+
+    # render signature block at the field height, as it would be drawn on the page
+    canvas_obj.setPageSize((block_bbox[2], height))
+    __draw_sig_field(is_preview, canvas_obj, height, 0, 0,
+                     height, name, magic_number, signer_idx)
+    canvas_obj.showPage()
+
+    return block_bbox
+
+
+def __gen_sig_block_form(pdf_obj, overlay_pdf, overlay_page_idx, block_bbox):
+    form_obj = pdf_obj.copy_foreign(
+        Page(overlay_pdf.pages[overlay_page_idx]).as_form_xobject())
+    form_obj.BBox = Array(block_bbox)
+
+    return form_obj
+
+
+def __add_page_overlay(pdf_obj, page_obj, page_width, page_height, overlay_form, sig_block_list):
+    if overlay_form is None:
+        overlay_form = pdf_obj.make_stream(b"")
+        overlay_form.Type = Name.XObject
+        overlay_form.Subtype = Name.Form
+        overlay_form.BBox = Array([0, 0, page_width, page_height])
+        overlay_form.Resources = Dictionary()
+
+    # place signature blocks on overlay
+    if len(sig_block_list) > 0:
+        if "/XObject" not in overlay_form.Resources:
+            overlay_form.Resources.XObject = Dictionary()
+
+        placement_list = []
+        for index, (sig_block_form, x_pos, y_pos) in enumerate(sig_block_list):
+            sig_block_name = f"/SigBlock{index}"
+            overlay_form.Resources.XObject[sig_block_name] = sig_block_form
+            placement_list.append(
+                f"q 1 0 0 1 {x_pos:.4f} {y_pos:.4f} cm {sig_block_name} Do Q")
+
+        overlay_form.write(b"".join([overlay_form.read_bytes(), "\n{}\n".format(
+            "\n".join(placement_list)).encode("utf-8")]))
+
+    page_obj.add_overlay(overlay_form)
 
 
 def __draw_text_field(canvas_obj, page_height, x_pos, y_pos, height, text):
@@ -148,13 +277,9 @@ def __draw_text_field(canvas_obj, page_height, x_pos, y_pos, height, text):
     canvas_obj.drawString(x_pos, page_height - (y_pos + height), text)
 
 
-def __preview_page_render_fn(page_obj, field_list_in_page):
-    page_width = float(page_obj.MediaBox[2] - page_obj.MediaBox[0])
-    page_height = float(page_obj.MediaBox[3] - page_obj.MediaBox[1])
-
+def __preview_page_render_fn(canvas_obj, page_width, page_height, field_list_in_page):
     needOverlay = False
-    packet = io.BytesIO()
-    can = canvas.Canvas(packet, pagesize=(page_width, page_height))
+    sig_block_list = []
 
     for field in field_list_in_page:
         __check_pdf_boundary(page_width, page_height,
@@ -164,79 +289,201 @@ def __preview_page_render_fn(page_obj, field_list_in_page):
             if field["signHint"]:
                 needOverlay = True
                 __draw_sign_hint(
-                    can, page_height, field["x"], field["y"], field["height"], field["locale"])
+                    canvas_obj, page_height, field["x"], field["y"], field["height"], field["locale"])
             else:
-                needOverlay = True
-                __draw_sig_field(
-                    True, can, page_height, field["x"], field["y"], field["height"], field["name"], "", field["idx"])
-
-    can.save()
-    packet.seek(0)
+                sig_block_list.append(((True, field["name"], "", field["idx"], field["height"]),
+                                       field["x"], page_height - (field["y"] + field["height"])))
 
-    if needOverlay:
-        new_pdf = Pdf.open(packet)
-        page_obj.add_overlay(Page(new_pdf.pages[0]))
+    return needOverlay, sig_block_list
 
 
-def __signed_page_render_fn(page_obj, field_list_in_page):
-    page_width = float(page_obj.MediaBox[2] - page_obj.MediaBox[0])
-    page_height = float(page_obj.MediaBox[3] - page_obj.MediaBox[1])
-
+def __signed_page_render_fn(canvas_obj, page_width, page_height, field_list_in_page):
     needOverlay = False
-    packet = io.BytesIO()
-    can = canvas.Canvas(packet, pagesize=(page_width, page_height))
+    sig_block_list = []
 
     for field in field_list_in_page:
         __check_pdf_boundary(page_width, page_height,
                              field["x"], field["y"], field["height"])
 
         if field["type"] == FIELD_TYPE_SIGNATURE:
-            needOverlay = True
-            __draw_sig_field(
-                False, can, page_height, field["x"], field["y"], field["height"], field["name"], field["magicNumber"], field["idx"])
+            sig_block_list.append(((False, field["name"], field["magicNumber"], field["idx"], field["height"]),
+                                   field["x"], page_height - (field["y"] + field["height"])))
         elif field["type"] == FIELD_TYPE_DATE:
             needOverlay = True
             __draw_text_field(
-                can, page_height, field["x"], field["y"], field["height"], field["signingTime"])
+                canvas_obj, page_height, field["x"], field["y"], field["height"], field["signingTime"])
 
-    can.save()
-    packet.seek(0)
+    return needOverlay, sig_block_list
 
-    if needOverlay:
-        new_pdf = Pdf.open(packet)
-        page_obj.add_overlay(Page(new_pdf.pages[0]))
 
+def __open_work_file(data_size):
+    if data_size >= LARGE_DOCUMENT_MIN_SIZE:
+        return tempfile.TemporaryFile(dir=LARGE_DOCUMENT_TMP_DIR)
 
-def __pdf_drawing_helper(pdf_bytes, field_list_by_page, render_fn):
-    input_pdf = Pdf.open(io.BytesIO(pdf_bytes))
-    output_pdf_stream = io.BytesIO()
+    return io.BytesIO()
 
-    for page_no in field_list_by_page:
-        if page_no < 1 or page_no > len(input_pdf.pages):
-            raise Exception("pageNo of filed is out of range")
 
-        render_fn(input_pdf.pages[page_no - 1], field_list_by_page[page_no])
+def __decode_b64_to_file(data_b64, file_obj):
+    b64_chunk_size = B64_CHUNK_SIZE // 3 * 4
+    leftover_b64 = ""
 
-    input_pdf.save(output_pdf_stream, min_version="1.7")
-    return output_pdf_stream.getvalue()
+    for chunk_start in range(0, len(data_b64), b64_chunk_size):
+        # drop whitespace (e.g. line breaks) and decode a multiple of 4 characters,
+        # the rest is carried over to next chunk
+        chunk_b64 = leftover_b64 + \
+            "".join(data_b64[chunk_start:chunk_start + b64_chunk_size].split())
+        decode_size = len(chunk_b64) // 4 * 4
 
+        file_obj.write(base64.b64decode(chunk_b64[:decode_size]))
+        leftover_b64 = chunk_b64[decode_size:]
 
-def __pdf_encryption_helper(pdf_bytes, access_key):
-    input_pdf = Pdf.open(io.BytesIO(pdf_bytes))
-    output_pdf_stream = io.BytesIO()
+    if len(leftover_b64) > 0:
+        file_obj.write(base64.b64decode(leftover_b64))
 
-    input_pdf.save(output_pdf_stream, min_version="1.7",
-                   encryption=Encryption(owner=access_key, user=access_key))
-    return output_pdf_stream.getvalue()
+    file_obj.seek(0)
 
 
-def __pdf_metadata_helper(pdf_bytes):
+def __encode_file_to_b64(file_obj):
+    # the returned string is the only full copy besides the buffer it is decoded
+    # from, the raw pdf bytes are only read in chunks
+    file_size = file_obj.seek(0, io.SEEK_END)
+    data_b64 = bytearray((file_size + 2) // 3 * 4)
+    b64_pos = 0
+
+    file_obj.seek(0)
+    while True:
+        chunk_bytes = file_obj.read(B64_CHUNK_SIZE)
+        if len(chunk_bytes) == 0:
+            break
+
+        chunk_b64 = base64.b64encode(chunk_bytes)
+        data_b64[b64_pos:b64_pos + len(chunk_b64)] = chunk_b64
+        b64_pos += len(chunk_b64)
+
+    return data_b64.decode("ascii")
+
+
+def __pdf_drawing_helper(input_pdf_file, field_list_by_page, render_fn, output_pdf_file, access_key=None, incremental=False):
+    # qpdf memory-maps the input if it is backed by a file, the input is
+    # released before its work file is closed, even if drawing fails
+    with Pdf.open(input_pdf_file) as input_pdf:
+        update_writer = None
+        sig_block_page_idx = {}
+
+        # incremental update is not applicable to encrypted pdf
+        if incremental and not access_key and not input_pdf.is_encrypted:
+            update_writer = pdf_update_util.IncrementalUpdateWriter(input_pdf)
+
+        page_overlay_list = []
+        # draw all overlays in one document, so each font subset is embedded once
+        packet = io.BytesIO()
+        can = canvas.Canvas(packet)
+        direct_can = pdf_direct_util.DirectCanvas(
+        ) if __get_overlay_renderer() == OVERLAY_RENDERER_DIRECT else None
+        reportlab_page_count = 0
+        overlay_pdf = None
+
+        for page_no in field_list_by_page:
+            if page_no < 1 or page_no > len(input_pdf.pages):
+                raise Exception("pageNo of filed is out of range")
+
+            page_obj = input_pdf.pages[page_no - 1]
+            page_width = float(page_obj.MediaBox[2] - page_obj.MediaBox[0])
+            page_height = float(page_obj.MediaBox[3] - page_obj.MediaBox[1])
+
+            page_can = direct_can if direct_can else can
+            page_can.setPageSize((page_width, page_height))
+            need_overlay, sig_block_list = render_fn(
+                page_can, page_width, page_height, field_list_by_page[page_no])
+
+            # draw the page by reportlab if the direct renderer can not encode its text
+            if page_can is direct_can and not direct_can.is_page_encodable:
+                direct_can.discardPage()
+                page_can = can
+                page_can.setPageSize((page_width, page_height))
+                need_overlay, sig_block_list = render_fn(
+                    page_can, page_width, page_height, field_list_by_page[page_no])
+
+            overlay_page_idx = None
+            if need_overlay:
+                page_can.showPage()
+
+                if page_can is direct_can:
+                    overlay_page_idx = len(direct_can.page_list) - 1
+                else:
+                    overlay_page_idx = reportlab_page_count
+                    reportlab_page_count += 1
+
+            for sig_block_key, _, _ in sig_block_list:
+                sig_block_page_idx[sig_block_key] = None
+
+            page_overlay_list.append(
+                (page_obj, page_width, page_height, page_can is direct_can, overlay_page_idx, sig_block_list))
+
+        # draw each signature block once for each field height
+        sig_block_bbox = {}
+        for sig_block_key in sig_block_page_idx:
+            sig_block_bbox[sig_block_key] = __draw_sig_block_page(
+                can, sig_block_key)
+            sig_block_page_idx[sig_block_key] = reportlab_page_count
+            reportlab_page_count += 1
+
+        if reportlab_page_count > 0:
+            can.save()
+            packet.seek(0)
+            overlay_pdf = Pdf.open(packet)
+
+        sig_block_form = {}
+        for sig_block_key, overlay_page_idx in sig_block_page_idx.items():
+            sig_block_form[sig_block_key] = __gen_sig_block_form(
+                input_pdf, overlay_pdf, overlay_page_idx, sig_block_bbox[sig_block_key])
+
+        # graft overlays on pages
+        for page_obj, page_width, page_height, is_direct_overlay, overlay_page_idx, sig_block_list in page_overlay_list:
+            if overlay_page_idx is None and len(sig_block_list) == 0:
+                continue
+
+            if update_writer:
+                update_writer.track_page(page_obj)
+
+            overlay_form = None
+            if overlay_page_idx is not None:
+                if is_direct_overlay:
+                    overlay_form = direct_can.gen_overlay_form(
+                        input_pdf, overlay_page_idx)
+                else:
+                    overlay_form = input_pdf.copy_foreign(
+                        Page(overlay_pdf.pages[overlay_page_idx]).as_form_xobject())
+
+            __add_page_overlay(input_pdf, page_obj, page_width, page_height, overlay_form, [
+                (sig_block_form[sig_block_key], x_pos, y_pos) for sig_block_key, x_pos, y_pos in sig_block_list])
+
+        # append changes to the original bytes, fallback to full rewrite if not applicable
+        if not update_writer or not update_writer.write_updated_pdf(input_pdf_file, output_pdf_file):
+            save_option_dict = {"min_version": "1.7"}
+
+            if COMPACT_OUTPUT:
+                input_pdf.remove_unreferenced_resources()
+                save_option_dict["object_stream_mode"] = ObjectStreamMode.generate
+                save_option_dict["compress_streams"] = True
+                save_option_dict["recompress_flate"] = True
+
+            # encrypt within the same save if needed
+            if access_key:
+                save_option_dict["encryption"] = Encryption(
+                    owner=access_key, user=access_key)
+
+            input_pdf.save(output_pdf_file, **save_option_dict)
+
+
+def __pdf_metadata_helper(output_pdf_file):
     metadata = "letsesign=true\n"
 
-    if pdf_bytes[-1] != 10:
+    output_pdf_file.seek(-1, io.SEEK_END)
+    if output_pdf_file.read(1) != b"\n":
         metadata = f"\n{metadata}"
 
-    return b"".join([pdf_bytes, metadata.encode("utf-8")])
+    output_pdf_file.write(metadata.encode("utf-8"))
 
 
 def init():
@@ -248,6 +495,12 @@ def init():
     pdfmetrics.registerFont(
         TTFont("JasonHandwriting2-Regular", JASON_HANDWRITING_FONT_FILE_PATH))
 
+    # check the settings before the first job
+    __get_signed_pdf_save_mode()
+
+    if __get_overlay_renderer() == OVERLAY_RENDERER_DIRECT:
+        pdf_direct_util.init(__get_direct_font_charset_dict())
+
 
 def gen_preview_pdf(pdf_b64, signer_list, password):
     out_pdf_b64 = None
@@ -275,18 +528,13 @@ def gen_preview_pdf(pdf_b64, signer_list, password):
                     "type": field["type"]
                 })
 
-        output_drew_pdf_bytes = __pdf_drawing_helper(base64.b64decode(
-            pdf_b64), field_list_by_page, __preview_page_render_fn)
-
-        # encrypt pdf if needed
-        if password:
-            output_encrypted_pdf_bytes = __pdf_encryption_helper(
-                output_drew_pdf_bytes, password)
-            out_pdf_b64 = base64.b64encode(
-                output_encrypted_pdf_bytes).decode("utf-8")
-        else:
-            out_pdf_b64 = base64.b64encode(
-                output_drew_pdf_bytes).decode("utf-8")
+        # draw and encrypt (if needed) pdf in a single save
+        pdf_size = len(pdf_b64) // 4 * 3
+        with __open_work_file(pdf_size) as input_pdf_file, __open_work_file(pdf_size) as output_pdf_file:
+            __decode_b64_to_file(pdf_b64, input_pdf_file)
+            __pdf_drawing_helper(input_pdf_file, field_list_by_page,
+                                 __preview_page_render_fn, output_pdf_file, password)
+            out_pdf_b64 = __encode_file_to_b64(output_pdf_file)
     except BaseException as e:
         logging.error(traceback.format_exc())
 
@@ -322,12 +570,13 @@ def gen_signed_pdf(pdf_b64, signer_list, magic_number):
                     "type": field["type"]
                 })
 
-        output_drew_pdf_bytes = __pdf_drawing_helper(base64.b64decode(
-            pdf_b64), field_list_by_page, __signed_page_render_fn)
-        output_metadata_pdf_bytes = __pdf_metadata_helper(
-            output_drew_pdf_bytes)
-        out_pdf_b64 = base64.b64encode(
-            output_metadata_pdf_bytes).decode("utf-8")
+        pdf_size = len(pdf_b64) // 4 * 3
+        with __open_work_file(pdf_size) as input_pdf_file, __open_work_file(pdf_size) as output_pdf_file:
+            __decode_b64_to_file(pdf_b64, input_pdf_file)
+            __pdf_drawing_helper(input_pdf_file, field_list_by_page, __signed_page_render_fn,
+                                 output_pdf_file, None, __get_signed_pdf_save_mode() == SIGNED_PDF_SAVE_INCREMENTAL)
+            __pdf_metadata_helper(output_pdf_file)
+            out_pdf_b64 = __encode_file_to_b64(output_pdf_file)
     except BaseException as e:
         logging.error(traceback.format_exc())
 
@@ -0,0 +1,230 @@
+import io
+import re
+import zlib
+import shutil
+
+from pikepdf import Page, Name, Object, Dictionary, Array, Stream
+
+STARTXREF_PATTERN = re.compile(rb"startxref\s+(\d+)")
+STARTXREF_SEARCH_SIZE = 1024
+XREF_STREAM_FIELD_WIDTH = [1, 4, 2]
+RECOMPRESSIBLE_FILTER_LIST = ["/ASCII85Decode", "/FlateDecode"]
+
+
+# keep the original pdf bytes verbatim and append only the modified page
+# objects, the newly created overlay objects and a new xref section
+class IncrementalUpdateWriter():
+    def __init__(self, pdf_obj):
+        self.pdf_obj = pdf_obj
+        self.target_snapshot = {}
+
+        # every object made after the marker belongs to the update section
+        self.new_obj_marker = pdf_obj.make_indirect(Dictionary()).objgen[0]
+
+    def __snapshot(self, obj):
+        if isinstance(obj, Stream):
+            return obj.stream_dict.unparse(resolved=True)
+
+        return obj.unparse(resolved=True)
+
+    def track_page(self, page_obj):
+        page_dict = Page(page_obj).obj
+        target_list = [page_dict]
+
+        # attributes inherited from the page tree nodes are pushed down to the page by qpdf
+        parent_dict = page_dict.get("/Parent")
+        while isinstance(parent_dict, Dictionary) and parent_dict.is_indirect and parent_dict.objgen not in [target.objgen for target in target_list]:
+            target_list.append(parent_dict)
+            parent_dict = parent_dict.get("/Parent")
+
+        # collect objects which may be modified when placing an overlay
+        for key in ["/Resources", "/Contents"]:
+            if key in page_dict:
+                value = page_dict[key]
+
+                if value.is_indirect:
+                    target_list.append(value)
+
+                if key == "/Resources" and isinstance(value, Dictionary):
+                    for _, sub_value in value.items():
+                        if isinstance(sub_value, Object) and sub_value.is_indirect:
+                            target_list.append(sub_value)
+
+        for target in target_list:
+            if target.objgen not in self.target_snapshot:
+                self.target_snapshot[target.objgen] = (
+                    target, self.__snapshot(target))
+
+    def __collect_new_objs(self, obj, obj_dict):
+        if isinstance(obj, Stream):
+            child_list = [child for _, child in obj.stream_dict.items()]
+        elif isinstance(obj, Dictionary):
+            child_list = [child for _, child in obj.items()]
+        elif isinstance(obj, Array):
+            child_list = list(obj)
+        else:
+            return
+
+        for child in child_list:
+            # scalar values are converted to python types by pikepdf
+            if not isinstance(child, Object):
+                continue
+
+            if child.is_indirect:
+                if child.objgen[0] > self.new_obj_marker and child.objgen not in obj_dict:
+                    obj_dict[child.objgen] = child
+                    self.__collect_new_objs(child, obj_dict)
+            else:
+                self.__collect_new_objs(child, obj_dict)
+
+    def __is_recompressible(self, stream_obj):
+        if "/DecodeParms" in stream_obj.stream_dict:
+            return False
+
+        if "/Filter" not in stream_obj.stream_dict:
+            return True
+
+        filter_list = stream_obj.stream_dict.Filter
+        if isinstance(filter_list, Name):
+            filter_list = [filter_list]
+
+        for filter_name in filter_list:
+            if str(filter_name) not in RECOMPRESSIBLE_FILTER_LIST:
+                return False
+
+        return True
+
+    def __serialize_obj(self, objgen, obj):
+        header = f"{objgen[0]} {objgen[1]} obj\n".encode("utf-8")
+
+        if isinstance(obj, Stream):
+            # recompress new streams as a full rewrite would do
+            if self.__is_recompressible(obj):
+                obj.write(zlib.compress(obj.read_bytes()),
+                          filter=Name.FlateDecode)
+
+            raw_bytes = obj.read_raw_bytes()
+            obj.stream_dict.Length = len(raw_bytes)
+
+            return b"".join([header, obj.stream_dict.unparse(resolved=True), b"\nstream\n", raw_bytes, b"\nendstream\nendobj\n"])
+
+        return b"".join([header, obj.unparse(resolved=True), b"\nendobj\n"])
+
+    def __gen_subsection_list(self, offset_list):
+        subsection_list = []
+
+        for objgen, offset in offset_list:
+            if len(subsection_list) > 0 and subsection_list[-1][0] + len(subsection_list[-1][1]) == objgen[0]:
+                subsection_list[-1][1].append((objgen, offset))
+            else:
+                subsection_list.append((objgen[0], [(objgen, offset)]))
+
+        return subsection_list
+
+    def __gen_trailer_entries(self, size, prev_xref_offset):
+        trailer_entries = [f"/Size {size}", f"/Prev {prev_xref_offset}"]
+
+        # the /ID strings may be unparsed as raw bytes, latin-1 keeps each byte as it is
+        for key in ["/Root", "/Info", "/ID"]:
+            if key in self.pdf_obj.trailer:
+                trailer_entries.append(
+                    f"{key} {self.pdf_obj.trailer[key].unparse().decode('latin-1')}")
+
+        return trailer_entries
+
+    def __gen_xref_table(self, offset_list, size, prev_xref_offset):
+        xref_lines = ["xref"]
+
+        for first_obj_num, entry_list in self.__gen_subsection_list(offset_list):
+            xref_lines.append(f"{first_obj_num} {len(entry_list)}")
+
+            for objgen, offset in entry_list:
+                xref_lines.append(f"{offset:010d} {objgen[1]:05d} n\r")
+
+        trailer_entries = self.__gen_trailer_entries(size, prev_xref_offset)
+        xref_lines.append("trailer")
+        xref_lines.append(f"<< {' '.join(trailer_entries)} >>")
+
+        return "\n".join(xref_lines).encode("latin-1") + b"\n"
+
+    def __gen_xref_stream(self, offset_list, xref_obj_num, prev_xref_offset):
+        index_list = []
+        xref_data = bytearray()
+
+        for first_obj_num, entry_list in self.__gen_subsection_list(offset_list):
+            index_list.append(f"{first_obj_num} {len(entry_list)}")
+
+            for objgen, offset in entry_list:
+                xref_data.extend(b"\x01")
+                xref_data.extend(offset.to_bytes(
+                    XREF_STREAM_FIELD_WIDTH[1], "big"))
+                xref_data.extend(objgen[1].to_bytes(
+                    XREF_STREAM_FIELD_WIDTH[2], "big"))
+
+        trailer_entries = self.__gen_trailer_entries(
+            xref_obj_num + 1, prev_xref_offset)
+        trailer_entries.extend([
+            "/Type /XRef",
+            f"/W [{' '.join([str(width) for width in XREF_STREAM_FIELD_WIDTH])}]",
+            f"/Index [{' '.join(index_list)}]",
+            f"/Length {len(xref_data)}"
+        ])
+
+        return b"".join([f"{xref_obj_num} 0 obj\n<< {' '.join(trailer_entries)} >>\nstream\n".encode("latin-1"), bytes(xref_data), b"\nendstream\nendobj\n"])
+
+    def write_updated_pdf(self, origin_pdf_file, output_stream):
+        # the original xref offsets are not trustable if the pdf was repaired
+        if len(self.pdf_obj.get_warnings()) > 0:
+            return False
+
+        origin_pdf_size = origin_pdf_file.seek(0, io.SEEK_END)
+        origin_pdf_file.seek(max(origin_pdf_size - STARTXREF_SEARCH_SIZE, 0))
+        origin_pdf_tail = origin_pdf_file.read()
+
+        startxref_match_list = list(
+            STARTXREF_PATTERN.finditer(origin_pdf_tail))
+        if len(startxref_match_list) == 0:
+            return False
+
+        prev_xref_offset = int(startxref_match_list[-1].group(1))
+        origin_pdf_file.seek(prev_xref_offset)
+        is_xref_stream = origin_pdf_file.read(4) != b"xref"
+
+        # find modified and newly created objects
+        update_obj_dict = {}
+        for objgen, (target, snapshot) in self.target_snapshot.items():
+            if self.__snapshot(target) != snapshot:
+                update_obj_dict[objgen] = target
+                self.__collect_new_objs(target, update_obj_dict)
+
+        # serialize update section after the original bytes
+        origin_pdf_file.seek(0)
+        shutil.copyfileobj(origin_pdf_file, output_stream)
+        if len(update_obj_dict) == 0:
+            return True
+
+        if origin_pdf_tail[-1:] != b"\n":
+            output_stream.write(b"\n")
+
+        offset_list = []
+        for objgen in sorted(update_obj_dict.keys()):
+            offset_list.append((objgen, output_stream.tell()))
+            output_stream.write(self.__serialize_obj(
+                objgen, update_obj_dict[objgen]))
+
+        size = max([int(self.pdf_obj.trailer.Size)] +
+                   [objgen[0] + 1 for objgen in update_obj_dict.keys()])
+        xref_offset = output_stream.tell()
+
+        if is_xref_stream:
+            offset_list.append(((size, 0), xref_offset))
+            output_stream.write(self.__gen_xref_stream(
+                offset_list, size, prev_xref_offset))
+        else:
+            output_stream.write(self.__gen_xref_table(
+                offset_list, size, prev_xref_offset))
+
+        output_stream.write(
+            f"startxref\n{xref_offset}\n%%EOF\n".encode("utf-8"))
+
+        return True
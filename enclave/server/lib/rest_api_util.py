@@ -1,15 +1,83 @@
+import io
+import os
 import json
 import logging
 import traceback
 
 import requests
 
+from lib import vsock_util
 from lib.costant_data import APIPathList
 
 CHUNK_SIZE = 1024 * 1024
 API_SERVER_URL = "http://127.0.0.1"
 MAX_RESPONSE_SIZE = 1024 * 1024 * 50  # 50MB
 
+# the host api is reached over vsock, the connection is kept for the next job
+__session = requests.Session()
+__session.mount("http://", vsock_util.VsockHTTPAdapter())
+
+
+# job results are put over a new connection, as the body can not be sent again
+# when an idle connection kept from the last request turns out to be closed
+def __gen_put_session():
+    session = requests.Session()
+    session.mount("http://", vsock_util.VsockHTTPAdapter())
+
+    return session
+
+
+# request body of json data, file values are streamed as json strings without
+# loading them into memory, so they must not contain characters to be escaped,
+# the body can only be read once, a request sending it can not be retried
+class JsonStreamBody():
+    def __init__(self, data):
+        self.stream_list = []
+        self.marker = f"__stream_{os.urandom(16).hex()}_"
+        self.part_list = []
+        self.part_idx = 0
+
+        json_str = json.dumps(data, default=self.__register_stream)
+
+        for part_idx, part_str in enumerate(json_str.split(self.marker)):
+            if part_idx > 0:
+                stream_idx, part_str = part_str.split("_", 1)
+                self.part_list.append(self.stream_list[int(stream_idx)])
+
+            self.part_list.append(io.BytesIO(part_str.encode("utf-8")))
+
+        self.total_size = 0
+        for part in self.part_list:
+            self.total_size += part.seek(0, io.SEEK_END)
+            part.seek(0)
+
+    def __register_stream(self, obj):
+        if not hasattr(obj, "read"):
+            raise TypeError(f"{type(obj)} is not JSON serializable")
+
+        self.stream_list.append(obj)
+
+        return f"{self.marker}{len(self.stream_list) - 1}_"
+
+    def __len__(self):
+        return self.total_size
+
+    def read(self, size=-1):
+        chunk_list = []
+
+        while self.part_idx < len(self.part_list) and size != 0:
+            chunk_bytes = self.part_list[self.part_idx].read(size)
+
+            if len(chunk_bytes) == 0:
+                self.part_idx += 1
+                continue
+
+            chunk_list.append(chunk_bytes)
+            if size > 0:
+                size -= len(chunk_bytes)
+
+        return b"".join(chunk_list)
+
 
 def __read_chucks(res):
     data_size = 0
@@ -34,7 +102,7 @@ def __read_chucks(res):
 def get_job_api():
     try:
         # get job data from host instance
-        with requests.get(f"{API_SERVER_URL}/api/{APIPathList.GET_JOB}", stream=True, timeout=10) as res:
+        with __session.get(f"{API_SERVER_URL}/api/{APIPathList.GET_JOB}", stream=True, timeout=10) as res:
             res.raise_for_status()
 
             return __read_chucks(res)
@@ -51,7 +119,7 @@ def get_job_api():
 def put_job_result_api(session, result):
     try:
         # put job result to host instance
-        with requests.post(f"{API_SERVER_URL}/api/{APIPathList.PUT_JOB_RESULT}", json={"session": session, "jobResult": result}, stream=True, timeout=10) as res:
+        with __gen_put_session() as put_session, put_session.post(f"{API_SERVER_URL}/api/{APIPathList.PUT_JOB_RESULT}", data=JsonStreamBody({"session": session, "jobResult": result}), headers={"Content-Type": "application/json", "Connection": "close"}, stream=True, timeout=10) as res:
             res.raise_for_status()
 
             return __read_chucks(res)
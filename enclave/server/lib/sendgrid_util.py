@@ -0,0 +1,35 @@
+import requests
+import sendgrid
+import python_http_client
+
+from lib import vsock_util
+
+SENDGRID_TIMEOUT = 10
+SENDGRID_API_HOST = "https://api.sendgrid.com"
+SENDGRID_MAIL_SEND_PATH = "/v3/mail/send"
+SENDGRID_MAX_PERSONALIZATION_COUNT = 1000
+
+# one session for all threads, so that the https connection is reused across jobs,
+# api keys are only put in the headers of each request and never kept
+__session = requests.Session()
+__session.mount("https://", vsock_util.VsockHTTPAdapter())
+
+
+def __gen_request_headers(api_key):
+    # the same headers as the sendgrid client sends
+    return {
+        "Authorization": f"Bearer {api_key}",
+        "User-Agent": f"sendgrid/{sendgrid.__version__};python",
+        "Accept": "application/json"
+    }
+
+
+def send_mail(api_key, message):
+    response = __session.post(f"{SENDGRID_API_HOST}{SENDGRID_MAIL_SEND_PATH}", json=message.get(),
+                              headers=__gen_request_headers(api_key), timeout=SENDGRID_TIMEOUT)
+
+    # raise the same errors as the sendgrid client, e.g. for an invalid api key or a
+    # rejected request, a rejected request is not sent to any of its recipients
+    if response.status_code != 202 and response.status_code != 200:
+        raise python_http_client.exceptions.err_dict.get(response.status_code, python_http_client.exceptions.HTTPError)(
+            response.status_code, response.reason, response.content, response.headers)
@@ -0,0 +1,141 @@
+import os
+import re
+import json
+import base64
+import hashlib
+
+import python_http_client
+
+from lib import aws_sig_util
+from lib import requests_util
+
+SES_API_REGION = "us-east-1"
+SES_API_HOST = f"email.{SES_API_REGION}.amazonaws.com"
+SES_API_SEND_EMAIL_PATH = "/v2/email/outbound-emails"
+SES_API_TIMEOUT = 10
+SES_EOL_PATTERN = re.compile(r"\r\n|\r|\n")
+
+# raw message is converted and base64 encoded in chunks
+SES_DATA_CHUNK_SIZE = 48 * 1024
+
+# one session for all threads, so that the https connection is reused across jobs
+__session = requests_util.gen_requests_session()
+
+
+# request body of SendEmail with the raw message, which is converted and encoded while
+# being read instead of being built in memory, the body is read once to be hashed for
+# the signature, and can be rewound, so urllib3 can send it again on a retry
+class RawEmailBody():
+    def __init__(self, from_addr, to_addr, message_segment_list):
+        data_marker = f"__data_{os.urandom(16).hex()}_"
+        prefix_str, suffix_str = json.dumps({
+            "FromEmailAddress": from_addr,
+            "Destination": {"ToAddresses": [to_addr]},
+            "Content": {"Raw": {"Data": data_marker}}
+        }, ensure_ascii=False, separators=(',', ':')).split(data_marker)
+
+        self.prefix_bytes = prefix_str.encode("utf-8")
+        self.suffix_bytes = suffix_str.encode("utf-8")
+        self.message_segment_list = message_segment_list
+
+        hasher = hashlib.sha256()
+        self.total_size = 0
+        for chunk_bytes in self.__gen_chunk_iter():
+            hasher.update(chunk_bytes)
+            self.total_size += len(chunk_bytes)
+
+        self.payload_hash = hasher.hexdigest()
+        self.seek(0)
+
+    def __gen_raw_data_chunk_iter(self):
+        pending_text = ""
+        pending_bytes = b""
+
+        for segment in self.message_segment_list:
+            for chunk_start in range(0, len(segment), SES_DATA_CHUNK_SIZE):
+                chunk_text = pending_text + \
+                    segment[chunk_start:chunk_start + SES_DATA_CHUNK_SIZE]
+                pending_text = ""
+
+                # a trailing \r may be followed by \n in the next chunk
+                if chunk_text.endswith("\r"):
+                    pending_text = "\r"
+                    chunk_text = chunk_text[:-1]
+
+                # CRLF line endings as smtp does, encoded in whole groups of 3 bytes
+                chunk_bytes = pending_bytes + \
+                    SES_EOL_PATTERN.sub("\r\n", chunk_text).encode("ascii")
+                encode_size = len(chunk_bytes) // 3 * 3
+                pending_bytes = chunk_bytes[encode_size:]
+
+                if encode_size > 0:
+                    yield base64.b64encode(chunk_bytes[:encode_size])
+
+        yield base64.b64encode(pending_bytes + pending_text.replace("\r", "\r\n").encode("ascii"))
+
+    def __gen_chunk_iter(self):
+        yield self.prefix_bytes
+        yield from self.__gen_raw_data_chunk_iter()
+        yield self.suffix_bytes
+
+    def __len__(self):
+        return self.total_size
+
+    def tell(self):
+        return self.read_size
+
+    def seek(self, offset, whence=0):
+        if offset != 0 or whence != 0:
+            raise ValueError("raw email body can only be rewound")
+
+        self.chunk_iter = self.__gen_chunk_iter()
+        self.chunk_bytes = b""
+        self.chunk_pos = 0
+        self.read_size = 0
+
+        return 0
+
+    def read(self, size=-1):
+        chunk_list = []
+
+        while size != 0:
+            if self.chunk_pos == len(self.chunk_bytes):
+                self.chunk_bytes = next(self.chunk_iter, None)
+                self.chunk_pos = 0
+
+                if self.chunk_bytes is None:
+                    self.chunk_bytes = b""
+                    break
+
+            read_end = len(self.chunk_bytes) if size < 0 else min(
+                len(self.chunk_bytes), self.chunk_pos + size)
+            chunk_list.append(self.chunk_bytes[self.chunk_pos:read_end])
+
+            if size > 0:
+                size -= read_end - self.chunk_pos
+            self.chunk_pos = read_end
+
+        read_bytes = b"".join(chunk_list)
+        self.read_size += len(read_bytes)
+
+        return read_bytes
+
+
+def send_mail(aws_key_id, aws_key_secret, from_addr, to_addr, message_segment_list):
+    request_body = RawEmailBody(from_addr, to_addr, message_segment_list)
+
+    headers = aws_sig_util.sign_request(aws_key_id, aws_key_secret, SES_API_REGION, "ses", "POST", SES_API_HOST, SES_API_SEND_EMAIL_PATH, {
+        "Content-Type": "application/json"
+    }, None, request_body.payload_hash)
+
+    response = __session.post(f"https://{SES_API_HOST}{SES_API_SEND_EMAIL_PATH}",
+                              headers=headers, data=request_body, timeout=SES_API_TIMEOUT)
+
+    # raise the same errors as the sendgrid client, so the status is kept for the caller
+    if response.status_code == 401 or response.status_code == 403:
+        raise python_http_client.exceptions.UnauthorizedError(
+            response.status_code, response.reason, response.content, response.headers)
+
+    if response.status_code != 200:
+        raise python_http_client.exceptions.err_dict.get(response.status_code, python_http_client.exceptions.HTTPError)(
+            response.status_code, response.reason, response.content, response.headers)
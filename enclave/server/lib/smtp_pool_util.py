@@ -0,0 +1,256 @@
+import re
+import ssl
+import time
+import hashlib
+import logging
+import smtplib
+import threading
+
+from lib import vsock_util
+
+SMTP_TIMEOUT = 10
+
+# a mail is sent again on a new session only if it fails before the message data
+SMTP_MAX_RETRY_COUNT = 1
+
+# message data is sent to the server in chunks while being converted
+SMTP_DATA_CHUNK_SIZE = 64 * 1024
+SMTP_EOL_PATTERN = re.compile(r"\r\n|\r|\n")
+
+# authenticated smtp sessions are kept for reuse, keyed by host and credentials,
+# sessions idle for longer than SMTP_POOL_MAX_IDLE_TIME are closed for all keys
+SMTP_POOL_MAX_IDLE_COUNT = 4
+SMTP_POOL_MAX_TOTAL_IDLE_COUNT = 8
+SMTP_POOL_MAX_IDLE_TIME = 10
+SMTP_POOL_MAX_MESSAGE_COUNT = 50
+
+__pool_lock = threading.Lock()
+__idle_session_dict = {}
+
+
+def __gen_pool_key(host, port, username, password):
+    return (host, port, username, hashlib.sha256(password.encode("utf-8")).hexdigest())
+
+
+def __open_session(host, port, username, password):
+    smtp_server = vsock_util.VsockSMTP(host, port=port, timeout=SMTP_TIMEOUT)
+
+    try:
+        smtp_server.ehlo()
+        smtp_server.starttls(context=ssl.create_default_context())
+        smtp_server.login(username, password)
+    except BaseException as e:
+        __close_session(smtp_server)
+        raise e
+
+    return {"smtpServer": smtp_server, "messageCount": 0, "lastUsedTime": time.monotonic()}
+
+
+def __close_session(smtp_server):
+    try:
+        smtp_server.quit()
+    except BaseException as e:
+        smtp_server.close()
+
+
+def __is_session_expired(session, current_time):
+    return current_time - session["lastUsedTime"] > SMTP_POOL_MAX_IDLE_TIME
+
+
+def __is_session_alive(session):
+    if __is_session_expired(session, time.monotonic()):
+        return False
+
+    # the server may close the connection at any time, check it before use,
+    # RSET also clears any transaction state left on the session
+    try:
+        return session["smtpServer"].rset()[0] == 250
+    except BaseException as e:
+        return False
+
+
+def __get_idle_session_count():
+    return sum([len(idle_session_list) for idle_session_list in __idle_session_dict.values()])
+
+
+# close sessions idle for too long, also called by the job loop while no mail is sent
+def close_expired_sessions():
+    expired_session_list = []
+    current_time = time.monotonic()
+
+    with __pool_lock:
+        for pool_key in list(__idle_session_dict.keys()):
+            idle_session_list = []
+
+            for session in __idle_session_dict[pool_key]:
+                if __is_session_expired(session, current_time):
+                    expired_session_list.append(session)
+                else:
+                    idle_session_list.append(session)
+
+            # drop the key as well, so credentials of idle tenants are not kept
+            if len(idle_session_list) > 0:
+                __idle_session_dict[pool_key] = idle_session_list
+            else:
+                del __idle_session_dict[pool_key]
+
+    for session in expired_session_list:
+        logging.debug("close expired smtp session")
+        __close_session(session["smtpServer"])
+
+
+def __acquire_session(pool_key):
+    close_expired_sessions()
+
+    while True:
+        with __pool_lock:
+            idle_session_list = __idle_session_dict.get(pool_key, [])
+
+            if len(idle_session_list) == 0:
+                return None
+
+            session = idle_session_list.pop()
+            if len(idle_session_list) == 0:
+                del __idle_session_dict[pool_key]
+
+        if __is_session_alive(session):
+            return session
+
+        logging.debug("drop stale smtp session")
+        __close_session(session["smtpServer"])
+
+
+def __release_session(pool_key, session):
+    close_expired_sessions()
+    session["lastUsedTime"] = time.monotonic()
+
+    if session["messageCount"] < SMTP_POOL_MAX_MESSAGE_COUNT:
+        with __pool_lock:
+            idle_session_list = __idle_session_dict.get(pool_key, [])
+
+            if len(idle_session_list) < SMTP_POOL_MAX_IDLE_COUNT and __get_idle_session_count() < SMTP_POOL_MAX_TOTAL_IDLE_COUNT:
+                idle_session_list.append(session)
+                __idle_session_dict[pool_key] = idle_session_list
+                return
+
+    __close_session(session["smtpServer"])
+
+
+def __gen_data_chunk_iter(message_segment_list):
+    pending_text = ""
+    is_line_start = True
+    is_crlf_end = False
+
+    for segment in message_segment_list:
+        for chunk_start in range(0, len(segment), SMTP_DATA_CHUNK_SIZE):
+            chunk_text = pending_text + \
+                segment[chunk_start:chunk_start + SMTP_DATA_CHUNK_SIZE]
+            pending_text = ""
+
+            # a trailing \r may be followed by \n in the next chunk
+            if chunk_text.endswith("\r"):
+                pending_text = "\r"
+                chunk_text = chunk_text[:-1]
+
+            if len(chunk_text) == 0:
+                continue
+
+            # convert line endings to CRLF and quote leading periods as smtplib does
+            chunk_text = SMTP_EOL_PATTERN.sub(
+                "\r\n", chunk_text).replace("\r\n.", "\r\n..")
+            if is_line_start and chunk_text.startswith("."):
+                chunk_text = "." + chunk_text
+
+            is_crlf_end = chunk_text.endswith("\r\n")
+            is_line_start = is_crlf_end
+
+            yield chunk_text.encode("ascii")
+
+    if len(pending_text) > 0 or not is_crlf_end:
+        yield b"\r\n"
+
+    yield b".\r\n"
+
+
+def __start_message(smtp_server, from_addr, to_addr):
+    smtp_server.ehlo_or_helo_if_needed()
+
+    code, resp = smtp_server.mail(from_addr)
+    if code != 250:
+        raise smtplib.SMTPSenderRefused(code, resp, from_addr)
+
+    code, resp = smtp_server.rcpt(to_addr)
+    if code != 250 and code != 251:
+        raise smtplib.SMTPRecipientsRefused({to_addr: (code, resp)})
+
+    smtp_server.putcmd("data")
+    code, resp = smtp_server.getreply()
+    if code != 354:
+        raise smtplib.SMTPDataError(code, resp)
+
+
+def __send_message_data(smtp_server, message_segment_list):
+    # stream the message, so that the whole encoded message is never built in memory
+    for chunk_bytes in __gen_data_chunk_iter(message_segment_list):
+        smtp_server.send(chunk_bytes)
+
+    code, resp = smtp_server.getreply()
+    if code != 250:
+        raise smtplib.SMTPDataError(code, resp)
+
+
+def __is_retryable_error(e):
+    # only called for failures before the message data, the mail is not delivered then,
+    # connection errors and temporary (4xx) replies are retried, others are permanent
+    if isinstance(e, smtplib.SMTPAuthenticationError):
+        return False
+    elif isinstance(e, smtplib.SMTPResponseException):
+        return 400 <= e.smtp_code < 500
+    elif isinstance(e, smtplib.SMTPRecipientsRefused):
+        return all([400 <= code < 500 for code, _ in e.recipients.values()])
+    elif isinstance(e, smtplib.SMTPServerDisconnected):
+        return True
+
+    return isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException)
+
+
+# whether a failure raised by send_mail can be sent again by the caller later
+def is_retryable_error(e):
+    return not getattr(e, "is_message_data_sent", False) and __is_retryable_error(e)
+
+
+def send_mail(host, port, username, password, from_addr, to_addr, message_segment_list):
+    pool_key = __gen_pool_key(host, port, username, password)
+    retry_count = 0
+
+    while True:
+        session = __acquire_session(pool_key) if retry_count == 0 else None
+
+        try:
+            if session is None:
+                session = __open_session(host, port, username, password)
+
+            __start_message(session["smtpServer"], from_addr, to_addr)
+            break
+        except BaseException as e:
+            if session is not None:
+                __close_session(session["smtpServer"])
+
+            if retry_count >= SMTP_MAX_RETRY_COUNT or not __is_retryable_error(e):
+                raise e
+
+            retry_count += 1
+            logging.info(
+                f"smtp failure before message data ({type(e).__name__}), retry {retry_count} on a new session")
+
+    try:
+        __send_message_data(session["smtpServer"], message_segment_list)
+        session["messageCount"] += 1
+    except BaseException as e:
+        # the state of session is unknown after a failed transaction, and
+        # the message may have been delivered, so it is not retried
+        __close_session(session["smtpServer"])
+        e.is_message_data_sent = True
+        raise e
+
+    __release_session(pool_key, session)
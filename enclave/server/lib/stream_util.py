@@ -0,0 +1,20 @@
+import base64
+
+
+# base64 encode data written in chunks into the output stream, call finalize() after the last write
+class Base64EncodeWriter():
+    def __init__(self, output_stream):
+        self.output_stream = output_stream
+        self.pending_bytes = b""
+
+    def write(self, data_bytes):
+        data_bytes = b"".join([self.pending_bytes, data_bytes])
+
+        # keep the bytes which can not form a complete base64 group
+        aligned_size = len(data_bytes) // 3 * 3
+        self.output_stream.write(base64.b64encode(data_bytes[:aligned_size]))
+        self.pending_bytes = data_bytes[aligned_size:]
+
+    def finalize(self):
+        self.output_stream.write(base64.b64encode(self.pending_bytes))
+        self.pending_bytes = b""
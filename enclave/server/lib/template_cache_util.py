@@ -0,0 +1,49 @@
+import json
+from collections import OrderedDict
+
+# budget of cached entries in bytes, the least recently used ones are evicted first
+TEMPLATE_CACHE_MAX_SIZE = 256 * 1024
+
+# per-process cache of template verdicts, keyed by the verified hashes in binding data
+__verdict_dict = OrderedDict()
+__verdict_size_dict = {}
+__total_size = 0
+
+
+def __gen_cache_key(template_data_hash, template_info_hash):
+    return f"{template_data_hash}:{template_info_hash}"
+
+
+def get_template_verdict(template_data_hash, template_info_hash):
+    cache_key = __gen_cache_key(template_data_hash, template_info_hash)
+
+    if cache_key not in __verdict_dict:
+        return None
+
+    __verdict_dict.move_to_end(cache_key)
+
+    return dict(__verdict_dict[cache_key])
+
+
+def put_template_verdict(template_data_hash, template_info_hash, verdict):
+    global __total_size
+
+    cache_key = __gen_cache_key(template_data_hash, template_info_hash)
+    entry_size = len(cache_key) + \
+        len(json.dumps(verdict, separators=(',', ':')))
+
+    if entry_size > TEMPLATE_CACHE_MAX_SIZE:
+        return
+
+    if cache_key in __verdict_dict:
+        __total_size -= __verdict_size_dict.pop(cache_key)
+        del __verdict_dict[cache_key]
+
+    # evict least recently used entries until the new one fits
+    while len(__verdict_dict) > 0 and __total_size + entry_size > TEMPLATE_CACHE_MAX_SIZE:
+        evicted_key, _ = __verdict_dict.popitem(last=False)
+        __total_size -= __verdict_size_dict.pop(evicted_key)
+
+    __verdict_dict[cache_key] = dict(verdict)
+    __verdict_size_dict[cache_key] = entry_size
+    __total_size += entry_size
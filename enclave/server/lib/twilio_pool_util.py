@@ -0,0 +1,104 @@
+import time
+import logging
+import hashlib
+import threading
+from collections import OrderedDict
+
+from twilio.rest import TwilioHttpClient, Client
+
+from lib import vsock_util
+
+# twilio clients are kept per credential and verify service, the least recently
+# used ones are dropped first, and clients idle for longer than
+# TWILIO_CLIENT_POOL_MAX_IDLE_TIME are dropped with their https connections
+TWILIO_CLIENT_POOL_MAX_SIZE = 16
+TWILIO_CLIENT_POOL_MAX_IDLE_TIME = 60
+
+# a verify service which passed the setting check is not fetched again within the ttl
+TWILIO_SERVICE_CHECK_TTL = 300
+
+__pool_lock = threading.Lock()
+__client_entry_dict = OrderedDict()
+
+
+class CustomTwilioHttpClient(TwilioHttpClient):
+    def __init__(self):
+        TwilioHttpClient.__init__(self, timeout=5)
+        self.session.mount("https://", vsock_util.VsockHTTPAdapter())
+
+
+def __gen_pool_key(twilio_config):
+    return (twilio_config["apiSID"], hashlib.sha256(twilio_config["apiSecret"].encode("utf-8")).hexdigest(), twilio_config["serviceSID"])
+
+
+def __close_client_entry(client_entry):
+    try:
+        client_entry["client"].http_client.session.close()
+    except BaseException as e:
+        pass
+
+
+def __is_client_entry_expired(client_entry, current_time):
+    return current_time - client_entry["lastUsedTime"] > TWILIO_CLIENT_POOL_MAX_IDLE_TIME
+
+
+# drop clients idle for too long, also called by the job loop while no sms is sent
+def close_expired_clients():
+    expired_entry_list = []
+    current_time = time.monotonic()
+
+    with __pool_lock:
+        # entries are in the order of use, so the expired ones are at the front
+        while len(__client_entry_dict) > 0:
+            pool_key = next(iter(__client_entry_dict))
+            if not __is_client_entry_expired(__client_entry_dict[pool_key], current_time):
+                break
+
+            expired_entry_list.append(__client_entry_dict.pop(pool_key))
+
+    for client_entry in expired_entry_list:
+        logging.debug("close expired twilio client")
+        __close_client_entry(client_entry)
+
+
+def __get_client_entry(twilio_config):
+    pool_key = __gen_pool_key(twilio_config)
+    current_time = time.monotonic()
+
+    if pool_key in __client_entry_dict and __is_client_entry_expired(__client_entry_dict[pool_key], current_time):
+        __close_client_entry(__client_entry_dict.pop(pool_key))
+
+    if pool_key in __client_entry_dict:
+        __client_entry_dict.move_to_end(pool_key)
+    else:
+        # the http client keeps a session, so that the https connection is reused
+        __client_entry_dict[pool_key] = {
+            "client": Client(twilio_config["apiSID"], twilio_config["apiSecret"], http_client=CustomTwilioHttpClient()),
+            "serviceCheckTime": None
+        }
+
+        while len(__client_entry_dict) > TWILIO_CLIENT_POOL_MAX_SIZE:
+            __close_client_entry(__client_entry_dict.popitem(last=False)[1])
+
+    __client_entry_dict[pool_key]["lastUsedTime"] = current_time
+
+    return __client_entry_dict[pool_key]
+
+
+def get_client(twilio_config):
+    with __pool_lock:
+        return __get_client_entry(twilio_config)["client"]
+
+
+def is_service_checked(twilio_config):
+    with __pool_lock:
+        service_check_time = __get_client_entry(
+            twilio_config)["serviceCheckTime"]
+
+        return service_check_time is not None and time.monotonic() - service_check_time < TWILIO_SERVICE_CHECK_TTL
+
+
+def set_service_checked(twilio_config, is_checked):
+    with __pool_lock:
+        __get_client_entry(twilio_config)["serviceCheckTime"] = time.monotonic(
+        ) if is_checked else None
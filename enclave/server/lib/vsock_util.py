@@ -0,0 +1,152 @@
+import os
+import socket
+import smtplib
+import threading
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+# the endpoints routed to the parent instance, the enclave has no other network,
+# so a connection to any other endpoint fails instead of being tried over tcp
+PROXY_CONF_PATH = "/configs/proxy.conf"
+HOSTS_CONF_PATH = "/configs/enclave.hosts"
+
+# for local testing, "unix:<dir>" connects to <dir>/<cid>_<port>.sock and
+# "tcp:<host>" connects to <host>:<port> instead of the vsock address
+VSOCK_STANDIN = os.environ.get("VSOCK_STANDIN")
+
+__route_lock = threading.Lock()
+__route_dict = None
+
+
+def __read_conf_lines(conf_path):
+    if not os.path.exists(conf_path):
+        return []
+
+    with open(conf_path, "r") as conf_file:
+        return [line.split() for line in conf_file if len(line.split()) > 0 and not line.startswith("#")]
+
+
+def __load_route_dict():
+    host_name_dict = {}
+    for host_setting in __read_conf_lines(HOSTS_CONF_PATH):
+        host_name_dict.setdefault(host_setting[0], []).extend(host_setting[1:])
+
+    route_dict = {}
+    for local_ip, local_port, remote_cid, remote_port in __read_conf_lines(PROXY_CONF_PATH):
+        route = (int(remote_cid), int(remote_port))
+
+        route_dict[(local_ip, int(local_port))] = route
+        for host_name in host_name_dict.get(local_ip, []):
+            route_dict[(host_name, int(local_port))] = route
+
+    return route_dict
+
+
+def __open_socket(route):
+    remote_cid, remote_port = route
+
+    if VSOCK_STANDIN is None:
+        return socket.socket(socket.AF_VSOCK, socket.SOCK_STREAM), route
+
+    standin_type, standin_addr = VSOCK_STANDIN.split(":", 1)
+    if standin_type == "unix":
+        return socket.socket(socket.AF_UNIX, socket.SOCK_STREAM), os.path.join(standin_addr, f"{remote_cid}_{remote_port}.sock")
+    elif standin_type == "tcp":
+        tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        tcp_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        return tcp_socket, (standin_addr, remote_port)
+
+    raise ValueError(f"unsupported vsock standin: {VSOCK_STANDIN}")
+
+
+# the vsock address of an endpoint, or None if it is not routed to the parent instance
+def get_route(host, port):
+    global __route_dict
+
+    with __route_lock:
+        if __route_dict is None:
+            __route_dict = __load_route_dict()
+
+        return __route_dict.get((host, port))
+
+
+# the vsock address of an endpoint, which must be routed to the parent instance
+def require_route(host, port):
+    route = get_route(host, port)
+
+    if route is None:
+        raise RuntimeError(
+            f"{host}:{port} is not routed to the parent instance, add it to {HOSTS_CONF_PATH} and {PROXY_CONF_PATH}")
+
+    return route
+
+
+# connect to the vsock address of an endpoint
+def connect_route(route, timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+    sock, sock_addr = __open_socket(route)
+
+    try:
+        if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+            sock.settimeout(timeout)
+
+        sock.connect(sock_addr)
+    except BaseException as e:
+        sock.close()
+        raise e
+
+    return sock
+
+
+# _new_conn, _dns_host and pool_classes_by_scheme are internals of urllib3 1.26,
+# urllib3 is pinned in requirements.txt for them and has to be checked on upgrade
+# the error of an unrouted endpoint is not a connection error of urllib3, so that
+# it is raised as it is and not retried
+class VsockConnectionMixin():
+    def _new_conn(self):
+        route = require_route(self._dns_host, self.port)
+
+        try:
+            return connect_route(route, self.timeout)
+        except socket.timeout:
+            raise ConnectTimeoutError(
+                self, f"Connection to {self.host} timed out. (connect timeout={self.timeout})")
+        except OSError as e:
+            raise NewConnectionError(
+                self, f"Failed to establish a new connection: {e}")
+
+
+class VsockHTTPConnection(VsockConnectionMixin, HTTPConnection):
+    pass
+
+
+class VsockHTTPSConnection(VsockConnectionMixin, HTTPSConnection):
+    pass
+
+
+class VsockHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = VsockHTTPConnection
+
+
+class VsockHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = VsockHTTPSConnection
+
+
+# requests adapter whose connections all go over vsock
+class VsockHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": VsockHTTPConnectionPool,
+            "https": VsockHTTPSConnectionPool
+        }
+
+
+# smtp client whose connections all go over vsock
+class VsockSMTP(smtplib.SMTP):
+    def _get_socket(self, host, port, timeout):
+        return connect_route(require_route(host, port), timeout)
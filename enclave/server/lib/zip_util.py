@@ -0,0 +1,137 @@
+import time
+import zlib
+import struct
+
+from pyzipper.zipfile_aes import AESZipEncrypter
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+ZIP_DEFLATE_LEVEL = 6
+
+# store the entry without compression if the sample blocks spread over the data
+# can not be compressed to less than the ratio, e.g. pdf with compressed images
+ZIP_SAMPLE_BLOCK_SIZE = 64 * 1024
+ZIP_SAMPLE_BLOCK_COUNT = 4
+ZIP_STORE_MIN_RATIO = 0.9
+ZIP_VERSION = 20
+ZIP_CREATE_SYSTEM = 3
+ZIP_FLAG_ENCRYPTED = 0x1
+ZIP_FLAG_UTF8 = 0x800
+ZIP_EXTERNAL_ATTR = 0o600 << 16
+
+# WinZip AES-256 encryption, the AE-2 format leaves crc as 0
+WZ_AES_COMPRESS_TYPE = 99
+WZ_AES_VERSION = 2
+WZ_AES_VENDOR_ID = b"AE"
+WZ_AES_STRENGTH = 3
+WZ_AES_NBITS = 256
+WZ_AES_EXTRA_ID = 0x9901
+
+WRITE_CHUNK_SIZE = 1024 * 1024
+
+
+def __gen_dos_date_time(date_time):
+    dos_date = (date_time[0] - 1980) << 9 | date_time[1] << 5 | date_time[2]
+    dos_time = date_time[3] << 11 | date_time[4] << 5 | date_time[5] // 2
+
+    return dos_date, dos_time
+
+
+def __is_compressible(data_bytes):
+    sample_size = ZIP_SAMPLE_BLOCK_SIZE * ZIP_SAMPLE_BLOCK_COUNT
+
+    if len(data_bytes) <= sample_size:
+        return True
+
+    data_view = memoryview(data_bytes)
+    compressed_sample_size = 0
+
+    for block_idx in range(ZIP_SAMPLE_BLOCK_COUNT):
+        block_start = (len(data_bytes) - ZIP_SAMPLE_BLOCK_SIZE) * \
+            block_idx // (ZIP_SAMPLE_BLOCK_COUNT - 1)
+        compressed_sample_size += len(zlib.compress(
+            data_view[block_start:block_start + ZIP_SAMPLE_BLOCK_SIZE], ZIP_DEFLATE_LEVEL))
+
+    return compressed_sample_size < sample_size * ZIP_STORE_MIN_RATIO
+
+
+def compress_entry(file_name, data_bytes):
+    entry = {
+        "fileName": file_name,
+        "dateTime": time.localtime()[:6],
+        "crc": zlib.crc32(data_bytes),
+        "fileSize": len(data_bytes),
+        "compressType": ZIP_STORED,
+        "data": data_bytes
+    }
+
+    # compress once, the entry can be written into several zip files
+    if __is_compressible(data_bytes):
+        compressor = zlib.compressobj(
+            ZIP_DEFLATE_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+
+        entry["compressType"] = ZIP_DEFLATED
+        entry["data"] = compressor.compress(data_bytes) + compressor.flush()
+
+    return entry
+
+
+def __write_entry(output_stream, entry, password):
+    file_name_bytes = entry["fileName"].encode("utf-8")
+    dos_date, dos_time = __gen_dos_date_time(entry["dateTime"])
+    flag_bits = ZIP_FLAG_UTF8
+    compress_type = entry["compressType"]
+    crc = entry["crc"]
+    compress_size = len(entry["data"])
+    extra_bytes = b""
+
+    if password:
+        encrypter = AESZipEncrypter(password, nbits=WZ_AES_NBITS)
+        encryption_header = encrypter.encryption_header()
+        flag_bits |= ZIP_FLAG_ENCRYPTED
+        compress_type = WZ_AES_COMPRESS_TYPE
+        crc = 0
+        compress_size += len(encryption_header) + encrypter.hmac_size
+        extra_bytes = struct.pack("<3H2sBH", WZ_AES_EXTRA_ID, 7, WZ_AES_VERSION,
+                                  WZ_AES_VENDOR_ID, WZ_AES_STRENGTH, entry["compressType"])
+
+    header_fields = (ZIP_VERSION, flag_bits, compress_type, dos_time, dos_date,
+                     crc, compress_size, entry["fileSize"], len(file_name_bytes), len(extra_bytes))
+
+    output_stream.write(b"".join([struct.pack("<I5H3I2H", 0x04034b50, *header_fields),
+                                  file_name_bytes, extra_bytes]))
+
+    if password:
+        output_stream.write(encryption_header)
+
+    # write in chunks, so that a downstream writer never gets the whole entry
+    data_view = memoryview(entry["data"])
+    for chunk_start in range(0, len(data_view), WRITE_CHUNK_SIZE):
+        chunk_bytes = data_view[chunk_start:chunk_start + WRITE_CHUNK_SIZE]
+        output_stream.write(encrypter.encrypt(chunk_bytes)
+                            if password else chunk_bytes)
+
+    if password:
+        output_stream.write(encrypter.flush())
+
+    local_header_size = 30 + len(file_name_bytes) + len(extra_bytes)
+
+    return header_fields, file_name_bytes, extra_bytes, local_header_size + compress_size
+
+
+def write_zip(output_stream, entry_list, password=None):
+    central_dir_list = []
+    offset = 0
+
+    for entry in entry_list:
+        header_fields, file_name_bytes, extra_bytes, entry_size = __write_entry(
+            output_stream, entry, password)
+
+        central_dir_list.append(b"".join([struct.pack("<I6H3I5H2I", 0x02014b50, ZIP_CREATE_SYSTEM << 8 | ZIP_VERSION, *header_fields, 0, 0, 0, ZIP_EXTERNAL_ATTR, offset),
+                                          file_name_bytes, extra_bytes]))
+        offset += entry_size
+
+    central_dir_bytes = b"".join(central_dir_list)
+    output_stream.write(central_dir_bytes)
+    output_stream.write(struct.pack("<I4H2IH", 0x06054b50, 0, 0, len(
+        entry_list), len(entry_list), len(central_dir_bytes), offset, 0))
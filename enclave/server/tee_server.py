@@ -6,6 +6,9 @@ import traceback
 
 from lib import pdf_tool_util
 from lib import rest_api_util
+from lib import mail_outbox_util
+from lib import smtp_pool_util
+from lib import twilio_pool_util
 from lib import params_checker
 from lib import attest_doc_util
 from lib.costant_data import JobNameList
@@ -18,6 +21,25 @@ logging.basicConfig(
     format='[%(asctime)s][%(levelname)s][%(process)d][%(filename)s][%(lineno)d]: %(message)s', level=logging.INFO)
 
 
+def __gen_job_proof(job_name, fn_res_list):
+    results = []
+    hash_list = []
+
+    for fn_res in fn_res_list:
+        results.append({"name": fn_res["name"], "data": base64.b64encode(
+            fn_res["bytes"]).decode("utf-8")})
+
+        hash_list.append(
+            {"name": fn_res["name"], "hash": hashlib.sha256(fn_res["bytes"]).hexdigest()})
+
+    attest_document_bytes = attest_doc_util.gen_attest_document(
+        job_name, hash_list)
+    attest_document_b64 = base64.b64encode(
+        attest_document_bytes).decode("utf-8")
+
+    return results, attest_document_b64
+
+
 def __process_job_data(job_data):
     response = {}
 
@@ -28,6 +50,9 @@ def __process_job_data(job_data):
         if job_data["jobName"] == JobNameList.SEND_REQ:
             job_handler = SendReqHandler(job_data["jobData"])
             code, fn_res_list, _ = job_handler.do_job()
+        elif job_data["jobName"] == JobNameList.SEND_REQ_BATCH:
+            job_handler = SendReqHandler(job_data["jobData"], True)
+            code, fn_res_list, signer_result_list = job_handler.do_job()
         elif job_data["jobName"] == JobNameList.CONFIRM_INTENT:
             job_handler = ConfirmIntentHandler(job_data["jobData"])
             code, fn_res_list, twilio_verification_sid = job_handler.do_job()
@@ -42,29 +67,30 @@ def __process_job_data(job_data):
         logging.debug(f"Job handler return code: {code}")
 
         # generate proof of job result
-        if code == ErrCodeList.SUCCES.value:
+        if code == ErrCodeList.SUCCES.value and job_data["jobName"] != JobNameList.SEND_REQ_BATCH:
             logging.debug("generate proof of job result")
 
-            results = []
-            hash_list = []
-
-            for fn_res in fn_res_list:
-                results.append({"name": fn_res["name"], "data": base64.b64encode(
-                    fn_res["bytes"]).decode("utf-8")})
-
-                hash_list.append(
-                    {"name": fn_res["name"], "hash": hashlib.sha256(fn_res["bytes"]).hexdigest()})
-
-            attest_document_bytes = attest_doc_util.gen_attest_document(
-                job_data["jobName"], hash_list)
-            attest_document_b64 = base64.b64encode(
-                attest_document_bytes).decode("utf-8")
+            results, attest_document_b64 = __gen_job_proof(
+                job_data["jobName"], fn_res_list)
 
         # export the response
         if code == ErrCodeList.SUCCES.value:
             if job_data["jobName"] == JobNameList.SEND_REQ:
                 response["results"] = results
                 response["attestDocument"] = attest_document_b64
+            elif job_data["jobName"] == JobNameList.SEND_REQ_BATCH:
+                response["resultList"] = []
+
+                # attest each signer result as an individual sendReq job
+                for signer_result in signer_result_list:
+                    signer_response = {
+                        "signerIdx": signer_result["signerIdx"], "code": signer_result["code"]}
+
+                    if signer_result["code"] == ErrCodeList.SUCCES.value:
+                        signer_response["results"], signer_response["attestDocument"] = __gen_job_proof(
+                            JobNameList.SEND_REQ, signer_result["results"])
+
+                    response["resultList"].append(signer_response)
             elif job_data["jobName"] == JobNameList.CONFIRM_INTENT:
                 response["results"] = results
                 response["attestDocument"] = attest_document_b64
@@ -74,7 +100,8 @@ def __process_job_data(job_data):
                 tmp_encrypted_result = job_handler.encrypt_result(
                     results, attest_document_b64)
 
-                if tmp_encrypted_result:
+                # the encrypted result is a file streamed into the request body
+                if tmp_encrypted_result is not None:
                     response["encryptedResult"] = tmp_encrypted_result
                 else:
                     response["code"] = ErrCodeList.ENCRYPT_RESULT_FAIL.value
@@ -93,6 +120,9 @@ def __process_job_data(job_data):
     except BaseException as e:
         logging.error(traceback.format_exc())
 
+    if "encryptedResult" in response:
+        response["encryptedResult"].close()
+
 
 def main():
     logging.info("Let's eSign TEE server start...")
@@ -112,6 +142,14 @@ def main():
                         f"Job received: session - {get_job_res['session']}, job name - {get_job_res['jobName']}")
 
                     __process_job_data(get_job_res)
+
+                    logging.info(
+                        f"mail outbox stats: {mail_outbox_util.get_outbox_stats()}")
+
+            # smtp sessions and twilio clients left idle are closed even if no mail
+            # or sms is sent for a while
+            smtp_pool_util.close_expired_sessions()
+            twilio_pool_util.close_expired_clients()
         except BaseException as e:
             logging.error(traceback.format_exc())
 
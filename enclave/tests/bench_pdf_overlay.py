@@ -0,0 +1,106 @@
+import io
+import os
+import sys
+import time
+import base64
+import tempfile
+
+from pikepdf import Pdf
+
+# run from the enclave directory: python3 tests/bench_pdf_overlay.py
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), "..", "server"))
+
+from lib import config_util  # noqa: E402
+from lib import pdf_tool_util  # noqa: E402
+
+RESOURCES_DIR = os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), "..", "server", "resources")
+PAGE_COUNT_LIST = [10, 50, 200]
+SIGNER_COUNT = 3
+REPEAT_COUNT = 3
+
+
+def __gen_template_b64(page_count):
+    pdf_stream = io.BytesIO()
+
+    with Pdf.new() as pdf_obj:
+        for _ in range(page_count):
+            pdf_obj.add_blank_page(page_size=(612, 792))
+
+        pdf_obj.save(pdf_stream)
+
+    return base64.b64encode(pdf_stream.getvalue()).decode("utf-8")
+
+
+def __gen_signer_list(page_count):
+    # a signature and a date field of every signer on every page
+    return [{
+        "name": f"Signer {signer_idx}",
+        "locale": "en-us",
+        "signHint": True,
+        "emailAddr": f"signer{signer_idx}@example.com",
+        "signingTime": "2022/01/01 (UTC)",
+        "fieldList": [field for page_no in range(1, page_count + 1) for field in [
+            {"pageNo": page_no, "x": 50 + signer_idx * 180, "y": 600, "height": 40,
+             "type": pdf_tool_util.FIELD_TYPE_SIGNATURE},
+            {"pageNo": page_no, "x": 50 + signer_idx * 180, "y": 660, "height": 12,
+             "type": pdf_tool_util.FIELD_TYPE_DATE}
+        ]]
+    } for signer_idx in range(SIGNER_COUNT)]
+
+
+def __measure_ms(gen_fn):
+    elapsed_list = []
+
+    for _ in range(REPEAT_COUNT):
+        start_time = time.perf_counter()
+        if gen_fn() is None:
+            raise Exception("failed to generate pdf")
+
+        elapsed_list.append((time.perf_counter() - start_time) * 1000)
+
+    return min(elapsed_list)
+
+
+def main():
+    # HanaMinA and JasonHandwriting2 are not kept in the repository
+    pdf_tool_util.SEAL_IMAGE_FILE_PATH = os.path.join(
+        RESOURCES_DIR, "img", "seal.png")
+    pdf_tool_util.INCONSOLATA_FONT_FILE_PATH = os.path.join(
+        RESOURCES_DIR, "font", "Inconsolata-Regular.ttf")
+    pdf_tool_util.DANCING_SCRIPT_FONT_FILE_PATH = os.path.join(
+        RESOURCES_DIR, "font", "DancingScript-Regular.ttf")
+    pdf_tool_util.HANAMIN_FONT_FILE_PATH = pdf_tool_util.INCONSOLATA_FONT_FILE_PATH
+    pdf_tool_util.JASON_HANDWRITING_FONT_FILE_PATH = pdf_tool_util.DANCING_SCRIPT_FONT_FILE_PATH
+
+    renderer_list = [pdf_tool_util.OVERLAY_RENDERER_REPORTLAB,
+                     pdf_tool_util.OVERLAY_RENDERER_DIRECT]
+    print(f"pages  {'  '.join([f'{renderer:>9} signed/preview' for renderer in renderer_list])}")
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        config_util.CONFIG_PATH = os.path.join(config_dir, "tee_server.conf")
+
+        for page_count in PAGE_COUNT_LIST:
+            template_b64 = __gen_template_b64(page_count)
+            signer_list = __gen_signer_list(page_count)
+            result_list = []
+
+            for renderer in renderer_list:
+                with open(config_util.CONFIG_PATH, "w") as config_file:
+                    config_file.write(f"overlay_renderer {renderer}\n")
+
+                config_util.__config_dict = None
+                pdf_tool_util.init()
+
+                signed_ms = __measure_ms(lambda: pdf_tool_util.gen_signed_pdf(
+                    template_b64, signer_list, "0123456789abcdef"))
+                preview_ms = __measure_ms(lambda: pdf_tool_util.gen_preview_pdf(
+                    template_b64, signer_list, ""))
+                result_list.append(f"{signed_ms:9.0f} / {preview_ms:9.0f} ms")
+
+            print(f"{page_count:5}  {'  '.join(result_list)}")
+
+
+if __name__ == "__main__":
+    main()
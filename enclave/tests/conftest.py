@@ -0,0 +1,7 @@
+import os
+import sys
+
+# modules are imported relative to the server directory as tee_server.py does,
+# the tests are kept outside of it so that they are not copied into the enclave image
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), "..", "server"))
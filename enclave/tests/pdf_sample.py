@@ -0,0 +1,148 @@
+import io
+
+from pikepdf import Pdf, Name, Dictionary, Encryption, ObjectStreamMode, parse_content_stream
+
+SAMPLE_CONTENT = b"BT /F1 24 Tf 72 720 Td (Hello) Tj ET"
+
+
+def build_pdf(obj_body_list):
+    # object n is obj_body_list[n - 1], the xref section is a classic table
+    pdf_bytes = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offset_list = []
+
+    for index, obj_body in enumerate(obj_body_list):
+        offset_list.append(len(pdf_bytes))
+        pdf_bytes.extend(f"{index + 1} 0 obj\n".encode("utf-8"))
+        pdf_bytes.extend(obj_body)
+        pdf_bytes.extend(b"\nendobj\n")
+
+    xref_offset = len(pdf_bytes)
+    pdf_bytes.extend(
+        f"xref\n0 {len(obj_body_list) + 1}\n0000000000 65535 f\r\n".encode("utf-8"))
+    for offset in offset_list:
+        pdf_bytes.extend(f"{offset:010d} 00000 n\r\n".encode("utf-8"))
+    pdf_bytes.extend(
+        f"trailer\n<< /Size {len(obj_body_list) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode("utf-8"))
+
+    return bytes(pdf_bytes)
+
+
+def __gen_content_obj():
+    return b"<< /Length %d >>\nstream\n%s\nendstream" % (len(SAMPLE_CONTENT), SAMPLE_CONTENT)
+
+
+def gen_plain_pdf():
+    # two pages with their own indirect resources
+    return build_pdf([
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R 7 0 R] /Count 2 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources 4 0 R /Contents 5 0 R >>",
+        b"<< /Font << /F1 6 0 R >> >>",
+        __gen_content_obj(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources 4 0 R /Contents 5 0 R >>"
+    ])
+
+
+def gen_inherited_resources_pdf():
+    # resources and media box are inherited from the page tree root
+    return build_pdf([
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R 6 0 R] /Count 2 /MediaBox [0 0 612 792] /Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Type /Page /Parent 2 0 R /Contents 4 0 R >>",
+        __gen_content_obj(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Type /Page /Parent 2 0 R /Contents 4 0 R >>"
+    ])
+
+
+def gen_xref_stream_pdf(pdf_bytes):
+    # rewrite with object streams, so that the xref section is a stream
+    output_stream = io.BytesIO()
+    with Pdf.open(io.BytesIO(pdf_bytes)) as pdf_obj:
+        pdf_obj.save(output_stream,
+                     object_stream_mode=ObjectStreamMode.generate)
+
+    return output_stream.getvalue()
+
+
+def gen_encrypted_pdf(pdf_bytes):
+    # encrypted with an empty user password, so that it opens without one
+    output_stream = io.BytesIO()
+    with Pdf.open(io.BytesIO(pdf_bytes)) as pdf_obj:
+        pdf_obj.save(output_stream, encryption=Encryption(
+            owner="owner", user=""))
+
+    return output_stream.getvalue()
+
+
+def gen_repaired_pdf(pdf_bytes):
+    # point startxref to a wrong offset, qpdf has to reconstruct the xref table
+    startxref_idx = pdf_bytes.rindex(b"startxref")
+
+    return pdf_bytes[:startxref_idx] + b"startxref\n9\n%%EOF\n"
+
+
+def check_pdf(pdf_obj):
+    # the pinned pikepdf names it check, later versions check_pdf_syntax
+    if hasattr(pdf_obj, "check_pdf_syntax"):
+        return pdf_obj.check_pdf_syntax()
+
+    return pdf_obj.check()
+
+
+def __multiply_matrix(m1, m2):
+    return [m1[0] * m2[0] + m1[1] * m2[2], m1[0] * m2[1] + m1[1] * m2[3],
+            m1[2] * m2[0] + m1[3] * m2[2], m1[2] * m2[1] + m1[3] * m2[3],
+            m1[4] * m2[0] + m1[5] * m2[2] + m2[4], m1[4] * m2[1] + m1[5] * m2[3] + m2[5]]
+
+
+def __collect_drawings(content_obj, resources, ctm, drawing_list):
+    ctm_stack = []
+    text_matrix = [1, 0, 0, 1, 0, 0]
+    font_name = None
+    font_size = None
+
+    for operands, operator in parse_content_stream(content_obj):
+        operator = str(operator)
+
+        if operator == "q":
+            ctm_stack.append(ctm)
+        elif operator == "Q":
+            ctm = ctm_stack.pop()
+        elif operator == "cm":
+            ctm = __multiply_matrix([float(value) for value in operands], ctm)
+        elif operator == "BT":
+            text_matrix = [1, 0, 0, 1, 0, 0]
+        elif operator == "Tf":
+            font_name = str(resources.Font[operands[0]].BaseFont)[1:].split("+")[-1]
+            font_size = float(operands[1])
+        elif operator == "Tm":
+            text_matrix = [float(value) for value in operands]
+        elif operator == "Td":
+            text_matrix = __multiply_matrix(
+                [1, 0, 0, 1, float(operands[0]), float(operands[1])], text_matrix)
+        elif operator in ["Tj", "TJ"]:
+            matrix = __multiply_matrix(text_matrix, ctm)
+            drawing_list.append(("text", font_name, round(
+                font_size * matrix[3], 2), round(matrix[4], 2), round(matrix[5], 2)))
+        elif operator == "Do":
+            xobject = resources.XObject[operands[0]]
+
+            if xobject.Subtype == Name.Form:
+                form_matrix = [float(value) for value in xobject.get(
+                    "/Matrix", [1, 0, 0, 1, 0, 0])]
+                __collect_drawings(xobject, xobject.get("/Resources", Dictionary()),
+                                   __multiply_matrix(form_matrix, ctm), drawing_list)
+            else:
+                drawing_list.append(("image", round(ctm[0], 2), round(
+                    ctm[3], 2), round(ctm[4], 2), round(ctm[5], 2)))
+
+
+def collect_page_drawings(page_obj):
+    # texts and images drawn on the page with their sizes and positions in page space
+    drawing_list = []
+    __collect_drawings(page_obj, page_obj.Resources,
+                       [1, 0, 0, 1, 0, 0], drawing_list)
+
+    return sorted(drawing_list)
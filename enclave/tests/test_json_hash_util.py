@@ -0,0 +1,41 @@
+import json
+import base64
+import hashlib
+
+import pytest
+
+from lib import json_hash_util
+
+
+def __gen_json_hash(obj):
+    return hashlib.sha256(json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode("utf-8")).hexdigest()
+
+
+LARGE_DATA_STR = base64.b64encode(bytes(range(256)) * 64).decode("ascii")
+
+JSON_OBJ_LIST = [
+    "",
+    LARGE_DATA_STR,
+    'quote " and backslash \\ in ' + LARGE_DATA_STR,
+    "line\nbreak\ttab\x00\x1f in " + LARGE_DATA_STR,
+    "非 ascii 字串 " + LARGE_DATA_STR,
+    "  😀 " + LARGE_DATA_STR,
+    {"data": LARGE_DATA_STR, "fileName": "文件.pdf", "size": 1.5, "isDone": True, "none": None},
+    {"b": [LARGE_DATA_STR, {"c": LARGE_DATA_STR}], "a": [], "d": {}},
+    {1: LARGE_DATA_STR, "key": "value"},
+    [LARGE_DATA_STR, ("tuple", LARGE_DATA_STR), 0, -1, 1e20, False],
+    {"small": {"nested": ["value", 1, None]}}
+]
+
+
+@pytest.mark.parametrize("obj", JSON_OBJ_LIST)
+def test_gen_canonical_hash(obj):
+    assert json_hash_util.gen_canonical_hash(obj) == __gen_json_hash(obj)
+
+
+@pytest.mark.parametrize("obj", JSON_OBJ_LIST)
+def test_gen_canonical_hash_with_small_strings(monkeypatch, obj):
+    # every string takes the streamed path
+    monkeypatch.setattr(json_hash_util, "LARGE_STRING_MIN_SIZE", 1)
+
+    assert json_hash_util.gen_canonical_hash(obj) == __gen_json_hash(obj)
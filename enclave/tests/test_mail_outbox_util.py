@@ -0,0 +1,123 @@
+import threading
+
+import pytest
+
+from lib import mail_outbox_util
+from lib.err_code_util import ErrCodeList
+
+
+@pytest.fixture(autouse=True)
+def reset_outbox_stats(monkeypatch):
+    monkeypatch.setattr(mail_outbox_util, "__outbox_stats", {
+                        "queued": 0, "sent": 0, "retried": 0, "failed": 0, "dropped": 0})
+    monkeypatch.setattr(mail_outbox_util, "MAIL_OUTBOX_RETRY_DELAY", 0)
+
+
+def __put_mail_and_wait(ret_code_list, is_retryable=False):
+    # each send returns or raises the next item of ret_code_list
+    call_list = []
+
+    def send_fn(mail_idx):
+        ret_code = ret_code_list[len(call_list)]
+        call_list.append(mail_idx)
+
+        if isinstance(ret_code, BaseException):
+            raise ret_code
+
+        return ret_code
+
+    assert mail_outbox_util.put_mail(
+        "test mail", send_fn, [0], lambda: is_retryable)
+    assert mail_outbox_util.wait_outbox_empty(5)
+
+    return call_list, mail_outbox_util.get_outbox_stats()
+
+
+def test_mail_is_sent_in_background():
+    call_list, stats = __put_mail_and_wait([ErrCodeList.SUCCES.value])
+
+    assert call_list == [0]
+    assert stats == {"queued": 1, "sent": 1, "retried": 0,
+                     "failed": 0, "dropped": 0, "depth": 0}
+
+
+@pytest.mark.parametrize("ret_code", [ErrCodeList.SEND_EMAIL_FAIL.value, ErrCodeList.INVALID_EMAIL_CREDENTIAL.value, RuntimeError("send error")])
+def test_failed_mail_is_not_sent_again(ret_code):
+    call_list, stats = __put_mail_and_wait([ret_code])
+
+    assert call_list == [0]
+    assert stats == {"queued": 1, "sent": 0, "retried": 0,
+                     "failed": 1, "dropped": 0, "depth": 0}
+
+
+def test_retryable_failure_is_sent_again():
+    call_list, stats = __put_mail_and_wait(
+        [ErrCodeList.SEND_EMAIL_FAIL.value, ErrCodeList.SEND_EMAIL_FAIL.value, ErrCodeList.SUCCES.value], True)
+
+    assert call_list == [0, 0, 0]
+    assert stats == {"queued": 1, "sent": 1, "retried": 2,
+                     "failed": 0, "dropped": 0, "depth": 0}
+
+
+def test_retry_is_bounded():
+    call_list, stats = __put_mail_and_wait(
+        [ErrCodeList.SEND_EMAIL_FAIL.value] * (mail_outbox_util.MAIL_OUTBOX_MAX_RETRY_COUNT + 1), True)
+
+    assert call_list == [0] * (mail_outbox_util.MAIL_OUTBOX_MAX_RETRY_COUNT + 1)
+    assert stats == {"queued": 1, "sent": 0, "retried": mail_outbox_util.MAIL_OUTBOX_MAX_RETRY_COUNT,
+                     "failed": 1, "dropped": 0, "depth": 0}
+
+
+def test_retry_waits_without_blocking_other_mails(monkeypatch):
+    monkeypatch.setattr(mail_outbox_util, "MAIL_OUTBOX_RETRY_DELAY", 60)
+    call_list = []
+
+    def send_fn(description):
+        call_list.append(description)
+        return ErrCodeList.SEND_EMAIL_FAIL.value if description == "first mail" else ErrCodeList.SUCCES.value
+
+    assert mail_outbox_util.put_mail(
+        "first mail", send_fn, ["first mail"], lambda: True)
+    assert mail_outbox_util.put_mail(
+        "second mail", send_fn, ["second mail"], lambda: True)
+
+    # the first mail waits in the outbox for its retry after the second one is sent
+    with mail_outbox_util.__outbox_cond:
+        assert mail_outbox_util.__outbox_cond.wait_for(
+            lambda: mail_outbox_util.__outbox_stats["sent"] == 1, 5)
+
+    assert call_list == ["first mail", "second mail"]
+    assert mail_outbox_util.get_outbox_stats() == {
+        "queued": 2, "sent": 1, "retried": 1, "failed": 0, "dropped": 0, "depth": 1}
+
+    # let the retry be due at once, and be the last one
+    monkeypatch.setattr(mail_outbox_util, "MAIL_OUTBOX_MAX_RETRY_COUNT", 1)
+    with mail_outbox_util.__outbox_cond:
+        mail_outbox_util.__outbox_queue[0]["sendTime"] = 0
+        mail_outbox_util.__outbox_cond.notify_all()
+
+    assert mail_outbox_util.wait_outbox_empty(5)
+    assert call_list == ["first mail", "second mail", "first mail"]
+
+
+def test_mail_is_dropped_when_outbox_is_full(monkeypatch):
+    monkeypatch.setattr(mail_outbox_util, "MAIL_OUTBOX_MAX_SIZE", 1)
+    release_event = threading.Event()
+    started_event = threading.Event()
+
+    def blocked_send_fn():
+        started_event.set()
+        release_event.wait(5)
+        return ErrCodeList.SUCCES.value
+
+    # the first mail keeps the worker busy, the second one fills the outbox
+    assert mail_outbox_util.put_mail("first mail", blocked_send_fn, [])
+    assert started_event.wait(5)
+    assert mail_outbox_util.put_mail("second mail", blocked_send_fn, [])
+    assert not mail_outbox_util.put_mail("third mail", blocked_send_fn, [])
+
+    release_event.set()
+
+    assert mail_outbox_util.wait_outbox_empty(5)
+    assert mail_outbox_util.get_outbox_stats() == {
+        "queued": 2, "sent": 2, "retried": 0, "failed": 0, "dropped": 1, "depth": 0}
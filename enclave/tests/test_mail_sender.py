@@ -0,0 +1,120 @@
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from lib import mail_sender
+from lib import sendgrid_util
+from lib.err_code_util import ErrCodeList
+
+
+class SendGridStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    request_list = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        message = json.loads(self.rfile.read(
+            int(self.headers["Content-Length"])))
+        # the sendgrid helper does not keep the order of personalizations
+        email_list = sorted([personalization["to"][0]["email"]
+                             for personalization in message["personalizations"]])
+        self.request_list.append(
+            (self.headers["Authorization"], email_list))
+
+        # sendgrid rejects the whole request if any address is invalid,
+        # other keys of "sg-key-<status>" are answered with the status
+        if self.headers["Authorization"].startswith("Bearer sg-key-"):
+            status_code = int(self.headers["Authorization"].split("-")[-1])
+        elif self.headers["Authorization"] != "Bearer sg-key":
+            status_code = 401
+        elif any([email.startswith("invalid") for email in email_list]):
+            status_code = 400
+        else:
+            status_code = 202
+
+        self.send_response(status_code)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+@pytest.fixture
+def sendgrid_stub(monkeypatch):
+    stub_server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), SendGridStubHandler)
+    stub_server.daemon_threads = True
+    threading.Thread(target=stub_server.serve_forever, daemon=True).start()
+
+    SendGridStubHandler.request_list = []
+    monkeypatch.setattr(sendgrid_util, "SENDGRID_API_HOST",
+                        f"http://127.0.0.1:{stub_server.server_address[1]}")
+
+    yield SendGridStubHandler.request_list
+
+    stub_server.shutdown()
+    stub_server.server_close()
+
+
+def __gen_mail_sender(api_key="sg-key"):
+    return mail_sender.MailSender({"serviceProvider": "sg", "sgSecret": api_key, "sgDomain": "example.com"})
+
+
+def test_batch_is_sent_in_one_request(sendgrid_stub):
+    ret_code_list = __gen_mail_sender().send_signer_final_mail_batch(
+        "en-us", ["a@example.com", "b@example.com"], "task", None)
+
+    assert ret_code_list == [ErrCodeList.SUCCES.value] * 2
+    assert sendgrid_stub == [
+        ("Bearer sg-key", ["a@example.com", "b@example.com"])]
+
+
+def test_rejected_batch_reports_each_signer(sendgrid_stub):
+    ret_code_list = __gen_mail_sender().send_signer_final_mail_batch(
+        "en-us", ["a@example.com", "invalid@example", "b@example.com"], "task", None)
+
+    assert ret_code_list == [ErrCodeList.SUCCES.value,
+                             ErrCodeList.SEND_EMAIL_FAIL.value, ErrCodeList.SUCCES.value]
+    assert [email_list for _, email_list in sendgrid_stub] == [
+        ["a@example.com", "b@example.com", "invalid@example"], ["a@example.com"], ["invalid@example"], ["b@example.com"]]
+
+
+def test_invalid_api_key(sendgrid_stub):
+    ret_code_list = __gen_mail_sender("other-key").send_signer_final_mail_batch(
+        "en-us", ["a@example.com", "b@example.com"], "task", None)
+
+    assert ret_code_list == [ErrCodeList.INVALID_EMAIL_CREDENTIAL.value] * 2
+
+
+@pytest.mark.parametrize("api_key, is_retryable", [
+    ("sg-key-429", True),
+    ("sg-key-503", True),
+    ("sg-key-400", False),
+    ("sg-key-403", False),
+    ("other-key", False)
+])
+def test_retryable_error(sendgrid_stub, api_key, is_retryable):
+    mail_sender_obj = __gen_mail_sender(api_key)
+    ret_code = mail_sender_obj.send_notificant_error_mail(
+        "en-us", "a@example.com", "task", "file.pdf", None)
+
+    assert ret_code != ErrCodeList.SUCCES.value
+    assert mail_sender_obj.is_last_error_retryable() == is_retryable
+
+
+def test_connection_failure_is_retryable(monkeypatch):
+    # nothing listens on the port once the socket is closed
+    listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listen_socket.bind(("127.0.0.1", 0))
+    monkeypatch.setattr(sendgrid_util, "SENDGRID_API_HOST",
+                        f"http://127.0.0.1:{listen_socket.getsockname()[1]}")
+    listen_socket.close()
+
+    mail_sender_obj = __gen_mail_sender()
+
+    assert mail_sender_obj.send_notificant_error_mail(
+        "en-us", "a@example.com", "task", "file.pdf", None) == ErrCodeList.SEND_EMAIL_FAIL.value
+    assert mail_sender_obj.is_last_error_retryable()
@@ -0,0 +1,35 @@
+import pytest
+
+from lib import params_checker
+
+
+@pytest.mark.parametrize("signer_idx, is_valid", [
+    (0, True),
+    (999, True),
+    (1.5, False),
+    ("1", False),
+    (-1, False),
+    (1000, False)
+])
+def test_batch_signer_idx(signer_idx, is_valid):
+    sub_task_list_schema = params_checker.send_req_batch_job_schema[
+        "properties"]["subTaskList"]
+
+    assert params_checker.verify_param_with_schema(
+        [{"subTaskID": "sub-task", "signerIdx": signer_idx}], sub_task_list_schema) == is_valid
+
+
+@pytest.mark.parametrize("email_config, is_valid", [
+    ({"sesSMTPUsername": "user", "sesSMTPPassword": "password"}, True),
+    ({"sesTransport": "smtp", "sesSMTPUsername": "user", "sesSMTPPassword": "password"}, True),
+    ({"sesTransport": "api", "sesAPIKeyID": "id", "sesAPIKeySecret": "secret"}, True),
+    ({"sesAPIKeyID": "id", "sesAPIKeySecret": "secret"}, False),
+    ({"sesTransport": "api", "sesSMTPUsername": "user", "sesSMTPPassword": "password"}, False),
+    ({"sesTransport": "smtp"}, False)
+])
+def test_ses_email_config(email_config, is_valid):
+    email_config = dict(email_config, serviceProvider="ses",
+                        sesDomain="example.com")
+
+    assert params_checker.verify_param_with_schema(
+        {"emailConfig": email_config, "bearerSecret": "secret"}, params_checker.task_decrypted_email_config_schema) == is_valid
@@ -0,0 +1,261 @@
+import io
+import os
+import base64
+
+import pytest
+from pikepdf import Pdf, parse_content_stream
+from reportlab.pdfgen import canvas
+
+from lib import config_util
+from lib import pdf_direct_util
+from lib import pdf_tool_util
+import pdf_sample
+
+RESOURCES_DIR = os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), "..", "server", "resources")
+
+
+@pytest.fixture(scope="module", autouse=True)
+def init_pdf_tool():
+    # HanaMinA and JasonHandwriting2 are not kept in the repository, other
+    # shipped fonts stand in for them
+    pdf_tool_util.SEAL_IMAGE_FILE_PATH = os.path.join(
+        RESOURCES_DIR, "img", "seal.png")
+    pdf_tool_util.INCONSOLATA_FONT_FILE_PATH = os.path.join(
+        RESOURCES_DIR, "font", "Inconsolata-Regular.ttf")
+    pdf_tool_util.DANCING_SCRIPT_FONT_FILE_PATH = os.path.join(
+        RESOURCES_DIR, "font", "DancingScript-Regular.ttf")
+    pdf_tool_util.HANAMIN_FONT_FILE_PATH = pdf_tool_util.INCONSOLATA_FONT_FILE_PATH
+    pdf_tool_util.JASON_HANDWRITING_FONT_FILE_PATH = pdf_tool_util.DANCING_SCRIPT_FONT_FILE_PATH
+    pdf_tool_util.init()
+
+
+def __gen_signer_list():
+    return [{
+        "name": "Alice",
+        "locale": "en-us",
+        "signHint": False,
+        "emailAddr": "alice@example.com",
+        "signingTime": "2022-01-01 00:00:00 UTC",
+        "fieldList": [
+            {"pageNo": 1, "x": 50, "y": 50, "height": 40, "type": pdf_tool_util.FIELD_TYPE_SIGNATURE},
+            {"pageNo": 1, "x": 50, "y": 150, "height": 12, "type": pdf_tool_util.FIELD_TYPE_DATE}
+        ]
+    }, {
+        "name": "Bob",
+        "locale": "zh-tw",
+        "signHint": True,
+        "emailAddr": "bob@example.com",
+        "signingTime": "2022-01-02 00:00:00 UTC",
+        "fieldList": [
+            {"pageNo": 2, "x": 300, "y": 400, "height": 60, "type": pdf_tool_util.FIELD_TYPE_SIGNATURE}
+        ]
+    }]
+
+
+def __open_pdf_b64(pdf_b64, password=""):
+    pdf_obj = Pdf.open(io.BytesIO(base64.b64decode(pdf_b64)), password=password)
+    assert pdf_sample.check_pdf(pdf_obj) == []
+
+    return pdf_obj
+
+
+def __set_config(monkeypatch, tmp_path, config_text):
+    config_path = tmp_path / "tee_server.conf"
+    config_path.write_text(config_text)
+
+    monkeypatch.setattr(config_util, "CONFIG_PATH", str(config_path))
+    monkeypatch.setattr(config_util, "__config_dict", None)
+    pdf_tool_util.init()
+
+
+@pytest.mark.parametrize("pdf_bytes", [
+    pdf_sample.gen_plain_pdf(),
+    pdf_sample.gen_xref_stream_pdf(pdf_sample.gen_plain_pdf()),
+    pdf_sample.gen_inherited_resources_pdf(),
+    pdf_sample.gen_repaired_pdf(pdf_sample.gen_plain_pdf()),
+    pdf_sample.gen_encrypted_pdf(pdf_sample.gen_plain_pdf())
+], ids=["plain", "xref stream", "inherited resources", "repaired", "encrypted"])
+@pytest.mark.parametrize("incremental", [False, True])
+def test_gen_signed_pdf(monkeypatch, tmp_path, pdf_bytes, incremental):
+    __set_config(monkeypatch, tmp_path,
+                 "signed_pdf_save incremental\n" if incremental else "signed_pdf_save full\n")
+
+    signed_pdf_b64 = pdf_tool_util.gen_signed_pdf(base64.b64encode(
+        pdf_bytes).decode("utf-8"), __gen_signer_list(), "0123456789abcdef")
+
+    with Pdf.open(io.BytesIO(pdf_bytes)) as input_pdf:
+        is_repaired = len(input_pdf.get_warnings()) > 0
+        is_encrypted = input_pdf.is_encrypted
+
+    # the original bytes are kept as they are only by an incremental update,
+    # repaired and encrypted templates are rewritten
+    assert signed_pdf_b64 is not None
+    assert base64.b64decode(signed_pdf_b64).startswith(
+        pdf_bytes) == (incremental and not is_repaired and not is_encrypted)
+    assert base64.b64decode(signed_pdf_b64).endswith(b"letsesign=true\n")
+
+    with __open_pdf_b64(signed_pdf_b64) as pdf_obj:
+        assert len(pdf_obj.pages) == 2
+        assert "/XObject" in pdf_obj.pages[0].Resources
+        assert "/Font" in pdf_obj.pages[0].Resources
+
+
+@pytest.mark.parametrize("password", ["", "secret"])
+def test_gen_preview_pdf(password):
+    preview_pdf_b64 = pdf_tool_util.gen_preview_pdf(base64.b64encode(
+        pdf_sample.gen_plain_pdf()).decode("utf-8"), __gen_signer_list(), password)
+
+    assert preview_pdf_b64 is not None
+
+    with __open_pdf_b64(preview_pdf_b64, password) as pdf_obj:
+        assert pdf_obj.is_encrypted == (password != "")
+        assert len(pdf_obj.pages) == 2
+
+
+def test_page_out_of_range():
+    signer_list = __gen_signer_list()
+    signer_list[0]["fieldList"][0]["pageNo"] = 3
+
+    assert pdf_tool_util.gen_signed_pdf(base64.b64encode(
+        pdf_sample.gen_plain_pdf()).decode("utf-8"), signer_list, "0123456789abcdef") is None
+
+
+@pytest.mark.parametrize("line_break", ["\n", "\r\n"])
+def test_decode_b64_with_line_breaks(monkeypatch, line_break):
+    # small chunks, so line breaks fall inside and across chunk boundaries
+    monkeypatch.setattr(pdf_tool_util, "B64_CHUNK_SIZE", 30)
+    data_bytes = os.urandom(1000)
+    data_b64 = base64.encodebytes(data_bytes).decode(
+        "utf-8").replace("\n", line_break)
+
+    data_file = io.BytesIO()
+    pdf_tool_util.__decode_b64_to_file(data_b64, data_file)
+
+    assert data_file.read() == data_bytes
+
+
+def test_gen_signed_pdf_with_line_breaks():
+    pdf_b64 = base64.encodebytes(pdf_sample.gen_plain_pdf()).decode("utf-8")
+
+    assert "\n" in pdf_b64
+    assert pdf_tool_util.gen_signed_pdf(
+        pdf_b64, __gen_signer_list(), "0123456789abcdef") is not None
+
+
+@pytest.mark.parametrize("data_size", [0, 1, 2, 3, 29, 30, 31, 1000])
+def test_encode_file_to_b64(monkeypatch, data_size):
+    monkeypatch.setattr(pdf_tool_util, "B64_CHUNK_SIZE", 30)
+    data_bytes = os.urandom(data_size)
+
+    assert pdf_tool_util.__encode_file_to_b64(io.BytesIO(
+        data_bytes)) == base64.b64encode(data_bytes).decode("utf-8")
+
+
+@pytest.mark.parametrize("incremental", [False, True])
+def test_sig_block_matches_page_drawing(monkeypatch, tmp_path, incremental):
+    __set_config(monkeypatch, tmp_path,
+                 "signed_pdf_save incremental\n" if incremental else "signed_pdf_save full\n")
+    signer_list = __gen_signer_list()
+    magic_number = "0123456789abcdef"
+
+    # draw the fields of first page directly on a page, as the original code did
+    packet = io.BytesIO()
+    can = canvas.Canvas(packet, pagesize=(612, 792))
+    for signer_idx, signer in enumerate(signer_list):
+        for field in signer["fieldList"]:
+            if field["pageNo"] != 1:
+                continue
+
+            if field["type"] == pdf_tool_util.FIELD_TYPE_SIGNATURE:
+                pdf_tool_util.__draw_sig_field(False, can, 792, field["x"], field["y"], field["height"],
+                                               signer["name"], magic_number, signer_idx + 1)
+            else:
+                pdf_tool_util.__draw_text_field(
+                    can, 792, field["x"], field["y"], field["height"], signer["signingTime"])
+    can.save()
+
+    with Pdf.open(io.BytesIO(packet.getvalue())) as reference_pdf:
+        reference_drawing_list = pdf_sample.collect_page_drawings(
+            reference_pdf.pages[0])
+
+    signed_pdf_b64 = pdf_tool_util.gen_signed_pdf(base64.b64encode(
+        pdf_sample.gen_plain_pdf()).decode("utf-8"), signer_list, magic_number)
+
+    with __open_pdf_b64(signed_pdf_b64) as pdf_obj:
+        drawing_list = [drawing for drawing in pdf_sample.collect_page_drawings(
+            pdf_obj.pages[0]) if drawing[1] != "Helvetica"]
+
+    assert len(reference_drawing_list) == 4
+    assert drawing_list == reference_drawing_list
+
+
+def __decode_form_texts(form_obj):
+    text_list = []
+    code_dict = {}
+
+    for operands, operator in parse_content_stream(form_obj):
+        if str(operator) == "Tf":
+            code_dict = {code: char for char, code in pdf_direct_util.__parse_to_unicode(
+                form_obj.Resources.Font[operands[0]].ToUnicode.read_bytes()).items()}
+        elif str(operator) == "Tj":
+            text_list.append("".join([code_dict[code]
+                                      for code in bytes(operands[0])]))
+
+    return text_list
+
+
+@pytest.mark.parametrize("is_preview", [False, True])
+def test_direct_renderer_matches_reportlab(monkeypatch, tmp_path, is_preview):
+    signer_list = __gen_signer_list()
+    signer_list[0]["signHint"] = True
+    pdf_b64 = base64.b64encode(pdf_sample.gen_plain_pdf()).decode("utf-8")
+    drawing_list_dict = {}
+    direct_text_list = []
+
+    gen_overlay_form = pdf_direct_util.DirectCanvas.gen_overlay_form
+
+    def gen_overlay_form_spy(self, pdf_obj, page_idx):
+        overlay_form = gen_overlay_form(self, pdf_obj, page_idx)
+        direct_text_list.append(__decode_form_texts(overlay_form))
+
+        return overlay_form
+
+    monkeypatch.setattr(pdf_direct_util.DirectCanvas,
+                        "gen_overlay_form", gen_overlay_form_spy)
+
+    for renderer in [pdf_tool_util.OVERLAY_RENDERER_REPORTLAB, pdf_tool_util.OVERLAY_RENDERER_DIRECT]:
+        __set_config(monkeypatch, tmp_path, f"overlay_renderer {renderer}\n")
+
+        if is_preview:
+            output_pdf_b64 = pdf_tool_util.gen_preview_pdf(
+                pdf_b64, signer_list, "")
+        else:
+            output_pdf_b64 = pdf_tool_util.gen_signed_pdf(
+                pdf_b64, signer_list, "0123456789abcdef")
+
+        with __open_pdf_b64(output_pdf_b64) as pdf_obj:
+            drawing_list_dict[renderer] = [pdf_sample.collect_page_drawings(
+                page_obj) for page_obj in pdf_obj.pages]
+
+    monkeypatch.undo()
+    pdf_tool_util.init()
+
+    # page 1 is drawn directly, the zh-tw sign hint on page 2 is not in the stand-in
+    # font of HanaMinA, so the page is drawn by reportlab instead
+    if is_preview:
+        assert direct_text_list == [["Your signature will", "be placed here"]]
+    else:
+        assert direct_text_list == [["2022-01-01 00:00:00 UTC"]]
+
+    assert drawing_list_dict[pdf_tool_util.OVERLAY_RENDERER_DIRECT] == drawing_list_dict[pdf_tool_util.OVERLAY_RENDERER_REPORTLAB]
+    assert len(drawing_list_dict[pdf_tool_util.OVERLAY_RENDERER_DIRECT][1]) > 0
+
+
+@pytest.mark.parametrize("config_text, setting_name", [
+    ("overlay_renderer pdfkit\n", "overlay_renderer"),
+    ("signed_pdf_save append\n", "signed_pdf_save")
+])
+def test_unsupported_setting(monkeypatch, tmp_path, config_text, setting_name):
+    with pytest.raises(Exception, match=setting_name):
+        __set_config(monkeypatch, tmp_path, config_text)
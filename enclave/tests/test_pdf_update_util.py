@@ -0,0 +1,135 @@
+import io
+
+import pytest
+from pikepdf import Pdf, Page, Name, Array, Dictionary, parse_content_stream
+
+from lib import pdf_update_util
+import pdf_sample
+
+
+def __add_overlay(pdf_obj, page_obj):
+    # the same kind of form xobject pdf_tool_util places on pages
+    overlay_form = pdf_obj.make_stream(b"0 0 1 rg 10 10 50 50 re f")
+    overlay_form.Type = Name.XObject
+    overlay_form.Subtype = Name.Form
+    overlay_form.BBox = Array([0, 0, 612, 792])
+    overlay_form.Resources = Dictionary()
+
+    Page(page_obj).add_overlay(overlay_form)
+
+
+def __gen_updated_pdf(pdf_bytes, page_idx_list, incremental):
+    input_file = io.BytesIO(pdf_bytes)
+    output_stream = io.BytesIO()
+
+    with Pdf.open(input_file) as pdf_obj:
+        update_writer = pdf_update_util.IncrementalUpdateWriter(pdf_obj)
+
+        for page_idx in page_idx_list:
+            update_writer.track_page(pdf_obj.pages[page_idx])
+            __add_overlay(pdf_obj, pdf_obj.pages[page_idx])
+
+        if incremental:
+            if not update_writer.write_updated_pdf(input_file, output_stream):
+                return None
+        else:
+            pdf_obj.save(output_stream)
+
+    return output_stream.getvalue()
+
+
+def __get_effective_resources(page_obj):
+    node = page_obj
+    while node is not None:
+        if "/Resources" in node:
+            return node.Resources
+
+        node = node.get("/Parent")
+
+    return Dictionary()
+
+
+def __gen_page_view_list(pdf_bytes):
+    page_view_list = []
+
+    with Pdf.open(io.BytesIO(pdf_bytes)) as pdf_obj:
+        assert pdf_sample.check_pdf(pdf_obj) == []
+
+        for page_obj in pdf_obj.pages:
+            resources = __get_effective_resources(page_obj)
+            xobject_name_list = resources.XObject.keys() if "/XObject" in resources else []
+            operator_list = []
+            missing_xobject_list = []
+
+            for operands, operator in parse_content_stream(page_obj):
+                operator_list.append(str(operator))
+
+                # every placed xobject must be found in the page resources
+                if str(operator) == "Do" and str(operands[0]) not in xobject_name_list:
+                    missing_xobject_list.append(str(operands[0]))
+
+            page_view_list.append({
+                "operators": operator_list,
+                "fonts": sorted(resources.Font.keys()) if "/Font" in resources else [],
+                "missingXObjects": missing_xobject_list
+            })
+
+    return page_view_list
+
+
+@pytest.mark.parametrize("pdf_bytes", [
+    pdf_sample.gen_plain_pdf(),
+    pdf_sample.gen_xref_stream_pdf(pdf_sample.gen_plain_pdf()),
+    pdf_sample.gen_inherited_resources_pdf(),
+    pdf_sample.gen_xref_stream_pdf(pdf_sample.gen_inherited_resources_pdf())
+], ids=["plain", "xref stream", "inherited resources", "inherited resources in xref stream"])
+@pytest.mark.parametrize("page_idx_list", [[0], [1], [0, 1]])
+def test_update_matches_full_save(pdf_bytes, page_idx_list):
+    updated_pdf_bytes = __gen_updated_pdf(pdf_bytes, page_idx_list, True)
+
+    assert updated_pdf_bytes is not None
+    assert updated_pdf_bytes.startswith(pdf_bytes)
+    assert __gen_page_view_list(updated_pdf_bytes) == __gen_page_view_list(
+        __gen_updated_pdf(pdf_bytes, page_idx_list, False))
+
+    for page_idx, page_view in enumerate(__gen_page_view_list(updated_pdf_bytes)):
+        assert page_view["fonts"] == ["/F1"]
+        assert page_view["missingXObjects"] == []
+        assert "Tj" in page_view["operators"]
+        assert ("Do" in page_view["operators"]) == (page_idx in page_idx_list)
+
+
+def test_update_on_updated_pdf():
+    updated_pdf_bytes = __gen_updated_pdf(
+        pdf_sample.gen_plain_pdf(), [0], True)
+    twice_updated_pdf_bytes = __gen_updated_pdf(updated_pdf_bytes, [0], True)
+
+    assert twice_updated_pdf_bytes.startswith(updated_pdf_bytes)
+    assert [page_view["operators"].count("Do") for page_view in __gen_page_view_list(
+        twice_updated_pdf_bytes)] == [2, 0]
+
+
+def test_repaired_pdf_falls_back():
+    repaired_pdf_bytes = pdf_sample.gen_repaired_pdf(
+        pdf_sample.gen_plain_pdf())
+
+    assert __gen_updated_pdf(repaired_pdf_bytes, [0], True) is None
+
+
+def test_untouched_pdf_is_unchanged():
+    pdf_bytes = pdf_sample.gen_plain_pdf()
+
+    assert __gen_page_view_list(__gen_updated_pdf(pdf_bytes, [], True)) == __gen_page_view_list(
+        pdf_bytes)
+
+
+def test_binary_id_is_kept():
+    # the /ID strings are arbitrary bytes, which need not be valid utf-8
+    pdf_bytes = pdf_sample.gen_plain_pdf().replace(
+        b"/Root 1 0 R >>", b"/Root 1 0 R /ID [(abcdefghijklmno\xde) (abcdefghijklmno\xde)] >>")
+    updated_pdf_bytes = __gen_updated_pdf(pdf_bytes, [0], True)
+
+    assert updated_pdf_bytes.startswith(pdf_bytes)
+
+    with Pdf.open(io.BytesIO(updated_pdf_bytes)) as pdf_obj:
+        assert bytes(pdf_obj.trailer.ID[0]) == b"abcdefghijklmno\xde"
@@ -0,0 +1,63 @@
+import re
+import json
+import base64
+import hashlib
+
+import pytest
+
+from lib import ses_api_util
+
+
+def __gen_request_bytes(from_addr, to_addr, message_segment_list):
+    # the request body as it was built in memory before
+    message_bytes = re.sub(r"\r\n|\r|\n", "\r\n",
+                           "".join(message_segment_list)).encode("ascii")
+
+    return json.dumps({
+        "FromEmailAddress": from_addr,
+        "Destination": {"ToAddresses": [to_addr]},
+        "Content": {"Raw": {"Data": base64.b64encode(message_bytes).decode("utf-8")}}
+    }, ensure_ascii=False, separators=(',', ':')).encode("utf-8")
+
+
+@pytest.mark.parametrize("message_segment_list", [
+    [],
+    ["Subject: test\n\nhello"],
+    ["Subject: test\r", "\n\r\n", "hello\r", "\r\nworld\n"],
+    ["a" * 10, "\n" * 11, "b\r" * 12, "\r"]
+])
+@pytest.mark.parametrize("read_size", [-1, 1, 7, 8192])
+def test_body_matches_request_bytes(monkeypatch, message_segment_list, read_size):
+    # small chunks, so line endings and base64 groups fall across chunk boundaries
+    monkeypatch.setattr(ses_api_util, "SES_DATA_CHUNK_SIZE", 4)
+    from_addr = "=?UTF-8?B?TGV0J3MgZVNpZ24=?= <do-not-reply@example.com>"
+    request_bytes = __gen_request_bytes(
+        from_addr, "ä@example.com", message_segment_list)
+
+    request_body = ses_api_util.RawEmailBody(
+        from_addr, "ä@example.com", message_segment_list)
+
+    for _ in range(2):
+        chunk_list = []
+        while True:
+            chunk_bytes = request_body.read(read_size)
+            if len(chunk_bytes) == 0:
+                break
+
+            assert read_size < 0 or len(chunk_bytes) <= read_size
+            chunk_list.append(chunk_bytes)
+
+        assert b"".join(chunk_list) == request_bytes
+        assert request_body.tell() == len(request_body) == len(request_bytes)
+
+        # a rewound body is read again from the start
+        request_body.seek(0)
+
+
+def test_body_hash():
+    message_segment_list = ["Subject: test\n\n", "hello\n" * 10000]
+    request_body = ses_api_util.RawEmailBody(
+        "from@example.com", "to@example.com", message_segment_list)
+
+    assert request_body.payload_hash == hashlib.sha256(__gen_request_bytes(
+        "from@example.com", "to@example.com", message_segment_list)).hexdigest()
@@ -0,0 +1,193 @@
+import types
+import smtplib
+
+import pytest
+
+from lib import smtp_pool_util
+
+
+class FakeSMTP():
+    def __init__(self, host, reply_dict):
+        self.host = host
+        self.reply_dict = reply_dict
+        self.command_list = []
+        self.data_bytes = b""
+        self.is_closed = False
+        self.is_alive = True
+
+    def rset(self):
+        self.command_list.append("rset")
+        if not self.is_alive:
+            raise smtplib.SMTPServerDisconnected()
+
+        return 250, b"OK"
+
+    def quit(self):
+        self.command_list.append("quit")
+        self.is_closed = True
+
+    def close(self):
+        self.is_closed = True
+
+    def ehlo_or_helo_if_needed(self):
+        pass
+
+    def __get_reply(self, command, success_code):
+        # a reply of None drops the connection
+        if command != "data":
+            self.command_list.append(command)
+
+        code = self.reply_dict.get(command, success_code)
+        if code is None:
+            raise smtplib.SMTPServerDisconnected()
+
+        return code, b"reply"
+
+    def mail(self, from_addr):
+        return self.__get_reply("mail", 250)
+
+    def rcpt(self, to_addr):
+        return self.__get_reply("rcpt", 250)
+
+    def putcmd(self, cmd):
+        self.command_list.append(cmd)
+
+    def getreply(self):
+        # the data command is answered before and after the message data
+        if self.command_list[-1] == "data":
+            reply = self.__get_reply("data", 354)
+            self.command_list.append("message")
+
+            return reply
+
+        return self.__get_reply("end of data", 250)
+
+    def send(self, data_bytes):
+        self.data_bytes += data_bytes
+
+
+@pytest.fixture
+def pool_state(monkeypatch):
+    # replyDictList holds the replies of each session opened in turn
+    pool_state = {"fakeSMTPList": [],
+                  "currentTime": 1000.0, "replyDictList": []}
+
+    def open_session(host, port, username, password):
+        reply_dict = pool_state["replyDictList"].pop(
+            0) if len(pool_state["replyDictList"]) > 0 else {}
+        pool_state["fakeSMTPList"].append(FakeSMTP(host, reply_dict))
+        return {"smtpServer": pool_state["fakeSMTPList"][-1], "messageCount": 0, "lastUsedTime": pool_state["currentTime"]}
+
+    monkeypatch.setattr(smtp_pool_util, "__open_session", open_session)
+    monkeypatch.setattr(smtp_pool_util, "__idle_session_dict", {})
+    monkeypatch.setattr(smtp_pool_util, "time", types.SimpleNamespace(
+        monotonic=lambda: pool_state["currentTime"]))
+
+    return pool_state
+
+
+def __send_mail(host, username="user", message_segment_list=["Subject: test\n\nhello\n"]):
+    smtp_pool_util.send_mail(host, 587, username, "password",
+                             "from@example.com", "to@example.com", message_segment_list)
+
+
+def test_session_is_reused_after_rset(pool_state):
+    __send_mail("smtp-a")
+    __send_mail("smtp-a")
+
+    assert len(pool_state["fakeSMTPList"]) == 1
+    assert pool_state["fakeSMTPList"][0].command_list == [
+        "mail", "rcpt", "data", "message", "end of data", "rset", "mail", "rcpt", "data", "message", "end of data"]
+
+
+def test_dead_session_is_replaced(pool_state):
+    __send_mail("smtp-a")
+    pool_state["fakeSMTPList"][0].is_alive = False
+    __send_mail("smtp-a")
+
+    assert len(pool_state["fakeSMTPList"]) == 2
+    assert pool_state["fakeSMTPList"][0].is_closed
+
+
+def test_expired_sessions_are_closed_for_all_keys(pool_state):
+    __send_mail("smtp-a")
+    __send_mail("smtp-b", "other user")
+
+    pool_state["currentTime"] += smtp_pool_util.SMTP_POOL_MAX_IDLE_TIME + 1
+    __send_mail("smtp-c")
+
+    assert [fake_smtp.is_closed for fake_smtp in pool_state["fakeSMTPList"]] == [
+        True, True, False]
+    assert len(smtp_pool_util.__idle_session_dict) == 1
+
+    pool_state["currentTime"] += smtp_pool_util.SMTP_POOL_MAX_IDLE_TIME + 1
+    smtp_pool_util.close_expired_sessions()
+
+    assert pool_state["fakeSMTPList"][2].is_closed
+    assert smtp_pool_util.__idle_session_dict == {}
+
+
+def test_idle_sessions_are_capped(pool_state):
+    for host_idx in range(smtp_pool_util.SMTP_POOL_MAX_TOTAL_IDLE_COUNT + 2):
+        __send_mail(f"smtp-{host_idx}")
+
+    assert sum([len(idle_session_list) for idle_session_list in smtp_pool_util.__idle_session_dict.values(
+    )]) == smtp_pool_util.SMTP_POOL_MAX_TOTAL_IDLE_COUNT
+    assert [fake_smtp.is_closed for fake_smtp in pool_state["fakeSMTPList"]].count(True) == 2
+
+
+@pytest.mark.parametrize("message_segment_list", [
+    ["Subject: test\n\n.hello\r\nworld"],
+    ["Subject: test\r", "\n\r\n", ".", "hello\r", "\r\n.world\n"],
+    ["a" * 10, "\n." * 10, "\r"]
+])
+def test_data_matches_smtplib(pool_state, monkeypatch, message_segment_list):
+    # small chunks, so line endings and periods fall across chunk boundaries
+    monkeypatch.setattr(smtp_pool_util, "SMTP_DATA_CHUNK_SIZE", 3)
+    __send_mail("smtp-a", message_segment_list=message_segment_list)
+
+    message_bytes = smtplib._quote_periods(
+        smtplib._fix_eols("".join(message_segment_list)).encode("ascii"))
+    if not message_bytes.endswith(b"\r\n"):
+        message_bytes += b"\r\n"
+
+    assert pool_state["fakeSMTPList"][0].data_bytes == message_bytes + b".\r\n"
+
+
+@pytest.mark.parametrize("reply_dict", [
+    {"mail": None},
+    {"rcpt": 451},
+    {"data": 421}
+], ids=["disconnected", "rcpt 4xx", "data 4xx"])
+def test_failure_before_data_is_retried(pool_state, reply_dict):
+    pool_state["replyDictList"] = [reply_dict]
+    __send_mail("smtp-a")
+
+    assert len(pool_state["fakeSMTPList"]) == 2
+    assert pool_state["fakeSMTPList"][0].is_closed
+    assert pool_state["fakeSMTPList"][1].data_bytes != b""
+
+
+@pytest.mark.parametrize("reply_dict, error_cls", [
+    ({"rcpt": 550}, smtplib.SMTPRecipientsRefused),
+    ({"end of data": 451}, smtplib.SMTPDataError),
+    ({"end of data": None}, smtplib.SMTPServerDisconnected)
+], ids=["rcpt 5xx", "after data 4xx", "disconnected after data"])
+def test_permanent_or_late_failure_is_not_retried(pool_state, reply_dict, error_cls):
+    pool_state["replyDictList"] = [reply_dict]
+
+    with pytest.raises(error_cls):
+        __send_mail("smtp-a")
+
+    assert len(pool_state["fakeSMTPList"]) == 1
+    assert pool_state["fakeSMTPList"][0].is_closed
+
+
+def test_retry_is_bounded(pool_state):
+    pool_state["replyDictList"] = [{"mail": None}] * \
+        (smtp_pool_util.SMTP_MAX_RETRY_COUNT + 1)
+
+    with pytest.raises(smtplib.SMTPServerDisconnected):
+        __send_mail("smtp-a")
+
+    assert len(pool_state["fakeSMTPList"]) == smtp_pool_util.SMTP_MAX_RETRY_COUNT + 1
@@ -0,0 +1,68 @@
+import types
+from collections import OrderedDict
+
+import pytest
+
+from lib import twilio_pool_util
+
+
+@pytest.fixture
+def pool_state(monkeypatch):
+    pool_state = {"currentTime": 1000.0}
+
+    monkeypatch.setattr(twilio_pool_util, "__client_entry_dict", OrderedDict())
+    monkeypatch.setattr(twilio_pool_util, "time", types.SimpleNamespace(
+        monotonic=lambda: pool_state["currentTime"]))
+
+    return pool_state
+
+
+def __gen_twilio_config(api_sid):
+    return {"apiSID": api_sid, "apiSecret": "secret", "serviceSID": "VA0"}
+
+
+def test_client_is_reused(pool_state):
+    client = twilio_pool_util.get_client(__gen_twilio_config("AC1"))
+
+    pool_state["currentTime"] += twilio_pool_util.TWILIO_CLIENT_POOL_MAX_IDLE_TIME
+    assert twilio_pool_util.get_client(__gen_twilio_config("AC1")) is client
+    assert twilio_pool_util.get_client(
+        __gen_twilio_config("AC2")) is not client
+
+
+def test_expired_clients_are_closed(pool_state):
+    twilio_pool_util.get_client(__gen_twilio_config("AC1"))
+    pool_state["currentTime"] += 10
+    twilio_pool_util.get_client(__gen_twilio_config("AC2"))
+    twilio_pool_util.set_service_checked(__gen_twilio_config("AC2"), True)
+
+    pool_state["currentTime"] += twilio_pool_util.TWILIO_CLIENT_POOL_MAX_IDLE_TIME - 5
+    twilio_pool_util.close_expired_clients()
+
+    assert [pool_key[0] for pool_key in twilio_pool_util.__client_entry_dict] == [
+        "AC2"]
+
+    pool_state["currentTime"] += 10
+    twilio_pool_util.close_expired_clients()
+
+    assert twilio_pool_util.__client_entry_dict == OrderedDict()
+    assert not twilio_pool_util.is_service_checked(
+        __gen_twilio_config("AC2"))
+
+
+def test_expired_client_is_replaced(pool_state):
+    client = twilio_pool_util.get_client(__gen_twilio_config("AC1"))
+
+    pool_state["currentTime"] += twilio_pool_util.TWILIO_CLIENT_POOL_MAX_IDLE_TIME + 1
+    assert twilio_pool_util.get_client(
+        __gen_twilio_config("AC1")) is not client
+
+
+def test_pool_size_is_capped(pool_state, monkeypatch):
+    monkeypatch.setattr(twilio_pool_util, "TWILIO_CLIENT_POOL_MAX_SIZE", 2)
+
+    for api_sid in ["AC1", "AC2", "AC1", "AC3"]:
+        twilio_pool_util.get_client(__gen_twilio_config(api_sid))
+
+    assert [pool_key[0] for pool_key in twilio_pool_util.__client_entry_dict] == [
+        "AC1", "AC3"]
@@ -0,0 +1,194 @@
+import io
+import os
+import json
+import socket
+import urllib.parse
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from lib import vsock_util
+from lib import mail_sender
+from lib import ses_api_util
+from lib import rest_api_util
+from lib import sendgrid_util
+
+
+class ApiStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    request_list = []
+
+    def log_message(self, *args):
+        pass
+
+    def address_string(self):
+        return "stub"
+
+    def __send_json(self, data):
+        data_bytes = json.dumps(data).encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data_bytes)))
+        self.end_headers()
+        self.wfile.write(data_bytes)
+
+    def do_GET(self):
+        self.request_list.append(("GET", self.path, None))
+        self.__send_json({"job": "job-data"})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(
+            int(self.headers["Content-Length"])))
+        self.request_list.append(
+            ("POST", self.path, self.headers["Connection"], body))
+        self.__send_json({"status": "ok"})
+
+
+class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def __start_server(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+@pytest.fixture
+def vsock_routes(monkeypatch, tmp_path):
+    proxy_conf_path = tmp_path / "proxy.conf"
+    proxy_conf_path.write_text(
+        "127.0.0.1  80  3 9001\n127.0.0.2  587 3 9002\n")
+    hosts_conf_path = tmp_path / "enclave.hosts"
+    hosts_conf_path.write_text("127.0.0.2   email-smtp.example.com\n")
+
+    monkeypatch.setattr(vsock_util, "PROXY_CONF_PATH", str(proxy_conf_path))
+    monkeypatch.setattr(vsock_util, "HOSTS_CONF_PATH", str(hosts_conf_path))
+    monkeypatch.setattr(vsock_util, "VSOCK_STANDIN", f"unix:{tmp_path}")
+    monkeypatch.setattr(vsock_util, "__route_dict", None)
+
+    server_list = []
+    yield tmp_path, server_list
+
+    for server in server_list:
+        server.shutdown()
+        server.server_close()
+
+
+def test_get_route(vsock_routes):
+    assert vsock_util.get_route("127.0.0.1", 80) == (3, 9001)
+    assert vsock_util.get_route("127.0.0.2", 587) == (3, 9002)
+    assert vsock_util.get_route("email-smtp.example.com", 587) == (3, 9002)
+    assert vsock_util.get_route("email-smtp.example.com", 465) is None
+    assert vsock_util.get_route("example.com", 443) is None
+
+
+def test_tcp_standin(monkeypatch):
+    listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listen_socket.bind(("127.0.0.1", 0))
+    listen_socket.listen(1)
+
+    monkeypatch.setattr(vsock_util, "VSOCK_STANDIN", "tcp:127.0.0.1")
+
+    with listen_socket, vsock_util.connect_route((3, listen_socket.getsockname()[1]), 5) as sock:
+        conn, _ = listen_socket.accept()
+        with conn:
+            sock.sendall(b"ping")
+            assert conn.recv(4) == b"ping"
+
+
+def test_host_api_over_vsock(vsock_routes):
+    tmp_path, server_list = vsock_routes
+    ApiStubHandler.request_list = []
+    server_list.append(__start_server(
+        UnixHTTPServer(str(tmp_path / "3_9001.sock"), ApiStubHandler)))
+
+    assert rest_api_util.get_job_api() == {"job": "job-data"}
+
+    # every result is put over a new connection, the body is streamed only once
+    for result_idx in range(2):
+        result = {"resultFile": io.BytesIO(b"result-data"), "idx": result_idx}
+        assert rest_api_util.put_job_result_api(
+            "session", result) == {"status": "ok"}
+
+    assert [request[:3] for request in ApiStubHandler.request_list] == [
+        ("GET", "/api/get-job", None), ("POST", "/api/put-job-result", "close"), ("POST", "/api/put-job-result", "close")]
+    assert [request[3] for request in ApiStubHandler.request_list[1:]] == [
+        {"session": "session", "jobResult": {"resultFile": "result-data", "idx": 0}},
+        {"session": "session", "jobResult": {"resultFile": "result-data", "idx": 1}}]
+
+
+def test_unrouted_host_is_not_connected(vsock_routes):
+    _, server_list = vsock_routes
+    ApiStubHandler.request_list = []
+    server = __start_server(ThreadingHTTPServer(
+        ("127.0.0.1", 0), ApiStubHandler))
+    server_list.append(server)
+
+    # the endpoint can be reached over tcp here, but not from the enclave
+    with requests.Session() as session:
+        session.mount("http://", vsock_util.VsockHTTPAdapter())
+
+        with pytest.raises(RuntimeError, match=f"127.0.0.1:{server.server_address[1]} is not routed"):
+            session.get(
+                f"http://127.0.0.1:{server.server_address[1]}/plain", timeout=5)
+
+    with pytest.raises(RuntimeError, match="email-smtp.example.com:465 is not routed"):
+        vsock_util.VsockSMTP("email-smtp.example.com", 465, timeout=5)
+
+    assert ApiStubHandler.request_list == []
+
+
+def test_endpoints_are_routed(monkeypatch):
+    configs_dir = os.path.join(os.path.dirname(
+        os.path.abspath(__file__)), "..", "configs")
+    monkeypatch.setattr(vsock_util, "PROXY_CONF_PATH",
+                        os.path.join(configs_dir, "proxy.conf"))
+    monkeypatch.setattr(vsock_util, "HOSTS_CONF_PATH",
+                        os.path.join(configs_dir, "enclave.hosts"))
+    monkeypatch.setattr(vsock_util, "__route_dict", None)
+
+    # each address of a host name is routed, and so is each endpoint of the server
+    proxy_port_dict = {local_ip: int(local_port) for local_ip, local_port, _, _ in vsock_util.__read_conf_lines(
+        vsock_util.PROXY_CONF_PATH)}
+    for host_setting in vsock_util.__read_conf_lines(vsock_util.HOSTS_CONF_PATH):
+        for host_name in host_setting[1:]:
+            assert vsock_util.get_route(host_name, proxy_port_dict.get(
+                host_setting[0])) is not None, host_name
+
+    api_server_url = urllib.parse.urlsplit(rest_api_util.API_SERVER_URL)
+    for host, port in [(api_server_url.hostname, api_server_url.port or 80),
+                       (mail_sender.SES_SMTP_HOST, mail_sender.SES_SMTP_PORT),
+                       (ses_api_util.SES_API_HOST, 443),
+                       (urllib.parse.urlsplit(
+                           sendgrid_util.SENDGRID_API_HOST).hostname, 443),
+                       ("kms.us-east-1.amazonaws.com", 443),
+                       ("verify.twilio.com", 443)]:
+        assert vsock_util.require_route(host, port) is not None
+
+
+def test_smtp_over_vsock(vsock_routes):
+    tmp_path, _ = vsock_routes
+    listen_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listen_socket.bind(str(tmp_path / "3_9002.sock"))
+    listen_socket.listen(1)
+
+    def serve_smtp():
+        conn, _ = listen_socket.accept()
+        with conn, conn.makefile("rb") as conn_file:
+            conn.sendall(b"220 stub ready\r\n")
+            if conn_file.readline().lower().startswith(b"quit"):
+                conn.sendall(b"221 bye\r\n")
+
+    server_thread = threading.Thread(target=serve_smtp, daemon=True)
+    server_thread.start()
+
+    with listen_socket:
+        smtp = vsock_util.VsockSMTP("email-smtp.example.com", 587, timeout=5)
+        assert smtp.quit()[0] == 221
+
+        server_thread.join(5)
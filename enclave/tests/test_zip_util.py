@@ -0,0 +1,69 @@
+import io
+import os
+import zipfile
+
+import pytest
+import pyzipper
+
+from lib import zip_util
+
+
+def __gen_entry_list():
+    return [
+        zip_util.compress_entry("document.pdf", b"%PDF-1.7 stream\n" * 4096),
+        zip_util.compress_entry("簽署.spf", b'{"summary": "data"}'),
+        zip_util.compress_entry("empty.txt", b"")
+    ]
+
+
+def test_write_zip():
+    zip_buffer = io.BytesIO()
+    zip_util.write_zip(zip_buffer, __gen_entry_list())
+
+    with zipfile.ZipFile(zip_buffer) as zip_file:
+        assert zip_file.testzip() is None
+        assert zip_file.namelist() == ["document.pdf", "簽署.spf", "empty.txt"]
+        assert zip_file.getinfo(
+            "document.pdf").compress_type == zipfile.ZIP_DEFLATED
+        assert zip_file.read("document.pdf") == b"%PDF-1.7 stream\n" * 4096
+        assert zip_file.read("簽署.spf") == b'{"summary": "data"}'
+        assert zip_file.read("empty.txt") == b""
+
+
+def test_write_encrypted_zip():
+    entry_list = __gen_entry_list()
+    zip_buffer_list = []
+
+    # the entries are compressed once and written into both archives
+    for password in [None, "密碼".encode("utf-8")]:
+        zip_buffer = io.BytesIO()
+        zip_util.write_zip(zip_buffer, entry_list, password)
+        zip_buffer_list.append(zip_buffer)
+
+    with pyzipper.AESZipFile(zip_buffer_list[1]) as zip_file:
+        with pytest.raises(RuntimeError):
+            zip_file.read("document.pdf")
+
+        zip_file.setpassword("密碼".encode("utf-8"))
+        assert zip_file.read("document.pdf") == b"%PDF-1.7 stream\n" * 4096
+        assert zip_file.read("簽署.spf") == b'{"summary": "data"}'
+        assert zip_file.read("empty.txt") == b""
+
+    with zipfile.ZipFile(zip_buffer_list[0]) as zip_file:
+        assert zip_file.read("document.pdf") == b"%PDF-1.7 stream\n" * 4096
+
+
+def test_incompressible_entry_is_stored():
+    random_bytes = os.urandom(zip_util.ZIP_SAMPLE_BLOCK_SIZE * 8)
+    entry = zip_util.compress_entry("scan.pdf", random_bytes)
+
+    assert entry["compressType"] == zip_util.ZIP_STORED
+    assert zip_util.compress_entry(
+        "scan.pdf", random_bytes[:1024])["compressType"] == zip_util.ZIP_DEFLATED
+
+    zip_buffer = io.BytesIO()
+    zip_util.write_zip(zip_buffer, [entry], b"password")
+
+    with pyzipper.AESZipFile(zip_buffer) as zip_file:
+        zip_file.setpassword(b"password")
+        assert zip_file.read("scan.pdf") == random_bytes